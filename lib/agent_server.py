@@ -0,0 +1,183 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Remote agent started on builder hosts by lib.remote_agent.
+
+The script is uploaded over SFTP and runs with the system python3, so it
+must use only the standard library of python 3.6. Requests and responses
+are JSON objects, one per line, on stdin and stdout:
+
+    {"id": 1, "op": "exec", "cmd": "ls", "cwd": null, "stdin": null,
+     "timeout": 3600, "idle_timeout": 600}
+    {"id": 1, "event": "output", "stream": "stdout", "data": "..."}
+    {"id": 1, "event": "exit", "status": 0}
+
+A command killed by its deadline or idle output limit exits with
+{"id": 1, "event": "exit", "status": -1, "expired": ["idle", "..."],
+ "diagnostics": "..."}.
+
+    {"id": 2, "op": "sha256", "path": "file.qcow2"}
+    {"id": 2, "event": "result", "sha256": "...", "size": 1024}
+
+    {"id": 3, "op": "glob", "pattern": "output-*/*.qcow2"}
+    {"id": 3, "event": "result", "paths": ["..."]}
+
+Failed requests are answered with {"id": 3, "event": "error", "error": "..."}.
+"""
+
+import codecs
+import glob
+import hashlib
+import json
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+CHUNK_SIZE = 64 * 1024
+# Seconds between checks of a running command
+POLL_INTERVAL = 1
+# Seconds a killed command has to exit after SIGTERM
+KILL_GRACE = 10
+
+
+def send(message):
+    sys.stdout.write(json.dumps(message) + '\n')
+    sys.stdout.flush()
+
+
+def expired_limit(request, started, last_output):
+    now = time.monotonic()
+    timeout = request.get('timeout')
+    idle_timeout = request.get('idle_timeout')
+    if timeout and now - started > timeout:
+        return ['deadline', 'running longer than {0}s'.format(timeout)]
+    if idle_timeout and now - last_output > idle_timeout:
+        return ['idle', 'no output for {0}s'.format(idle_timeout)]
+    return None
+
+
+def group_diagnostics(pgid):
+    try:
+        output = subprocess.check_output(
+            'ps -eo pgid=,pid=,ppid=,stat=,etime=,args= '
+            '| awk -v pgid={0} \'$1 == pgid\'; uptime; free -m; df -h'.format(pgid),
+            shell=True, stderr=subprocess.STDOUT, timeout=60
+        )
+    except Exception as error:
+        return 'ps failed: {0}'.format(error)
+    return output.decode('utf-8', 'replace')
+
+
+def kill_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(KILL_GRACE)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
+
+
+def write_stdin(proc, data):
+    try:
+        proc.stdin.write(data.encode())
+    finally:
+        proc.stdin.close()
+
+
+def op_exec(request):
+    # The command runs in its own session, so its whole process group is
+    # killed when a limit expires
+    stdin = request.get('stdin')
+    proc = subprocess.Popen(
+        ['bash', '-o', 'pipefail', '-c', request['cmd']],
+        cwd=request.get('cwd'), start_new_session=True,
+        stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if stdin is not None:
+        threading.Thread(target=write_stdin, args=(proc, stdin), daemon=True).start()
+    selector = selectors.DefaultSelector()
+    decoders = {}
+    for name, stream in (('stdout', proc.stdout), ('stderr', proc.stderr)):
+        selector.register(stream, selectors.EVENT_READ, name)
+        decoders[name] = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    started = last_output = time.monotonic()
+    expired = None
+    while selector.get_map():
+        for key, _ in selector.select(POLL_INTERVAL):
+            chunk = os.read(key.fileobj.fileno(), CHUNK_SIZE)
+            if not chunk:
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+                continue
+            last_output = time.monotonic()
+            send({'id': request['id'], 'event': 'output', 'stream': key.data,
+                  'data': decoders[key.data].decode(chunk)})
+        expired = expired_limit(request, started, last_output)
+        if expired:
+            break
+        # Background children of the command may keep its output open
+        if proc.poll() is not None and selector.select(0) == []:
+            break
+    for name, decoder in decoders.items():
+        tail = decoder.decode(b'', final=True)
+        if tail:
+            send({'id': request['id'], 'event': 'output', 'stream': name,
+                  'data': tail})
+    if expired:
+        diagnostics = group_diagnostics(proc.pid)
+        kill_group(proc)
+        send({'id': request['id'], 'event': 'exit', 'status': -1,
+              'expired': expired, 'diagnostics': diagnostics})
+    else:
+        send({'id': request['id'], 'event': 'exit', 'status': proc.wait()})
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    selector.close()
+
+
+def op_sha256(request):
+    path = os.path.expanduser(request['path'])
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            checksum.update(chunk)
+    send({'id': request['id'], 'event': 'result',
+          'sha256': checksum.hexdigest(), 'size': os.stat(path).st_size})
+
+
+def op_glob(request):
+    paths = sorted(glob.glob(os.path.expanduser(request['pattern'])))
+    send({'id': request['id'], 'event': 'result', 'paths': paths})
+
+
+OPERATIONS = {'exec': op_exec, 'sha256': op_sha256, 'glob': op_glob}
+
+
+def main():
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        if request.get('op') == 'quit':
+            break
+        try:
+            OPERATIONS[request['op']](request)
+        except Exception as error:
+            send({'id': request.get('id'), 'event': 'error',
+                  'error': '{0}: {1}'.format(type(error).__name__, error)})
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
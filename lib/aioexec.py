@@ -0,0 +1,193 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Asyncio engine for concurrent local commands.
+"""
+
+import asyncio
+import codecs
+import collections
+import logging
+import os
+import shlex
+import signal
+
+from lib.tracing import describe_command, span
+from lib.utils import CHUNK_SIZE, command_logger
+
+
+__all__ = ['Command', 'CommandFailed', 'CommandTimeout', 'run_command',
+           'run_group', 'run_parallel']
+
+
+Command = collections.namedtuple(
+    'command', ['cmd', 'cwd_path', 'shell', 'timeout'],
+    defaults=[True, None]
+)
+
+
+class CommandFailed(Exception):
+    """
+    Local command finished with non-zero exit code.
+    """
+
+    def __init__(self, cmd: str, returncode, output: str = ''):
+        super().__init__('Command {0} execution failed {1}'.format(cmd, returncode))
+        self.cmd = cmd
+        self.returncode = returncode
+        self.output = output
+
+
+class CommandTimeout(CommandFailed):
+    """
+    Local command was killed after its timeout.
+    """
+
+
+def _kill(proc):
+    # Commands run in their own session, so the whole group is signalled
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _stream(proc, cmd_span, prefix: str) -> str:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    output = []
+    tail = ''
+    while True:
+        chunk = await proc.stdout.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        cmd_span.add_bytes(len(chunk))
+        text = decoder.decode(chunk)
+        output.append(text)
+        text, newline, tail = (tail + text).rpartition('\n')
+        if newline:
+            command_logger.info('%s%s', prefix, text)
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        command_logger.info('%s%s', prefix, tail)
+    return ''.join(output)
+
+
+async def run_command(command: Command, prefix: str = '') -> str:
+    """
+    Executes a local command without blocking the event loop.
+
+    Parameters
+    ----------
+    command : Command
+        Command to execute.
+    prefix : str
+        Prefix for output lines to tell concurrent commands apart.
+
+    Returns
+    -------
+    str
+        Command output.
+
+    Raises
+    ------
+    CommandFailed
+        If a command exits with non-zero code.
+    CommandTimeout
+        If a command runs longer than its timeout.
+    """
+    logging.info('Executing %s', command.cmd)
+    with span(describe_command(command.cmd), 'local') as cmd_span:
+        if command.shell:
+            proc = await asyncio.create_subprocess_shell(
+                command.cmd, cwd=command.cwd_path, stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT, start_new_session=True
+            )
+        else:
+            proc = await asyncio.create_subprocess_exec(
+                *shlex.split(command.cmd), cwd=command.cwd_path,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.STDOUT, start_new_session=True
+            )
+        async def communicate():
+            # Children may close the output before the command exits
+            output = await _stream(proc, cmd_span, prefix)
+            await proc.wait()
+            return output
+
+        try:
+            output = await asyncio.wait_for(communicate(), command.timeout)
+        except asyncio.TimeoutError:
+            _kill(proc)
+            await proc.wait()
+            cmd_span.set_status('timeout')
+            raise CommandTimeout(command.cmd, f'timeout after {command.timeout}s')
+        except asyncio.CancelledError:
+            _kill(proc)
+            await proc.wait()
+            cmd_span.set_status('cancelled')
+            raise
+        cmd_span.set_status(proc.returncode)
+    if proc.returncode != 0:
+        raise CommandFailed(command.cmd, proc.returncode, output)
+    return output
+
+
+async def run_group(commands: list, fail_fast: bool = True, limit: int = None) -> list:
+    """
+    Executes commands concurrently.
+
+    Parameters
+    ----------
+    commands : list
+        Commands to execute.
+    fail_fast : bool
+        Cancel the remaining commands as soon as one of them fails.
+    limit : int
+        Maximum number of commands running at the same time.
+
+    Returns
+    -------
+    list
+        Outputs in the order of commands.
+
+    Raises
+    ------
+    CommandFailed
+        The first failure; with fail_fast=False it is raised after all
+        commands finished.
+    """
+    semaphore = asyncio.Semaphore(limit or len(commands) or 1)
+
+    async def limited(index: int, command: Command):
+        async with semaphore:
+            return await run_command(command, prefix=f'[{index}] ')
+
+    tasks = [asyncio.ensure_future(limited(index, command))
+             for index, command in enumerate(commands)]
+    if not tasks:
+        return []
+    done, pending = await asyncio.wait(
+        tasks,
+        return_when=asyncio.FIRST_EXCEPTION if fail_fast else asyncio.ALL_COMPLETED
+    )
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.wait(pending)
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception():
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+def run_parallel(commands: list, fail_fast: bool = True, limit: int = None) -> list:
+    """
+    Executes commands concurrently from synchronous stage code.
+
+    Examples
+    --------
+    >>> run_parallel([Command(f'{fetch} && {check} && {link}', work_dir)
+    ...               for fetch, check, link in image_steps], limit=4)
+    """
+    return asyncio.run(run_group(commands, fail_fast=fail_fast, limit=limit))
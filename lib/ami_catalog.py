@@ -0,0 +1,268 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Catalog of published AMIs and the wiki files generated from it.
+
+Every mirrored release is stored as a JSON record in S3 bucket, so
+releases of both architectures never overwrite each other. The SQLite
+database is a local index of these records: syncing loads only new or
+changed records and adding a release touches only its own rows.
+"""
+
+import csv
+import io
+import json
+import logging
+import sqlite3
+
+from lib.ami_mirror import AmiCopy
+from lib.manifest import rpmvercmp
+
+
+__all__ = ['AmiCatalog', 'render_csv', 'render_md', 'write_catalog',
+           'upload_release', 'diff_rows']
+
+
+DISTRIBUTION = 'AlmaLinux OS'
+MD_HEADER = ['| Distribution | Version | Region | AMI ID | Arch |',
+             '| --- | --- | --- | --- | --- |']
+LAUNCH_URL = 'https://console.aws.amazon.com/ec2/home?region={0}#launchAmi={1}'
+# Rows of every region are listed in this architecture order
+ARCH_ORDER = {'x86_64': 0, 'arm64': 1}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS amis (
+    major TEXT NOT NULL,
+    version TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    region TEXT NOT NULL,
+    image_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (version, arch, region)
+);
+CREATE INDEX IF NOT EXISTS amis_region ON amis (region, arch);
+CREATE TABLE IF NOT EXISTS releases (
+    major TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    version TEXT NOT NULL,
+    PRIMARY KEY (major, arch, version)
+);
+CREATE TABLE IF NOT EXISTS records (
+    key TEXT PRIMARY KEY,
+    etag TEXT
+);
+"""
+
+
+def _sort_key(ami: AmiCopy) -> tuple:
+    major = ami.version.split('.')[0]
+    return (-int(major) if major.isdigit() else 0, ami.region,
+            ARCH_ORDER.get(ami.arch, len(ARCH_ORDER)), ami.arch)
+
+
+def render_csv(amis: list) -> str:
+    """
+    Renders AMIs as CSV rows of the wiki data file.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, quoting=csv.QUOTE_ALL, lineterminator='\n')
+    for ami in sorted(amis, key=_sort_key):
+        writer.writerow([DISTRIBUTION, ami.version, ami.region, ami.image_id,
+                         ami.arch])
+    return output.getvalue()
+
+
+def render_md(amis: list) -> str:
+    """
+    Renders AMIs as Markdown table of the wiki page.
+    """
+    lines = list(MD_HEADER)
+    for ami in sorted(amis, key=_sort_key):
+        launch_url = LAUNCH_URL.format(ami.region, ami.image_id)
+        lines.append(f'| {DISTRIBUTION} | {ami.version} | {ami.region} | '
+                     f'[{ami.image_id}]({launch_url}) | {ami.arch} |')
+    return '\n'.join(lines) + '\n'
+
+
+def write_catalog(amis: list, csv_path: str, md_path: str):
+    """
+    Writes the CSV and Markdown catalog of AMIs.
+    """
+    with open(csv_path, 'w') as csv_file:
+        csv_file.write(render_csv(amis))
+    with open(md_path, 'w') as md_file:
+        md_file.write(render_md(amis))
+
+
+def diff_rows(old: str, new: str) -> tuple:
+    """
+    Compares rows of two generated files.
+
+    Returns
+    -------
+    tuple
+        Sorted lists of added and removed rows.
+    """
+    old_rows, new_rows = set(old.splitlines()), set(new.splitlines())
+    return sorted(new_rows - old_rows), sorted(old_rows - new_rows)
+
+
+def _release_key(prefix: str, version: str, arch: str) -> str:
+    return f'{prefix}/{version}-{arch}.json'
+
+
+def upload_release(s3_client, bucket: str, prefix: str, amis: list) -> str:
+    """
+    Stores AMIs of a mirrored release in S3 bucket.
+
+    Returns
+    -------
+    str
+        Key of the release record.
+    """
+    key = _release_key(prefix, amis[0].version, amis[0].arch)
+    body = json.dumps([ami._asdict() for ami in amis], indent=2)
+    s3_client.put_object(Bucket=bucket, Key=key, Body=body.encode())
+    logging.info('AMI catalog record saved to s3://%s/%s', bucket, key)
+    return key
+
+
+class AmiCatalog:
+
+    """
+    SQLite index of published AMIs of all releases.
+
+    The wiki lists only the latest release of every major version and
+    architecture.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(records)')]
+        if 'etag' not in columns:
+            # Catalogs made before records were versioned
+            with self.conn:
+                self.conn.execute('ALTER TABLE records ADD COLUMN etag TEXT')
+
+    def close(self):
+        self.conn.close()
+
+    def add_release(self, amis: list):
+        """
+        Adds or replaces AMIs of a release.
+        """
+        version, arch = amis[0].version, amis[0].arch
+        major = version.split('.')[0]
+        with self.conn:
+            self.conn.execute(
+                'INSERT OR IGNORE INTO releases (major, arch, version) '
+                'VALUES (?, ?, ?)', (major, arch, version)
+            )
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO amis (major, version, arch, region, '
+                'image_id, name) VALUES (?, ?, ?, ?, ?, ?)',
+                [(major, ami.version, ami.arch, ami.region, ami.image_id, ami.name)
+                 for ami in amis]
+            )
+
+    def latest_releases(self) -> list:
+        """
+        Gets the latest version of every major version and architecture.
+
+        Returns
+        -------
+        list
+            Tuples of major version, architecture and version.
+        """
+        latest = {}
+        for major, arch, version in self.conn.execute(
+                'SELECT major, arch, version FROM releases'):
+            current = latest.get((major, arch))
+            if current is None or rpmvercmp(version, current) > 0:
+                latest[(major, arch)] = version
+        return sorted((major, arch, version)
+                      for (major, arch), version in latest.items())
+
+    def current(self) -> list:
+        """
+        Gets AMIs of the latest releases, the ones listed in the wiki.
+        """
+        amis = []
+        for _, arch, version in self.latest_releases():
+            amis.extend(self.lookup(version=version, arch=arch))
+        return amis
+
+    def _select(self, where: str = '', params: tuple = ()) -> list:
+        rows = self.conn.execute(
+            f'SELECT region, image_id, name, version, arch FROM amis {where}',
+            params
+        )
+        return [AmiCopy(*row) for row in rows]
+
+    def lookup(self, version: str = None, arch: str = None,
+               region: str = None) -> list:
+        """
+        Finds AMIs by any of version, architecture and region.
+        """
+        conditions, params = [], []
+        for column, value in (('version', version), ('arch', arch),
+                              ('region', region)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        return self._select(where, tuple(params))
+
+    def import_csv(self, content: str) -> int:
+        """
+        Loads releases from an existing wiki CSV file.
+
+        Returns
+        -------
+        int
+            Number of imported AMIs.
+        """
+        releases = {}
+        for row in csv.reader(io.StringIO(content)):
+            if len(row) != 5 or row[0] != DISTRIBUTION:
+                continue
+            _, version, region, image_id, arch = row
+            name = f'{DISTRIBUTION} {version} {arch}'
+            releases.setdefault((version, arch), []).append(
+                AmiCopy(region, image_id, name, version, arch)
+            )
+        for amis in releases.values():
+            self.add_release(amis)
+        return sum(len(amis) for amis in releases.values())
+
+    def sync_from_s3(self, s3_client, bucket: str, prefix: str) -> int:
+        """
+        Loads release records from S3 bucket which are not in the catalog
+        yet or were overwritten since they were loaded.
+
+        Returns
+        -------
+        int
+            Number of loaded records.
+        """
+        known = dict(self.conn.execute('SELECT key, etag FROM records'))
+        added = 0
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f'{prefix}/'):
+            for item in page.get('Contents', []):
+                if known.get(item['Key'], '') == item['ETag']:
+                    continue
+                body = s3_client.get_object(Bucket=bucket, Key=item['Key'])['Body']
+                amis = [AmiCopy(**ami) for ami in json.loads(body.read().decode())]
+                if amis:
+                    self.add_release(amis)
+                with self.conn:
+                    self.conn.execute(
+                        'INSERT OR REPLACE INTO records (key, etag) VALUES (?, ?)',
+                        (item['Key'], item['ETag'])
+                    )
+                added += 1
+        logging.info('%d AMI catalog records synchronized', added)
+        return added
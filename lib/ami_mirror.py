@@ -0,0 +1,219 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Mirroring of AMIs to all AWS regions.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import time
+
+from lib.aws import DEFAULT_REGION, get_client
+from lib.metrics import registry
+from lib.tracing import span
+
+
+__all__ = ['AmiCopy', 'AmiMirrorError', 'AmiMirror']
+
+
+AmiCopy = collections.namedtuple(
+    'ami_copy', ['region', 'image_id', 'name', 'version', 'arch']
+)
+
+FAILED_STATES = ('invalid', 'deregistered', 'failed', 'error')
+
+
+class AmiMirrorError(Exception):
+    """
+    AMI mirroring Exception.
+    """
+    pass
+
+
+class AmiMirror:
+
+    """
+    Copies an AMI to every enabled region of the account concurrently.
+
+    Copies are polled with one batched DescribeImages call per region, so
+    several images mirrored to the same region cost a single request.
+    """
+
+    def __init__(self, source_region: str = DEFAULT_REGION,
+                 poll_interval: float = 30, timeout: float = 3 * 3600,
+                 workers: int = 16, client_factory=get_client):
+        """
+        Parameters
+        ----------
+        source_region : str
+            Region of the source AMI.
+        poll_interval : float
+            Seconds between DescribeImages calls of a region poller.
+        timeout : float
+            Seconds to wait for all copies to become available.
+        workers : int
+            Maximum number of concurrent region requests.
+        client_factory : callable
+            Returns EC2 client of a region by service and region name.
+        """
+        self.source_region = source_region
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.workers = workers
+        self.client_factory = client_factory
+
+    def _ec2(self, region: str):
+        return self.client_factory('ec2', region)
+
+    def _map_regions(self, function, items: list) -> list:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='ami') as executor:
+            return list(executor.map(function, items))
+
+    def target_regions(self) -> list:
+        """
+        Gets regions enabled for the account, the source one included.
+        """
+        response = self._ec2(self.source_region).describe_regions()
+        return sorted(region['RegionName'] for region in response['Regions'])
+
+    def source_image(self, image_id: str) -> AmiCopy:
+        """
+        Describes the source AMI.
+
+        Returns
+        -------
+        AmiCopy
+            Source AMI, its version is parsed from the name,
+            e.g. AlmaLinux OS 9.4.20240805 x86_64.
+        """
+        response = self._ec2(self.source_region).describe_images(ImageIds=[image_id])
+        if not response['Images']:
+            raise AmiMirrorError(f'AMI {image_id} is not found')
+        image = response['Images'][0]
+        parts = image['Name'].split()
+        version = parts[2] if len(parts) > 2 else image['Name']
+        return AmiCopy(self.source_region, image_id, image['Name'], version,
+                       image['Architecture'])
+
+    def copy(self, source: AmiCopy, regions: list) -> list:
+        """
+        Issues CopyImage to all regions concurrently. Regions which already
+        have an image of the same name reuse it, so a restarted mirror only
+        copies the missing ones.
+
+        Returns
+        -------
+        list
+            Copies sorted by region, including the source AMI.
+        """
+        description = self._ec2(self.source_region).describe_images(
+            ImageIds=[source.image_id]
+        )['Images'][0].get('Description', source.name)
+
+        def copy_to(region):
+            if region == source.region:
+                return source
+            ec2 = self._ec2(region)
+            existing = ec2.describe_images(
+                Owners=['self'],
+                Filters=[{'Name': 'name', 'Values': [source.name]}]
+            )['Images']
+            existing = [image for image in existing
+                        if image['State'] not in FAILED_STATES]
+            if existing:
+                image_id = existing[0]['ImageId']
+                logging.info('%s already has %s as %s', region, source.name, image_id)
+            else:
+                with span(f'ami copy {region}', 'step'):
+                    image_id = ec2.copy_image(
+                        Name=source.name, Description=description,
+                        SourceImageId=source.image_id,
+                        SourceRegion=source.region,
+                    )['ImageId']
+                logging.info('Copying %s to %s as %s', source.image_id, region,
+                             image_id)
+            return source._replace(region=region, image_id=image_id)
+
+        return self._map_regions(copy_to, sorted(regions))
+
+    def wait_available(self, copies: list):
+        """
+        Waits until all copies are available, polling every region in its
+        own thread.
+
+        Raises
+        ------
+        AmiMirrorError
+            If a copy failed or didn't become available in time.
+        """
+        by_region = collections.defaultdict(list)
+        for ami in copies:
+            by_region[ami.region].append(ami.image_id)
+        started = time.monotonic()
+
+        def poll(region):
+            ec2 = self._ec2(region)
+            pending = set(by_region[region])
+            with span(f'ami wait {region}', 'step', images=len(pending)):
+                while pending:
+                    images = ec2.describe_images(ImageIds=sorted(pending))['Images']
+                    for image in images:
+                        state = image['State']
+                        if state == 'available':
+                            pending.discard(image['ImageId'])
+                            elapsed = time.monotonic() - started
+                            registry.set('alcib_ami_copy_seconds', elapsed,
+                                         region=region)
+                            logging.info('%s in %s is available after %.0fs',
+                                         image['ImageId'], region, elapsed)
+                        elif state in FAILED_STATES:
+                            raise AmiMirrorError(
+                                f'{image["ImageId"]} in {region} is {state}: '
+                                f'{image.get("StateReason", {}).get("Message", "")}'
+                            )
+                    if not pending:
+                        break
+                    if time.monotonic() - started > self.timeout:
+                        raise AmiMirrorError(
+                            f'Timed out waiting for {", ".join(sorted(pending))} '
+                            f'in {region}'
+                        )
+                    time.sleep(self.poll_interval)
+
+        self._map_regions(poll, sorted(by_region))
+
+    def make_public(self, copies: list):
+        """
+        Grants launch permission to everyone on all copies in parallel.
+        """
+        def publish(ami):
+            self._ec2(ami.region).modify_image_attribute(
+                ImageId=ami.image_id,
+                LaunchPermission={'Add': [{'Group': 'all'}]},
+            )
+            logging.info('%s in %s is public', ami.image_id, ami.region)
+
+        self._map_regions(publish, copies)
+
+    def mirror(self, image_id: str, regions: list = None) -> list:
+        """
+        Copies an AMI to all regions, waits for the copies and makes them
+        public.
+
+        Returns
+        -------
+        list
+            Public copies sorted by region.
+        """
+        source = self.source_image(image_id)
+        regions = regions or self.target_regions()
+        logging.info('Mirroring %s (%s) to %d regions', image_id, source.name,
+                     len(regions))
+        copies = self.copy(source, regions)
+        self.wait_available(copies)
+        self.make_public(copies)
+        return copies
+
@@ -0,0 +1,78 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Lazily created AWS clients shared by the whole process.
+"""
+
+import os
+import threading
+
+
+__all__ = ['get_session', 'get_client', 'get_resource']
+
+
+DEFAULT_REGION = 'us-east-1'
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+
+
+def get_session():
+    """
+    Gets boto3 session, boto3 is imported on the first call.
+
+    Returns
+    -------
+    boto3.session.Session
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            import boto3
+            _session = boto3.session.Session(
+                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                region_name=DEFAULT_REGION
+            )
+        return _session
+
+
+def _get(kind: str, service: str, region: str):
+    key = (kind, service, region)
+    session = get_session()
+    # Sessions are not thread safe, clients created from them are
+    with _lock:
+        if key not in _clients:
+            from botocore.config import Config
+            factory = session.client if kind == 'client' else session.resource
+            # botocore retries throttling and transient errors itself with
+            # backoff, the legacy mode default of 5 attempts is too few for
+            # bursts of parallel requests. It's the only retry layer of AWS
+            # calls, retry_call must not wrap them or attempts multiply.
+            config = Config(retries={'max_attempts': 10, 'mode': 'standard'})
+            _clients[key] = factory(service_name=service, region_name=region,
+                                    config=config)
+        return _clients[key]
+
+
+def get_client(service: str, region: str = DEFAULT_REGION):
+    """
+    Gets cached boto3 client of a service.
+
+    Parameters
+    ----------
+    service : str
+        AWS service name, e.g. s3 or ec2.
+    region : str
+        AWS region name.
+    """
+    return _get('client', service, region)
+
+
+def get_resource(service: str, region: str = DEFAULT_REGION):
+    """
+    Gets cached boto3 resource of a service.
+    """
+    return _get('resource', service, region)
@@ -0,0 +1,112 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Batches of shell steps executed in a single round-trip.
+"""
+
+import base64
+import collections
+import logging
+import shlex
+
+from lib.tracing import describe_command, tracer
+
+
+__all__ = ['StepResult', 'build_batch_script', 'parse_batch_output',
+           'check_batch_results']
+
+
+MARKER = '__ALCIB_STEP__'
+
+StepResult = collections.namedtuple(
+    'step_result', ['cmd', 'exit_status', 'start', 'duration', 'output']
+)
+
+# Every step runs in its own shell, exactly like a separate safe_execute
+# call, and the batch stops at the first failed step.
+SCRIPT_HEADER = f"""
+tmp=$(mktemp)
+trap 'rm -f "$tmp"' EXIT
+run_step() {{
+  start=$(date +%s.%N)
+  bash -o pipefail -c "$2" > "$tmp" 2>&1 < /dev/null
+  rc=$?
+  end=$(date +%s.%N)
+  echo "{MARKER} $1 $rc $start $end $(base64 -w0 < "$tmp")"
+  return $rc
+}}
+"""
+
+
+def build_batch_script(steps: list) -> str:
+    """
+    Makes a bash script which executes steps one by one.
+
+    Parameters
+    ----------
+    steps : list
+        Shell commands.
+
+    Returns
+    -------
+    str
+        Script to feed to ``bash -s``.
+    """
+    lines = [SCRIPT_HEADER]
+    for index, step in enumerate(steps):
+        lines.append(f'run_step {index} {shlex.quote(step)} || exit $?')
+    return '\n'.join(lines) + '\n'
+
+
+def parse_batch_output(output: str, steps: list) -> list:
+    """
+    Parses the structured envelope printed by the batch script.
+
+    Returns
+    -------
+    list
+        StepResult of every executed step.
+    """
+    results = []
+    for line in output.splitlines():
+        if not line.startswith(MARKER):
+            continue
+        fields = line.split(' ', 5)
+        index, exit_status = int(fields[1]), int(fields[2])
+        start, end = float(fields[3]), float(fields[4])
+        encoded = fields[5] if len(fields) > 5 else ''
+        results.append(StepResult(
+            steps[index], exit_status, start, end - start,
+            base64.b64decode(encoded).decode(errors='replace')
+        ))
+    return results
+
+
+def check_batch_results(results: list, steps: list, error_class):
+    """
+    Records step spans, logs step outputs and raises on a failed step.
+
+    Parameters
+    ----------
+    results : list
+        StepResult of executed steps.
+    steps : list
+        All steps of the batch.
+    error_class : type
+        Exception raised for a failed step.
+    """
+    for result in results:
+        tracer.add_span(describe_command(result.cmd), 'step', result.start,
+                        result.start + result.duration,
+                        exit_status=result.exit_status,
+                        bytes=len(result.output))
+        logging.info('Step %s finished with %d in %.1fs', result.cmd,
+                     result.exit_status, result.duration)
+        if result.exit_status != 0:
+            logging.info('Command output:\n%s', result.output)
+            raise error_class(f'Command \'{result.cmd}\' execution failed.')
+    if len(results) != len(steps):
+        raise error_class(
+            f'Batch stopped after {len(results)} of {len(steps)} steps.'
+        )
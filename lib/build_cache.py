@@ -0,0 +1,167 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Content-addressed cache of built images in S3 bucket.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+
+from lib.retry import http_request
+from lib.tracing import span
+
+
+__all__ = ['REPO_URL', 'REPOSITORIES', 'build_fingerprint', 'repomd_digests',
+           'BuildCache']
+
+
+REPO_URL = 'https://repo.almalinux.org/almalinux/{0}/{1}/{2}/os/'
+REPOMD_URL = REPO_URL + 'repodata/repomd.xml'
+REPOSITORIES = ['BaseOS', 'AppStream']
+# Delta uploads store chunk indexes next to the images
+ARTIFACT_SUFFIXES = ('.qcow2', '.box', '.qcow2.index.json')
+
+
+def repomd_digests(os_major_ver: str, arch: str) -> dict:
+    """
+    Gets checksums of upstream repositories metadata the image is built from.
+
+    Returns
+    -------
+    dict
+        sha256 of repomd.xml by repository name.
+    """
+    digests = {}
+    for repo in REPOSITORIES:
+        response = http_request('GET', REPOMD_URL.format(os_major_ver, repo, arch),
+                                operation='repomd', timeout=60)
+        response.raise_for_status()
+        digests[repo] = hashlib.sha256(response.content).hexdigest()
+    return digests
+
+
+def build_fingerprint(inputs: dict) -> str:
+    """
+    Makes a fingerprint of all build inputs.
+
+    Parameters
+    ----------
+    inputs : dict
+        JSON serializable build inputs.
+
+    Returns
+    -------
+    str
+        sha256 hex digest.
+    """
+    payload = json.dumps(inputs, sort_keys=True).encode()
+    return hashlib.sha256(payload).hexdigest()
+
+
+class BuildCache:
+
+    """
+    Index of successful builds by fingerprint of their inputs.
+
+    Every entry is a JSON object {prefix}/{fingerprint}.json which points
+    to the artifacts of the build in the same bucket.
+    """
+
+    def __init__(self, s3, bucket: str, prefix: str):
+        """
+        Parameters
+        ----------
+        s3 : botocore.client.S3
+            S3 client.
+        bucket : str
+            Bucket with artifacts and the index.
+        prefix : str
+            Key prefix of the index.
+        """
+        self.s3 = s3
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, fingerprint: str) -> str:
+        return f'{self.prefix}/{fingerprint}.json'
+
+    def lookup(self, fingerprint: str):
+        """
+        Finds a build with the same fingerprint whose artifacts still exist.
+
+        Returns
+        -------
+        dict or None
+            Index entry, None on a miss.
+        """
+        try:
+            response = self.s3.get_object(Bucket=self.bucket, Key=self._key(fingerprint))
+        except self.s3.exceptions.NoSuchKey:
+            return None
+        entry = json.loads(response['Body'].read().decode())
+        for key in entry['artifacts']:
+            try:
+                self.s3.head_object(Bucket=self.bucket, Key=key)
+            except Exception as error:
+                logging.info('Cached artifact %s is gone: %s', key, error)
+                return None
+        return entry
+
+    def promote(self, entry: dict, bucket_path: str) -> list:
+        """
+        Copies artifacts of a cached build to the prefix of the current one.
+
+        Returns
+        -------
+        list
+            Keys of the promoted artifacts.
+        """
+        keys = []
+        for key in entry['artifacts']:
+            new_key = f'{bucket_path}/{os.path.basename(key)}'
+            with span(f's3 copy {os.path.basename(key)}', 's3'):
+                self.s3.copy({'Bucket': self.bucket, 'Key': key},
+                             self.bucket, new_key)
+            logging.info('Promoted s3://%s/%s to %s', self.bucket, key, new_key)
+            keys.append(new_key)
+        return keys
+
+    def record(self, fingerprint: str, inputs: dict, bucket_path: str,
+               paths: dict = None):
+        """
+        Adds artifacts of a successful build to the index.
+
+        Parameters
+        ----------
+        paths : dict
+            Paths of the images on the builder host by file name, a cache
+            hit puts the images back there.
+
+        Returns
+        -------
+        dict or None
+            Index entry, None if the build has no artifacts.
+        """
+        response = self.s3.list_objects_v2(Bucket=self.bucket,
+                                           Prefix=f'{bucket_path}/')
+        artifacts = [item['Key'] for item in response.get('Contents', [])
+                     if item['Key'].endswith(ARTIFACT_SUFFIXES)]
+        if not artifacts:
+            logging.info('No artifacts found in %s, build is not cached', bucket_path)
+            return None
+        entry = {
+            'fingerprint': fingerprint,
+            'inputs': inputs,
+            'bucket_path': bucket_path,
+            'artifacts': artifacts,
+            'paths': paths or {},
+            'created': int(time.time()),
+        }
+        self.s3.put_object(Bucket=self.bucket, Key=self._key(fingerprint),
+                           Body=json.dumps(entry, indent=2).encode())
+        logging.info('Build %s cached as %s', bucket_path, fingerprint)
+        return entry
@@ -9,16 +9,31 @@ Builder on AWS Instance.
 import os
 import io
 import base64
+import shutil
 import pathlib
+import socket
 import logging
+import threading
+import subprocess
+import uuid
 
-import boto3
 import paramiko
 
+from lib.aws import get_resource
+from lib.batch import build_batch_script, check_batch_results, parse_batch_output
 from lib.config import settings
+from lib.remote_agent import AgentError, RemoteAgent
+from lib.retry import POLICIES, retry_call
+from lib.tracing import describe_command, span
+from lib.transfer import WINDOW_SIZE, upload
+from lib.utils import CHUNK_SIZE
+from lib.watchdog import (POLL_INTERVAL, CommandTimeout, Watchdog,
+                          kill_process_group, process_group_diagnostics,
+                          wait_process)
 
 
-__all__ = ['ExecuteError', 'ParamikoWrapper', 'Builder', 'AgentBuilder']
+__all__ = ['ExecuteError', 'ExecuteTimeout', 'ParamikoWrapper', 'Builder', 'LocalChannel',
+           'LocalFile', 'LocalSFTP', 'AgentBuilder']
 
 
 class ExecuteError(Exception):
@@ -28,36 +43,327 @@ class ExecuteError(Exception):
     pass
 
 
+class ExecuteTimeout(CommandTimeout, ExecuteError):
+    """
+    Remote command was killed by its watchdog or lost its connection.
+    """
+
+
+# The remote shell leads the process group of a command, kill and
+# diagnostics commands find the group by the file it writes
+PGID_PREFIX = "echo $$ > {0}; trap 'rm -f {0}' EXIT; "
+GROUP_DIAGNOSTICS = (
+    'pgid=$(cat {0}); ps -eo pgid=,pid=,ppid=,stat=,etime=,args= '
+    '| awk -v pgid="$pgid" \'$1 == pgid\'; uptime; free -m; df -h'
+)
+KILL_GROUP = (
+    'pgid=$(cat {0}) || exit 0; signal() {{ sudo -n kill -$1 -- -$pgid 2>/dev/null '
+    '|| kill -$1 -- -$pgid 2>/dev/null; }}; signal TERM; '
+    'for i in $(seq 10); do signal 0 || break; sleep 1; done; signal KILL; rm -f {0}'
+)
+
+
 class ParamikoWrapper(paramiko.SSHClient):
 
     """
     Paramiko Wrapper for SSH Client.
     """
 
-    def safe_execute(self, cmd, *args, **kwargs):
+    # Commands run in a POSIX shell, Windows hosts run PowerShell
+    posix = True
+
+    @property
+    def agent_enabled(self) -> bool:
+        """
+        Commands run through the remote agent, it needs python3 on a POSIX
+        host.
+        """
+        return settings.remote_agent and self.posix
+
+    def connect(self, *args, **kwargs):
+        super().connect(*args, **kwargs)
+        self.enable_keepalive()
+
+    def enable_keepalive(self):
+        """
+        Enables dead peer detection. Keepalive messages keep traffic on an
+        idle session, so a peer which doesn't acknowledge it breaks the
+        connection in keepalive interval times count seconds instead of
+        hanging forever.
+        """
+        interval = settings.ssh_keepalive_interval
+        transport = self.get_transport()
+        if not interval or transport is None:
+            return
+        transport.set_keepalive(interval)
+        sock = transport.sock
+        if not isinstance(sock, socket.socket):
+            return
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_USER_TIMEOUT'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT,
+                            interval * settings.ssh_keepalive_count * 1000)
+
+    @staticmethod
+    def _collect(channel, watchdog: Watchdog, output: bytearray,
+                 errors: bytearray) -> tuple:
+        """
+        Reads output of a command until it exits, so it never blocks on
+        a full SSH window.
+
+        Returns
+        -------
+        tuple
+            Reason and message of the expired watchdog limit, None if the
+            command exited.
+        """
+        def read_errors():
+            while channel.recv_stderr_ready():
+                data = channel.recv_stderr(CHUNK_SIZE)
+                errors.extend(data)
+                watchdog.feed(data)
+
+        def read_buffered():
+            while channel.recv_ready():
+                data = channel.recv(CHUNK_SIZE)
+                if not data:
+                    break
+                output.extend(data)
+                watchdog.feed(data)
+
+        channel.settimeout(POLL_INTERVAL)
+        eof = False
+        while True:
+            read_errors()
+            if not eof:
+                try:
+                    data = channel.recv(CHUNK_SIZE)
+                    output.extend(data)
+                    watchdog.feed(data)
+                    eof = not data
+                except socket.timeout:
+                    pass
+            # Background children of the command may keep stdout open
+            # after it exits, so there may be no EOF
+            if channel.status_event.is_set() or \
+                    (eof and channel.status_event.wait(POLL_INTERVAL)):
+                read_buffered()
+                read_errors()
+                return None
+            expired = watchdog.expired()
+            if expired:
+                return expired
+
+    def _run_quietly(self, cmd: str) -> str:
+        # Kill and diagnostics commands must not fail the timeout handling
+        try:
+            channel = self.get_transport().open_session(timeout=60)
+            channel.settimeout(60)
+            channel.exec_command(cmd)
+            with channel.makefile('rb') as stdout:
+                return stdout.read().decode(errors='replace')
+        except Exception as error:
+            return f'{cmd} failed: {error}'
+
+    def _execute(self, cmd: str, cmd_span, stdin_data: str = None,
+                 timeout: float = None, idle_timeout: float = None,
+                 **kwargs) -> tuple:
+        """
+        Runs a remote command watched by a Watchdog: when its deadline or
+        idle output limit expires, the processes of the command are listed
+        for diagnostics and its process group is killed. With the remote
+        agent enabled the command runs through the agent.
+
+        Returns
+        -------
+        tuple
+            Exit status, stdout and stderr of the command.
+
+        Raises
+        ------
+        ExecuteTimeout
+            If a limit expires or the connection is lost.
+        """
+        watchdog = Watchdog(timeout, idle_timeout)
+        if self.agent_enabled:
+            return self._agent_execute(cmd, cmd_span, watchdog, stdin_data)
+        pgid_file = f'/tmp/alcib-{uuid.uuid4().hex}.pgid'
+        prefix = PGID_PREFIX.format(pgid_file) if self.posix else ''
+        output, errors = bytearray(), bytearray()
+        stdin, stdout, stderr = self.exec_command(prefix + cmd, **kwargs)
+        if stdin_data is not None:
+            stdin.write(stdin_data)
+            stdin.flush()
+            stdin.channel.shutdown_write()
+        expired = self._collect(stdout.channel, watchdog, output, errors)
+        cmd_span.add_bytes(len(output))
+        if expired:
+            diagnostics = ''
+            if self.posix:
+                diagnostics = self._run_quietly(GROUP_DIAGNOSTICS.format(pgid_file))
+                self._run_quietly(KILL_GROUP.format(pgid_file))
+            stdout.channel.close()
+            cmd_span.set_status('timeout')
+            raise watchdog.timeout_error(cmd, *expired, diagnostics=diagnostics,
+                                         error_class=ExecuteTimeout)
+        exit_status = stdout.channel.recv_exit_status()
+        transport = self.get_transport()
+        if exit_status == -1 and (transport is None or not transport.is_active()):
+            cmd_span.set_status('connection lost')
+            raise watchdog.timeout_error(cmd, 'connection', 'connection lost',
+                                         error_class=ExecuteTimeout)
+        cmd_span.set_status(exit_status)
+        return exit_status, bytes(output), bytes(errors)
+
+    def _agent_execute(self, cmd: str, cmd_span, watchdog: Watchdog,
+                       stdin_data: str = None) -> tuple:
+        """
+        Runs a remote command through the remote agent, which enforces the
+        watchdog limits on the host.
+        """
+        try:
+            result = self.get_agent().execute(cmd, watchdog, stdin_data=stdin_data)
+        except AgentError:
+            transport = self.get_transport()
+            if transport is None or not transport.is_active():
+                cmd_span.set_status('connection lost')
+                raise watchdog.timeout_error(cmd, 'connection', 'connection lost',
+                                             error_class=ExecuteTimeout)
+            raise
+        cmd_span.add_bytes(len(result.stdout))
+        if result.expired:
+            cmd_span.set_status('timeout')
+            raise watchdog.timeout_error(cmd, *result.expired,
+                                         diagnostics=result.diagnostics,
+                                         error_class=ExecuteTimeout)
+        cmd_span.set_status(result.exit_status)
+        return result.exit_status, result.stdout, result.stderr
+
+    def safe_execute(self, cmd, *args, timeout: float = None,
+                     idle_timeout: float = None, **kwargs):
         """
         Executes a remote command on AWS Instance.
 
+        The command is watched by a Watchdog, see _execute.
+
         Parameters
         ----------
         cmd : str
             A remote command to execute.
+        timeout : float
+            Seconds the command may run.
+        idle_timeout : float
+            Seconds the command may run without any output.
+
+        Returns
+        -------
+        tuple
+            stdout and stderr of the command as file-like objects.
+
+        Raises
+        ------
+        ExecuteError
+            If the command fails.
+        ExecuteTimeout
+            If a limit expires or the connection is lost.
         """
         cmd = 'set -o pipefail; ' + cmd
         logging.info('Executing %s', cmd)
-        stdin, stdout, stderr = self.exec_command(cmd, *args, **kwargs)
-        stdin.flush()
-        exit_status = stdout.channel.recv_exit_status()
+        with span(describe_command(cmd), 'ssh') as cmd_span:
+            exit_status, output, errors = self._execute(
+                cmd, cmd_span, timeout=timeout, idle_timeout=idle_timeout, **kwargs
+            )
         if exit_status != 0:
-            logging.info('Command output:\n%s', stdout.read().decode())
-            logging.error('Traceback:\n%s', stderr.read().decode())
+            logging.info('Command output:\n%s', output.decode(errors='replace'))
+            logging.error('Traceback:\n%s', errors.decode(errors='replace'))
             raise ExecuteError(f'Command \'{cmd}\' execution failed.')
 
-        return stdout, stderr
+        return io.BytesIO(output), io.BytesIO(errors)
+
+    def safe_execute_batch(self, steps: list, timeout: float = None,
+                           idle_timeout: float = None) -> list:
+        """
+        Executes several remote commands in one SSH round-trip.
+
+        Steps run one by one in separate shells and the batch stops at the
+        first failed step, like consecutive safe_execute calls would. The
+        whole batch is watched by one Watchdog like a safe_execute command.
+
+        Parameters
+        ----------
+        steps : list
+            Remote commands to execute.
+        timeout : float
+            Seconds the batch may run.
+        idle_timeout : float
+            Seconds the batch may run without any output.
+
+        Returns
+        -------
+        list
+            batch.StepResult with exit status, timing and output of a step.
+
+        Raises
+        ------
+        ExecuteError
+            If a step fails.
+        ExecuteTimeout
+            If a limit expires or the connection is lost.
+        """
+        logging.info('Executing batch:\n%s', '\n'.join(steps))
+        with span(f'batch of {len(steps)} steps', 'ssh') as batch_span:
+            exit_status, output, errors = self._execute(
+                'bash -s', batch_span, stdin_data=build_batch_script(steps),
+                timeout=timeout, idle_timeout=idle_timeout
+            )
+        results = parse_batch_output(output.decode(errors='replace'), steps)
+        if len(results) < len(steps) and exit_status == 0:
+            logging.error('Traceback:\n%s', errors.decode(errors='replace'))
+        check_batch_results(results, steps, ExecuteError)
+        return results
+
+    def get_agent(self) -> RemoteAgent:
+        """
+        Gets remote agent of the host, started on first use.
+
+        Returns
+        -------
+        remote_agent.RemoteAgent
+        """
+        if getattr(self, '_agent', None) is None:
+            self._agent = RemoteAgent(self).start()
+        return self._agent
+
+    def open_transfer_session(self) -> paramiko.SFTPClient:
+        """
+        Opens a new SFTP session with a large window for bulk transfers.
+        """
+        return paramiko.SFTPClient.from_transport(
+            self.get_transport(), window_size=WINDOW_SIZE
+        )
+
+    def get_sftp(self) -> paramiko.SFTPClient:
+        """
+        Gets SFTP session of the connection, opened on first use.
+        """
+        if getattr(self, '_sftp', None) is None:
+            self._sftp = self.open_transfer_session()
+        return self._sftp
+
+    def close(self):
+        if getattr(self, '_agent', None) is not None:
+            try:
+                self._agent.close()
+            except Exception as error:
+                logging.warning('Remote agent was not stopped: %s', error)
+            self._agent = None
+        if getattr(self, '_sftp', None) is not None:
+            self._sftp.close()
+            self._sftp = None
+        super().close()
 
     def upload_file(self, content, file_path):
-        sftp = self.open_sftp()
-        sftp.putfo(io.StringIO(content), file_path)
+        upload(self.get_sftp(), io.StringIO(content), file_path)
 
 
 class Builder:
@@ -90,13 +396,33 @@ region = us-east-1
         """
         Builder initialization.
         """
-        self.ec2_client = boto3.resource(service_name='ec2',
-                                         region_name='us-east-1')
-        ssh_file = base64.b64decode(settings.ssh_key_file.encode()).decode()
+        self._ssh_file = base64.b64decode(settings.ssh_key_file.encode()).decode()
         with open(os.open(self.AWS_KEY_PATH, os.O_CREAT | os.O_WRONLY, 0o600),
                   'w') as key_file:
-            key_file.write(ssh_file)
-        self.private_key = paramiko.RSAKey.from_private_key(io.StringIO(ssh_file))
+            key_file.write(self._ssh_file)
+        self._private_key = None
+
+    @property
+    def ec2_client(self):
+        """
+        Gets EC2 resource, created on first use.
+        """
+        return get_resource('ec2')
+
+    @property
+    def private_key(self):
+        """
+        Gets SSH private key, parsed on first use.
+
+        Returns
+        -------
+        paramiko.RSAKey
+        """
+        if self._private_key is None:
+            self._private_key = paramiko.RSAKey.from_private_key(
+                io.StringIO(self._ssh_file)
+            )
+        return self._private_key
 
     @staticmethod
     def get_ssh_client():
@@ -146,75 +472,251 @@ region = us-east-1
         logging.info('Connecting to instance %s', instance_ip)
         instance = self.find_aws_instance(instance_ip)
         ssh_client = self.get_ssh_client()
-        if hypervisor.lower() != 'hyperv':
-            ssh_client.connect(
-                instance.public_dns_name,
-                username='ec2-user',
-                pkey=self.private_key
-            )
-        else:
-            ssh_client.connect(
-                instance.public_dns_name,
-                username='Administrator',
-                pkey=self.private_key
-            )
+        username = 'ec2-user' if hypervisor.lower() != 'hyperv' else 'Administrator'
+        ssh_client.posix = hypervisor.lower() != 'hyperv'
+        retry_call(ssh_client.connect, instance.public_dns_name,
+                   username=username, pkey=self.private_key,
+                   operation='ssh connect', policy=POLICIES['ssh'])
         return ssh_client
 
     def ssh_remote_connect(self, ip, user, server_name):
         logging.info('Connecting to %s Server', server_name)
         ssh_client = self.get_ssh_client()
-        ssh_client.connect(ip, username=user, pkey=self.private_key)
+        retry_call(ssh_client.connect, ip, username=user, pkey=self.private_key,
+                   operation='ssh connect', policy=POLICIES['ssh'])
         return ssh_client
 
-class AgentBuilder():
+class LocalChannel:
+
+    """
+    Local process with the part of paramiko.Channel interface used by stages.
+    """
+
+    def __init__(self, proc, watchdog: Watchdog = None):
+        self.proc = proc
+        self.output = {}
+        self.watchdog = watchdog
+        self._readers = [
+            threading.Thread(target=self._drain, args=(name, stream), daemon=True)
+            for name, stream in (('stdout', proc.stdout), ('stderr', proc.stderr))
+        ]
+        for reader in self._readers:
+            reader.start()
+
+    def _drain(self, name, stream):
+        # Pipes are drained all the time, so commands never block on output
+        chunks = []
+        for chunk in iter(lambda: stream.read1(CHUNK_SIZE), b''):
+            chunks.append(chunk)
+            if self.watchdog is not None:
+                self.watchdog.feed(chunk)
+        self.output[name] = b''.join(chunks)
+        stream.close()
+
+    def shutdown_write(self):
+        if not self.proc.stdin.closed:
+            self.proc.stdin.close()
+
+    def recv_exit_status(self) -> int:
+        self.shutdown_write()
+        for reader in self._readers:
+            reader.join()
+        return self.proc.wait()
+
+    def wait(self) -> tuple:
+        """
+        Waits for the process within the limits of its watchdog.
+
+        Returns
+        -------
+        tuple
+            Reason and message of the expired limit, None if the process
+            exited.
+        """
+        self.shutdown_write()
+        return wait_process(self.proc, self.watchdog)
+
+
+class LocalFile:
+
+    """
+    File-like stdin, stdout or stderr of a LocalChannel.
+    """
+
+    def __init__(self, channel: LocalChannel, name: str):
+        self.channel = channel
+        self.name = name
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self.channel.proc.stdin.write(data)
+
+    def flush(self):
+        if not self.channel.proc.stdin.closed:
+            self.channel.proc.stdin.flush()
+
+    def read(self) -> bytes:
+        self.channel.recv_exit_status()
+        return self.channel.output[self.name]
+
+
+class LocalSFTP:
+
+    """
+    Local file operations with the part of paramiko.SFTPClient interface
+    used by stages. Relative paths are resolved against the home directory
+    like on SFTP.
+    """
+
+    @staticmethod
+    def _path(path: str) -> str:
+        return os.path.join(os.path.expanduser('~'), path)
+
+    def open(self, filename, mode='r'):
+        return open(self._path(filename), mode)
+
+    file = open
+
+    def stat(self, path):
+        return os.stat(self._path(path))
+
+    def put(self, localpath, remotepath):
+        with span(f'local put {os.path.basename(remotepath)}', 'local'):
+            shutil.copyfile(localpath, self._path(remotepath))
+        return self.stat(remotepath)
+
+    def putfo(self, fl, remotepath):
+        # Text streams like io.StringIO are copied as text, like on SFTP
+        mode = 'w' if isinstance(fl, io.TextIOBase) else 'wb'
+        with open(self._path(remotepath), mode) as remote_file:
+            shutil.copyfileobj(fl, remote_file)
+        return self.stat(remotepath)
+
+    def get(self, remotepath, localpath):
+        with span(f'local get {os.path.basename(remotepath)}', 'local'):
+            shutil.copyfile(self._path(remotepath), localpath)
+
+    def close(self):
+        pass
+
+
+class AgentBuilder(Builder):
 
     """
     Agent Builder to use native client.
+
+    Stages run directly on the agent host: connect methods return the
+    builder itself, which executes commands with local processes instead
+    of an SSH client.
     """
 
-    def safe_execute(self, cmd, *args, **kwargs):
+    def _execute(self, cmd: str, cmd_span, stdin_data: str = None,
+                 timeout: float = None, idle_timeout: float = None,
+                 **kwargs) -> tuple:
+        """
+        Runs a local command watched by a Watchdog, its process group is
+        killed when a limit expires.
+
+        Returns
+        -------
+        tuple
+            Exit status, stdout and stderr of the command.
+
+        Raises
+        ------
+        ExecuteTimeout
+            If a limit expires.
+        """
+        watchdog = Watchdog(timeout, idle_timeout)
+        stdin, stdout, stderr = self.exec_command(cmd, watchdog=watchdog, **kwargs)
+        if stdin_data is not None:
+            stdin.write(stdin_data)
+        stdin.flush()
+        channel = stdout.channel
+        expired = channel.wait()
+        if expired:
+            diagnostics = process_group_diagnostics(channel.proc.pid)
+            kill_process_group(channel.proc)
+            cmd_span.set_status('timeout')
+            raise watchdog.timeout_error(cmd, *expired, diagnostics=diagnostics,
+                                         error_class=ExecuteTimeout)
+        exit_status = channel.recv_exit_status()
+        cmd_span.add_bytes(len(stdout.read()))
+        cmd_span.set_status(exit_status)
+        return exit_status, stdout.read(), stderr.read()
+
+    def safe_execute(self, cmd, *args, timeout: float = None,
+                     idle_timeout: float = None, **kwargs):
         """
         Executes a command, emulate ssh client.
 
         Parameters
         ----------
         cmd : str
-            A remote command to execute.
+            A command to execute.
+        timeout : float
+            Seconds the command may run.
+        idle_timeout : float
+            Seconds the command may run without any output.
         """
         cmd = 'set -o pipefail; ' + cmd
         logging.info('Executing %s', cmd)
-        stdin, stdout, stderr = self.exec_command(cmd, *args, **kwargs)
-        stdin.flush()
-        exit_status = stdout.channel.recv_exit_status()
+        with span(describe_command(cmd), 'local') as cmd_span:
+            exit_status, output, errors = self._execute(
+                cmd, cmd_span, timeout=timeout, idle_timeout=idle_timeout, **kwargs
+            )
         if exit_status != 0:
-            logging.info('Command output:\n%s', stdout.read().decode())
-            logging.error('Traceback:\n%s', stderr.read().decode())
+            logging.info('Command output:\n%s', output.decode())
+            logging.error('Traceback:\n%s', errors.decode())
             raise ExecuteError(f'Command \'{cmd}\' execution failed.')
 
-        return stdout, stderr
+        return io.BytesIO(output), io.BytesIO(errors)
 
-    def exec_command(self, cmd, *args, **kwargs):
+    # Only _execute differs, the batch envelope is the same
+    safe_execute_batch = ParamikoWrapper.safe_execute_batch
+
+    def exec_command(self, cmd, *args, watchdog: Watchdog = None, **kwargs):
         """
-        Executes a remote command on AWS Instance.
+        Starts a local command with bash in the home directory, like sshd.
 
         Parameters
         ----------
         cmd : str
-            A remote command to execute.
+            A command to execute.
+        watchdog : Watchdog
+            Watchdog fed with the command output.
+
+        Returns
+        -------
+        tuple
+            stdin, stdout and stderr of a command.
         """
-        logging.info('Executing %s', cmd)
-        stdin, stdout, stderr = self.exec_command(cmd, *args, **kwargs)
-        stdin.flush()
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status != 0:
-            logging.info('Command output:\n%s', stdout.read().decode())
-            logging.error('Traceback:\n%s', stderr.read().decode())
-            raise ExecuteError(f'Command \'{cmd}\' execution failed.')
+        proc = subprocess.Popen(
+            ['bash', '-c', cmd], cwd=os.path.expanduser('~'),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, start_new_session=True
+        )
+        channel = LocalChannel(proc, watchdog)
+        return (LocalFile(channel, 'stdin'), LocalFile(channel, 'stdout'),
+                LocalFile(channel, 'stderr'))
 
-        return stdout, stderr 
+    @staticmethod
+    def open_sftp():
+        return LocalSFTP()
+
+    get_sftp = open_transfer_session = open_sftp
+
+    def close(self):
+        pass
+
+    def get_ssh_client(self):
+        return self
+
+    def ssh_aws_connect(self, instance_ip: str, hypervisor: str):
+        logging.info('Running on the agent host instead of %s', instance_ip)
+        return self
 
     def ssh_remote_connect(self, ip, user, server_name):
-        logging.info('Connecting to %s Server', server_name)
-        ssh_client = self.get_ssh_client()
-        ssh_client.connect(ip, username=user, pkey=self.private_key)
-        return ssh_client        
\ No newline at end of file
+        logging.info('Running on the agent host instead of %s Server', server_name)
+        return self
@@ -21,6 +21,7 @@ class Settings(BaseSettings):
     bucket: str = ''
     ssh_key_file: str
     vagrant_cloud_access_key: str = ''
+    vagrant_cloud_url: str = 'https://app.vagrantup.com/api/v1'
     build_number: str
     image: str = ''
     aarch_username: str = ''
@@ -38,6 +39,27 @@ class Settings(BaseSettings):
     docker_configuration: str = ''
     ppc64le_host: str = ''
     almalinux: str = ''
+    metrics_textfile_dir: str = ''
+    pushgateway_url: str = ''
+    perf_db: str = 'perf_history.sqlite'
+    perf_history_prefix: str = 'perf-history'
+    resource_sample_interval: int = 15
+    remote_agent: bool = False
+    build_cache: bool = False
+    build_cache_prefix: str = 'build-cache'
+    qcow2_compression: str = ''
+    delta_transfer: bool = False
+    delta_prefix: str = 'delta'
+    delta_cache_dir: str = ''
+    docker_xz_opt: str = '-T0 --block-size=16MiB'
+    docker_zstd_level: int = 0
+    ami_catalog_db: str = 'ami_catalog.sqlite'
+    ami_catalog_prefix: str = 'ami-catalog'
+    # Limits of every command in seconds, zero disables a limit
+    command_timeout: int = 12 * 3600
+    command_idle_timeout: int = 0
+    ssh_keepalive_interval: int = 30
+    ssh_keepalive_count: int = 4
 
 
 settings = Settings()
@@ -0,0 +1,251 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Block-level delta transfer of images through S3 bucket.
+
+Images are split into fixed-size chunks stored once in
+{prefix}/chunks/{sha256}. Every uploaded image gets a chunk index
+{key}.index.json next to the full object, and the latest index of an
+image variant is kept in {prefix}/latest/{variant}.json as the base for
+the next upload: only chunks missing from the base are sent. Fetching an
+image downloads only chunks missing from a local cache.
+
+The push command runs on builder hosts with the system python3 and aws
+CLI, so this module must use only the standard library of python 3.6:
+
+    python3 delta.py push IMAGE --bucket B --prefix P --key K --variant V
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # Windows builder hosts only run push
+    fcntl = None
+
+
+__all__ = ['CHUNK_SIZE', 'build_index', 'push', 'fetch']
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+LOCK_NAME = '.lock'
+
+
+def _read_chunks(path: str, chunk_size: int):
+    with open(path, 'rb') as image:
+        for chunk in iter(lambda: image.read(chunk_size), b''):
+            yield chunk
+
+
+def build_index(path: str, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Makes a chunk index of a file.
+
+    Returns
+    -------
+    dict
+        Size, sha256 of the whole file, chunk size and chunk hashes.
+    """
+    checksum = hashlib.sha256()
+    chunks = []
+    size = 0
+    for chunk in _read_chunks(path, chunk_size):
+        checksum.update(chunk)
+        chunks.append(hashlib.sha256(chunk).hexdigest())
+        size += len(chunk)
+    return {'size': size, 'sha256': checksum.hexdigest(),
+            'chunk_size': chunk_size, 'chunks': chunks}
+
+
+def _aws(*args, stdin=None) -> bytes:
+    proc = subprocess.run(['aws'] + list(args), input=stdin,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        raise RuntimeError('aws {0} failed: {1}'.format(
+            ' '.join(args), proc.stderr.decode(errors='replace')))
+    return proc.stdout
+
+
+def push(path: str, bucket: str, prefix: str, key: str, variant: str,
+         chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Uploads chunks of an image missing from the latest index of its variant.
+
+    Parameters
+    ----------
+    path : str
+        Image path.
+    bucket : str
+        S3 bucket name.
+    prefix : str
+        Key prefix of the chunk store.
+    key : str
+        Key the full image would be uploaded to, the index is saved as
+        {key}.index.json.
+    variant : str
+        Stable name of the image across builds.
+
+    Returns
+    -------
+    dict
+        Transfer summary.
+    """
+    latest = 's3://{0}/{1}/latest/{2}.json'.format(bucket, prefix, variant)
+    try:
+        base = json.loads(_aws('s3', 'cp', '--only-show-errors', latest, '-').decode())
+        known = set(base['chunks']) if base['chunk_size'] == chunk_size else set()
+    except (RuntimeError, ValueError):
+        known = set()
+    staging = tempfile.mkdtemp(prefix='alcib-delta-', dir=os.path.dirname(path) or '.')
+    checksum = hashlib.sha256()
+    chunks = []
+    size = uploaded = 0
+    try:
+        for chunk in _read_chunks(path, chunk_size):
+            checksum.update(chunk)
+            digest = hashlib.sha256(chunk).hexdigest()
+            chunks.append(digest)
+            size += len(chunk)
+            if digest in known:
+                continue
+            known.add(digest)
+            with open(os.path.join(staging, digest), 'wb') as chunk_file:
+                chunk_file.write(chunk)
+            uploaded += len(chunk)
+        if uploaded:
+            # One recursive copy uploads the new chunks in parallel
+            _aws('s3', 'cp', '--recursive', '--only-show-errors', staging,
+                 's3://{0}/{1}/chunks/'.format(bucket, prefix))
+    finally:
+        shutil.rmtree(staging)
+    index = {'size': size, 'sha256': checksum.hexdigest(),
+             'chunk_size': chunk_size, 'chunks': chunks}
+    payload = json.dumps(index).encode()
+    _aws('s3', 'cp', '--only-show-errors', '-',
+         's3://{0}/{1}.index.json'.format(bucket, key),
+         '--metadata', 'sha256=' + index['sha256'], stdin=payload)
+    _aws('s3', 'cp', '--only-show-errors', '-', latest, stdin=payload)
+    return {'key': key, 'size': size, 'sha256': index['sha256'],
+            'chunks': len(chunks), 'bytes_uploaded': uploaded}
+
+
+@contextlib.contextmanager
+def _locked(cache_dir: str):
+    """
+    Holds an exclusive lock of a chunk cache shared by concurrent jobs.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(os.path.join(cache_dir, LOCK_NAME), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def fetch(s3, bucket: str, prefix: str, key: str, dest: str,
+          cache_dir: str, workers: int = 8) -> dict:
+    """
+    Rebuilds an image from its chunk index, downloading only the chunks
+    missing in the local cache, and verifies its sha256.
+
+    Parameters
+    ----------
+    s3 : botocore.client.S3
+        S3 client.
+    bucket : str
+        S3 bucket name.
+    prefix : str
+        Key prefix of the chunk store.
+    key : str
+        Key of the full image, the index is read from {key}.index.json.
+    dest : str
+        Path of the rebuilt image.
+    cache_dir : str
+        Directory with chunks of previously fetched images, it's locked
+        for the whole fetch.
+
+    Returns
+    -------
+    dict
+        Transfer summary.
+
+    Raises
+    ------
+    ValueError
+        If the rebuilt image checksum doesn't match the index.
+    """
+    response = s3.get_object(Bucket=bucket, Key=f'{key}.index.json')
+    index = json.loads(response['Body'].read().decode())
+    with _locked(cache_dir):
+        return _fetch(s3, bucket, prefix, index, key, dest, cache_dir, workers)
+
+
+def _fetch(s3, bucket: str, prefix: str, index: dict, key: str, dest: str,
+           cache_dir: str, workers: int) -> dict:
+    missing = sorted(set(index['chunks']) - set(os.listdir(cache_dir)))
+
+    def download_chunk(digest):
+        partial = os.path.join(cache_dir, f'{digest}.part')
+        s3.download_file(bucket, f'{prefix}/chunks/{digest}', partial)
+        os.rename(partial, os.path.join(cache_dir, digest))
+        return os.path.getsize(os.path.join(cache_dir, digest))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        downloaded = sum(executor.map(download_chunk, missing))
+    checksum = hashlib.sha256()
+    with open(dest, 'wb') as image:
+        for digest in index['chunks']:
+            with open(os.path.join(cache_dir, digest), 'rb') as chunk_file:
+                chunk = chunk_file.read()
+            checksum.update(chunk)
+            image.write(chunk)
+    if checksum.hexdigest() != index['sha256']:
+        os.remove(dest)
+        raise ValueError(f'{dest} checksum mismatch, expected {index["sha256"]}')
+    # Only chunks of the latest image are needed as the base of the next one
+    wanted = set(index['chunks']) | {LOCK_NAME}
+    for name in os.listdir(cache_dir):
+        if name not in wanted:
+            os.remove(os.path.join(cache_dir, name))
+    logging.info('%s rebuilt from %d chunks, %.1f of %.1f MiB downloaded',
+                 dest, len(index['chunks']), downloaded / 2 ** 20,
+                 index['size'] / 2 ** 20)
+    return {'key': key, 'size': index['size'], 'sha256': index['sha256'],
+            'chunks': len(index['chunks']), 'bytes_downloaded': downloaded}
+
+
+def main(sys_args):
+    parser = argparse.ArgumentParser(description='Block-level image delta transfer')
+    subparsers = parser.add_subparsers(dest='command')
+    push_parser = subparsers.add_parser('push', help='Upload new chunks of an image')
+    push_parser.add_argument('path')
+    push_parser.add_argument('--bucket', required=True)
+    push_parser.add_argument('--prefix', required=True)
+    push_parser.add_argument('--key', required=True)
+    push_parser.add_argument('--variant', required=True)
+    push_parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(sys_args)
+    if args.command != 'push':
+        parser.print_help()
+        return 2
+    summary = push(args.path, args.bucket, args.prefix, args.key,
+                   args.variant, args.chunk_size)
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -9,26 +9,48 @@ Hypervisor's stages.
 import os
 import json
 import shutil
-from datetime import datetime
+import contextlib
+import functools
 import collections
 from subprocess import PIPE, Popen, STDOUT
 from io import BufferedReader, StringIO
 import logging
-import time
 import re
 
-import requests
-import boto3
-import ansible_runner
-
+from lib import delta
+from lib.aioexec import Command, run_parallel
+from lib.ami_catalog import upload_release, write_catalog
+from lib.ami_mirror import AmiMirror
+from lib.aws import get_client
+from lib.build_cache import (
+    REPO_URL, REPOSITORIES, BuildCache, build_fingerprint, repomd_digests
+)
 from lib.builder import Builder, ExecuteError, AgentBuilder
 from lib.config import settings
+from lib.junit import merge_junit
+from lib.manifest import diff_manifests, load_manifest
+from lib.metrics import registry
+from lib.retry import POLICIES, http_request, retry_call
+from lib.run_metadata import run_metadata
+from lib.sampler import RemoteSampler
+from lib.tracing import span, traced
+from lib.transfer import download, upload_many
+from lib.vagrant_cloud import PROVIDERS, BoxSource, VagrantCloud
 from lib.utils import *
 
 
-TIMESTAMP = str(datetime.date(datetime.today())).replace('-', '')
-DT_SUFFIX = str(datetime.today()).replace('-', '').replace('.', '').replace(':', '').replace(' ', '_')
 IMAGE = settings.image.replace(" ", "_")
+# Relative SFTP paths are resolved against the home directory
+DELTA_PATH = '.alcib_delta.py'
+# Test instances, every one gets its own testinfra process
+TEST_HOSTS = ['almalinux-test-1', 'almalinux-test-2']
+# Limits of long running commands in seconds. Packer prints its progress
+# all the time, test and vagrant shards write their output to files, so
+# only the deadline works for them
+BUILD_LIMITS = {'timeout': 6 * 3600, 'idle_timeout': 3600}
+VAGRANT_UP_LIMITS = {'timeout': 2 * 3600}
+TEST_LIMITS = {'timeout': 3 * 3600}
+TERRAFORM_LIMITS = {'timeout': 3600, 'idle_timeout': 1800}
 
 
 class BaseHypervisor:
@@ -38,6 +60,7 @@ class BaseHypervisor:
 
     cloud_images_path = '/home/ec2-user/cloud-images'
     sftp_path = '/home/ec2-user/cloud-images/'
+    supports_resource_sampling = True
 
     def __init__(self, name: str, arch: str):
         """
@@ -54,16 +77,22 @@ class BaseHypervisor:
         self._instance_ip = None
         self._instance_id = None
         self.build_number = settings.build_number
-        self.s3_bucket = boto3.client(
-            service_name='s3', region_name='us-east-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
-        self.ec2_client = boto3.client(
-            service_name='ec2', region_name='us-east-1',
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-        )
+        # Narrowed to the rebuilt configurations by build_docker_stage
+        self.changed_docker_confs = settings.docker_configuration.split(',')
+
+    @property
+    def s3_bucket(self):
+        """
+        Gets S3 client, created on first use.
+        """
+        return get_client('s3')
+
+    @property
+    def ec2_client(self):
+        """
+        Gets EC2 client, created on first use.
+        """
+        return get_client('ec2')
 
     @property
     def terraform_dir(self):
@@ -79,6 +108,369 @@ class BaseHypervisor:
             return os.path.join(os.getcwd(), 'terraform/{0}'.format(self.arch))
         return os.path.join(os.getcwd(), 'terraform/{0}'.format(self.name))
 
+    @property
+    def bucket_path(self) -> str:
+        """
+        Gets S3 bucket prefix where artifacts and logs of the build are stored.
+
+        Returns
+        -------
+        str
+            S3 key prefix without trailing slash.
+        """
+        return f'{self.build_number}-{IMAGE}-{self.name}-{self.arch}-{TIMESTAMP}'
+
+    @property
+    def host_type(self) -> str:
+        """
+        Gets type of the host the images are built on.
+
+        Returns
+        -------
+        str
+            EC2 instance type or hypervisor name for non-AWS hosts.
+        """
+        if settings.image == 'Docker' and self.arch == 'ppc64le':
+            return 'ppc64le'
+        if not os.path.exists(os.path.join(self.terraform_dir, 'terraform.tfstate')):
+            return self.name
+        # The state outlives destroyed instances
+        try:
+            response = self.ec2_client.describe_instances(InstanceIds=[self.instance_id])
+            return response['Reservations'][0]['Instances'][0]['InstanceType']
+        except Exception as error:
+            logging.warning('Instance type is unknown: %s', error)
+            return self.name
+
+    @property
+    def build_cache(self) -> BuildCache:
+        """
+        Gets index of cached builds in S3 bucket.
+        """
+        return BuildCache(self.s3_bucket, settings.bucket, settings.build_cache_prefix)
+
+    def build_cache_inputs(self, ssh, commands: list, logs: list,
+                           packer: str = 'packer'):
+        """
+        Collects inputs of a packer build for the build cache.
+
+        Packer plugins must be initialized already, their installed
+        versions are part of the inputs.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        commands : list
+            Packer commands of the build.
+        logs : list
+            Build log names, excluded from the commands since they change
+            every run.
+        packer : str
+            Packer executable name on the builder host.
+
+        Returns
+        -------
+        dict or None
+            Build inputs, None if the cache is disabled or inputs can't be
+            collected.
+        """
+        if not settings.build_cache:
+            return None
+        if not getattr(ssh, 'posix', True):
+            logging.info('Build cache is not supported on Windows hosts')
+            return None
+        for log in logs:
+            commands = [cmd.replace(log, '{log}') for cmd in commands]
+        try:
+            stdout, _ = ssh.safe_execute('git -C cloud-images rev-parse HEAD')
+            cloud_images = stdout.read().decode().strip()
+            stdout, _ = ssh.safe_execute(f'{packer} version | head -n 1')
+            packer_version = stdout.read().decode().strip()
+            # Plugin paths end with the name and version of a plugin binary
+            stdout, _ = ssh.safe_execute(
+                f"{packer} plugins installed | sed 's|.*/plugins/||' | sort"
+            )
+            return {
+                'image': settings.image,
+                'hypervisor': self.name,
+                'arch': self.arch,
+                'os_major_ver': self.os_major_ver,
+                'cloud_images': cloud_images,
+                'packer': [cmd for cmd in commands if cmd],
+                'packer_version': packer_version,
+                'packer_plugins': stdout.read().decode().split(),
+                'qcow2_compression': settings.qcow2_compression,
+                'repomd': repomd_digests(self.os_major_ver, self.arch),
+            }
+        except Exception as error:
+            logging.exception('Build cache is skipped: %s', error)
+            return None
+
+    @staticmethod
+    def aws_export() -> str:
+        """
+        Makes shell commands exporting AWS credentials on a builder host.
+        """
+        return f'export AWS_ACCESS_KEY_ID={os.getenv("AWS_ACCESS_KEY_ID")} ' \
+               f'&& export AWS_SECRET_ACCESS_KEY={os.getenv("AWS_SECRET_ACCESS_KEY")} ' \
+               f'&& export AWS_DEFAULT_REGION=us-east-1'
+
+    @staticmethod
+    def artifact_paths(ssh, file_path: str, files: list) -> dict:
+        """
+        Finds built images on the builder host.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        file_path : str
+            Directory with build results.
+        files : list
+            Patterns of uploaded files relative to the directory.
+
+        Returns
+        -------
+        dict
+            Paths relative to the directory by file name.
+        """
+        patterns = ' '.join(files)
+        stdout, _ = ssh.safe_execute(f'cd {file_path} && ls -d {patterns} 2>/dev/null || true')
+        return {os.path.basename(path): path
+                for path in stdout.read().decode().split()
+                if path.endswith(('.qcow2', '.box'))}
+
+    def promote_cached_build(self, inputs, ssh, file_path: str) -> bool:
+        """
+        Promotes artifacts of a build with the same inputs if there is one
+        and puts its images on the builder host where packer would, so the
+        test and release stages find them.
+
+        Parameters
+        ----------
+        inputs : dict
+            Build inputs, see build_cache_inputs.
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        file_path : str
+            Directory with build results.
+
+        Returns
+        -------
+        bool
+            True on a cache hit.
+        """
+        if inputs is None:
+            return False
+        fingerprint = build_fingerprint(inputs)
+        entry = self.build_cache.lookup(fingerprint)
+        if entry is not None and not entry.get('paths'):
+            logging.info('Cached build %s has no image paths, rebuilding',
+                         entry['bucket_path'])
+            entry = None
+        registry.set('alcib_build_cache_hit', int(entry is not None))
+        if entry is None:
+            logging.info('Build cache miss, fingerprint %s', fingerprint)
+            return False
+        logging.info('Build cache hit, fingerprint %s, built in %s',
+                     fingerprint, entry['bucket_path'])
+        for key in self.build_cache.promote(entry, self.bucket_path):
+            path = entry['paths'].get(os.path.basename(key))
+            if path is None:
+                continue
+            with span(f's3 download {os.path.basename(key)}', 's3'):
+                ssh.safe_execute(
+                    f'bash -c "{self.aws_export()} && cd {file_path} '
+                    f'&& mkdir -p $(dirname {path}) '
+                    f'&& aws s3 cp --only-show-errors s3://{settings.bucket}/{key} {path}"'
+                )
+            logging.info('Cached %s restored to %s/%s', key, file_path, path)
+        return True
+
+    def record_cached_build(self, inputs, ssh, file_path: str, files: list):
+        """
+        Adds the successful build to the build cache.
+        """
+        if inputs is None:
+            return
+        try:
+            self.build_cache.record(build_fingerprint(inputs), inputs, self.bucket_path,
+                                    self.artifact_paths(ssh, file_path, files))
+        except Exception as error:
+            logging.exception('Build was not cached: %s', error)
+
+    @traced
+    def postprocess_qcow2(self, ssh, file_path: str):
+        """
+        Sparsifies and compresses built qcow2 images before the upload.
+
+        Free space is zeroed with virt-sparsify when it's installed and the
+        image is rewritten with compressed clusters, zlib by default or zstd
+        if QCOW2_COMPRESSION=zstd (needs qemu-img 5.1+ on every consumer).
+        Sizes and checksums before and after are saved in the run metadata.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        file_path : str
+            Directory with packer output directories.
+        """
+        if not settings.qcow2_compression:
+            return
+        options = ''
+        if settings.qcow2_compression == 'zstd':
+            options = '-o compression_type=zstd'
+        pattern = f'{file_path}/output-almalinux-{self.os_major_ver}-*-{self.arch}/*.qcow2'
+        stdout, _ = ssh.safe_execute(
+            f'for f in {pattern}; do '
+            f'before=$(stat -L -c %s "$f") && before_sha=$(sha256sum "$f" | cut -d" " -f1) && '
+            f'if command -v virt-sparsify > /dev/null; then '
+            f'LIBGUESTFS_BACKEND=direct virt-sparsify --in-place "$f" >&2; fi && '
+            f'qemu-img convert -O qcow2 -c {options} "$f" "$f.tmp" >&2 && mv "$f.tmp" "$f" && '
+            f'echo "QCOW2 $f $before $before_sha $(stat -L -c %s "$f") '
+            f'$(sha256sum "$f" | cut -d" " -f1)" || exit 1; done'
+        )
+        for line in stdout.read().decode().splitlines():
+            if not line.startswith('QCOW2 '):
+                continue
+            _, path, before, before_sha, after, after_sha = line.split()
+            before, after = int(before), int(after)
+            logging.info('%s compressed from %.1f to %.1f MiB', path,
+                         before / 2 ** 20, after / 2 ** 20)
+            run_metadata.record('qcow2_postprocess', os.path.basename(path), {
+                'compression': settings.qcow2_compression,
+                'size_before': before, 'sha256_before': before_sha,
+                'size_after': after, 'sha256_after': after_sha,
+            })
+
+    def upload_artifact(self, local_path: str):
+        """
+        Uploads a file from jenkins node next to the build logs in S3 bucket.
+
+        Parameters
+        ----------
+        local_path: str
+            Path to the file on jenkins node.
+        """
+        key = f'{self.bucket_path}/{os.path.basename(local_path)}'
+        # botocore retries transient errors of the transfer, see lib/aws.py
+        with span(f's3 upload {os.path.basename(local_path)}', 's3') as s3_span:
+            self.s3_bucket.upload_file(local_path, settings.bucket, key)
+            s3_span.add_bytes(os.path.getsize(local_path))
+        logging.info('%s uploaded to s3://%s/%s', local_path, settings.bucket, key)
+
+    @staticmethod
+    def junit_name(test_log: str, host: str) -> str:
+        """
+        Gets JUnit XML report name of a test host shard.
+        """
+        return f'{os.path.splitext(test_log)[0]}_{host}.xml'
+
+    def testinfra_command(self, ssh_config: str, script: str, test_log: str) -> str:
+        """
+        Makes a command running testinfra tests on every test host in its
+        own process. Logs of the shards are joined into the test log after
+        all of them finish.
+
+        Parameters
+        ----------
+        ssh_config : str
+            SSH config of the test hosts.
+        script : str
+            Testinfra tests path.
+        test_log : str
+            Test log name in the current directory.
+
+        Returns
+        -------
+        str
+            Shell command.
+        """
+        shards = ' '.join(
+            f'(py.test -v --hosts={host} --ssh-config={ssh_config} '
+            f'--junitxml=./{self.junit_name(test_log, host)} {script} '
+            f'> ./{test_log}.{host} 2>&1) &'
+            for host in TEST_HOSTS
+        )
+        logs = ' '.join(f'./{test_log}.{host}' for host in TEST_HOSTS)
+        return f'{{ {shards} wait; }} && cat {logs} | tee ./{test_log}'
+
+    def collect_test_report(self, ssh, remote_dir: str, test_log: str):
+        """
+        Merges JUnit XML reports of the test shards and uploads the report
+        next to the build logs.
+
+        Returns
+        -------
+        JunitSummary
+            Totals of all shards.
+        """
+        shards = {}
+        sftp = ssh.get_sftp()
+        for host in TEST_HOSTS:
+            report = self.junit_name(test_log, host)
+            shards[host] = f'{self.name}-{report}'
+            try:
+                download(sftp, f'{remote_dir}/{report}', shards[host])
+            except IOError as error:
+                logging.warning('%s report download failed: %s', host, error)
+        merged = f'{os.path.splitext(test_log)[0]}_junit.xml'
+        summary = merge_junit(shards, merged)
+        logging.info('%d tests on %d hosts in %.0fs: %d failures, %d errors, '
+                     '%d skipped', summary.tests, len(TEST_HOSTS), summary.time,
+                     summary.failures, summary.errors, summary.skipped)
+        run_metadata.record('tests', test_log, summary._asdict())
+        self.upload_artifact(merged)
+        return summary
+
+    @contextlib.contextmanager
+    def resource_sampling(self, ssh, label: str):
+        """
+        Samples builder host resource usage while the block is running.
+
+        The time series is uploaded next to the build logs and the peak
+        utilization is logged and exported as metrics.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        label : str
+            Name of the sampled operation.
+        """
+        # Local agent runs have no SSH transport to open a sampler channel on
+        if not settings.resource_sample_interval or not self.supports_resource_sampling \
+                or not hasattr(ssh, 'get_transport'):
+            yield None
+            return
+        sampler = RemoteSampler(ssh, settings.resource_sample_interval)
+        try:
+            sampler.start()
+        except Exception as error:
+            logging.exception('Resource sampler failed to start: %s', error)
+            yield None
+            return
+        try:
+            yield sampler
+        finally:
+            sampler.stop()
+            summary = sampler.summary()
+            for resource, values in summary.items():
+                logging.info('Builder %s during %s: peak %s, mean %s',
+                             resource, label, values['peak'], values['mean'])
+                registry.set('alcib_builder_peak_utilization', values['peak'],
+                             resource=resource, operation=label)
+            path = sampler.save(
+                f'{IMAGE}_{self.arch}_{label}_resources_{DT_SUFFIX}.csv'
+            )
+            try:
+                self.upload_artifact(path)
+            except Exception as error:
+                logging.exception('Resource samples upload failed: %s', error)
+
+    @traced
     def wait_instance_ready(self, ec2_ids):
         """
         Waits for EC2 instances to be ready for ssh connection.
@@ -121,6 +513,7 @@ class BaseHypervisor:
             self.get_instance_info()
         return self._instance_id
 
+    @traced
     def download_qcow(self) -> str:
         """
         Downloads qcow image from S3 bucket to jenkins node.
@@ -130,31 +523,42 @@ class BaseHypervisor:
         work_dir: str
             Working directory with downloaded image.
         """
-        bucket_path = f'{self.build_number}-{IMAGE}-{self.name}-{self.arch}-{TIMESTAMP}'
+        bucket_path = self.bucket_path
         work_dir = os.path.join(os.getcwd(), f'{bucket_path}')
         os.mkdir(work_dir, mode=0o777)
         qcow_name = f'almalinux-{self.os_major_ver}-{settings.image}-{self.os_major_ver}.5'
-        for i in range(5):
+        local_qcow = f'{work_dir}/{qcow_name}-{TIMESTAMP}.{self.arch}.qcow2'
+        if settings.delta_transfer:
+            key = f'{bucket_path}/{qcow_name}.{self.arch}.qcow2'
+            cache_dir = settings.delta_cache_dir or os.path.expanduser('~/.cache/alcib')
             try:
+                with span(f's3 download {qcow_name} delta', 's3') as s3_span:
+                    summary = delta.fetch(
+                        self.s3_bucket, settings.bucket, settings.delta_prefix, key,
+                        local_qcow, os.path.join(cache_dir, f'{IMAGE}-{self.arch}')
+                    )
+                    s3_span.add_bytes(summary['bytes_downloaded'])
+                return work_dir
+            except self.s3_bucket.exceptions.NoSuchKey:
+                logging.info('No chunk index for %s, downloading full image', key)
+        # botocore retries transient errors of the transfer, see lib/aws.py
+        try:
+            with span(f's3 download {qcow_name}', 's3') as s3_span:
                 self.s3_bucket.download_file(
                     settings.bucket,
                     f'{bucket_path}/{qcow_name}.{self.arch}.qcow2',
-                    f'{work_dir}/{qcow_name}-{TIMESTAMP}.{self.arch}.qcow2'
+                    local_qcow
                 )
-            except Exception as error:
-                logging.exception('%s', error)
-                time.sleep(60)
-                if i == 4:
-                    try:
-                        execute_command(
-                            f'aws s3 sync s3://{settings.bucket}/{bucket_path}/ '
-                            f'{bucket_path}', os.getcwd()
-                        )
-                    except Exception as error:
-                        logging.exception('%s', error)
-                        raise error
+                s3_span.add_bytes(os.path.getsize(local_qcow))
+        except Exception as error:
+            logging.exception('%s', error)
+            execute_command(
+                f'aws s3 sync s3://{settings.bucket}/{bucket_path}/ '
+                f'{bucket_path}', os.getcwd()
+            )
         return work_dir
 
+    @traced
     def koji_release(self, ftp_path: str, qcow_name: str, builder: Builder):
         """
         Performs images release to koji.cloudlinux.com and
@@ -196,9 +600,10 @@ class BaseHypervisor:
             'content': f'{checksum_file}',
             'pgp_keyid': '488FCF7C3ABB34F8',
         }
-        response = requests.post(
-            'https://build.almalinux.org/api/v1/sign-tasks/sync_sign_task/',
-            headers=headers, json=json_data)
+        response = http_request(
+            'POST', 'https://build.almalinux.org/api/v1/sign-tasks/sync_sign_task/',
+            operation='sign', headers=headers, json=json_data)
+        response.raise_for_status()
         content = json.loads(response.content.decode())
         ssh_koji.upload_file(
             content["asc_content"], f'{ftp_path}/images/CHECKSUM.asc'
@@ -227,6 +632,7 @@ class BaseHypervisor:
         self._instance_ip = output_json['instance_public_ip']['value']
         self._instance_id = output_json['instance_id']['value']
 
+    @traced
     def create_aws_instance(self):
         """
         Creates AWS Instance using Terraform commands.
@@ -249,6 +655,7 @@ class BaseHypervisor:
         for cmd in terraform_commands:
             execute_command(cmd, self.terraform_dir)
 
+    @traced
     def teardown_stage(self):
         """
         Terminates AWS Instance.
@@ -261,10 +668,79 @@ class BaseHypervisor:
         else:
             logging.info('Destroy VM alreaded completed')
 
+    @staticmethod
+    def remote_checksums(ssh, file_path: str, file: str) -> list:
+        """
+        Calculates checksums of remote files to upload.
+
+        With the remote agent enabled a pattern is expanded and files are
+        hashed by the agent, otherwise a shell is started per pattern and
+        expands it.
+
+        Returns
+        -------
+        list
+            Path, sha256 checksum and size of every found file.
+        """
+        pattern = f'{file_path}/{file}'
+        if getattr(ssh, 'agent_enabled', False):
+            agent = ssh.get_agent()
+            return [(path, *agent.sha256(path)) for path in agent.glob(pattern)]
+        cmd = f'bash -c "sha256sum {pattern} && stat -L -c \'%n %s\' {pattern}"'
+        try:
+            stdout, _ = ssh.safe_execute(cmd)
+        except ExecuteError:
+            return []
+        checksums, sizes = {}, {}
+        for line in stdout.read().decode().splitlines():
+            first, _, second = line.partition(' ')
+            if re.fullmatch(r'[0-9a-f]{64}', first):
+                checksums[second.lstrip(' *')] = first
+            elif second.isdigit():
+                sizes[first] = int(second)
+        return [(path, checksum, sizes[path])
+                for path, checksum in checksums.items() if path in sizes]
+
+    def delta_push(self, ssh, path: str, cmd_export: str):
+        """
+        Uploads chunks of a remote image missing from the previous build
+        of the same variant, see lib/delta.py.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        path : str
+            Remote image path.
+        cmd_export : str
+            Shell commands exporting AWS credentials.
+        """
+        ssh.get_sftp().put(delta.__file__, DELTA_PATH)
+        name = os.path.basename(path)
+        variant = f'{IMAGE}-{self.name}-{os.path.basename(os.path.dirname(path))}'
+        cmd = f'bash -c "{cmd_export} && python3 {DELTA_PATH} push {path} ' \
+              f'--bucket {settings.bucket} --prefix {settings.delta_prefix} ' \
+              f'--key {self.bucket_path}/{name} --variant {variant}"'
+        with span(f's3 upload {name} delta', 's3') as s3_span:
+            stdout, _ = ssh.safe_execute(cmd)
+            summary = json.loads(stdout.read().decode().splitlines()[-1])
+            s3_span.add_bytes(summary['bytes_uploaded'])
+        logging.info('%s uploaded as %d chunks, %.1f of %.1f MiB sent', name,
+                     summary['chunks'], summary['bytes_uploaded'] / 2 ** 20,
+                     summary['size'] / 2 ** 20)
+
+    @traced
     def upload_to_bucket(self, builder: Builder, files: list, file_path: str, ssh):
         """
         Upload files to S3 bucket.
 
+        With delta transfer enabled the chunks of qcow2 images are pushed
+        before the full upload. The full object is still uploaded: the
+        build cache copies it, the aws s3 sync fallback and external
+        consumers read it, so delta transfer saves download_qcow traffic
+        only, at the cost of new chunks sent on top of the image. Readers
+        without an index fall back to the full object.
+
         Parameters
         ----------
         builder : Builder
@@ -275,27 +751,30 @@ class BaseHypervisor:
             Path to files to upload.
         """
         logging.info('Uploading to S3 bucket')
-        timestamp_name = f'{self.build_number}-{IMAGE}-{self.name}-{self.arch}-{TIMESTAMP}'
-        aws_access_key_id = os.getenv('AWS_ACCESS_KEY_ID')
-        aws_secret_access_key = os.getenv('AWS_SECRET_ACCESS_KEY')
-        aws_region = 'us-east-1'
+        timestamp_name = self.bucket_path
+        cmd_export = self.aws_export()
         for file in files:
-            cmd = f'bash -c "sha256sum {file_path}/{file}"'
-            try:
-                stdout, _ = ssh.safe_execute(cmd)
-            except ExecuteError:
-                continue
-            checksum = stdout.read().decode().split()[0]
-            cmd = f'bash -c "export AWS_ACCESS_KEY_ID={aws_access_key_id} ' \
-                  f'&& export AWS_SECRET_ACCESS_KEY={aws_secret_access_key} ' \
-                  f'&& export AWS_DEFAULT_REGION={aws_region} ' \
-                  f'&& aws s3 cp {file_path}/{file} ' \
-                  f's3://{settings.bucket}/{timestamp_name}/ --metadata sha256={checksum}"'
-            stdout, _ = ssh.safe_execute(cmd)
-            logging.info(stdout.read().decode())
-            logging.info('Uploaded')
+            for path, checksum, size in self.remote_checksums(ssh, file_path, file):
+                registry.set('alcib_artifact_size_bytes', size,
+                             artifact=re.sub(r'\d{8}', '', os.path.basename(path)))
+                if settings.delta_transfer and path.endswith('.qcow2'):
+                    # download_qcow falls back to the full object without
+                    # an index, so a failed push doesn't fail the upload
+                    try:
+                        self.delta_push(ssh, path, cmd_export)
+                    except ExecuteError as error:
+                        logging.warning('Delta push of %s failed: %s', path, error)
+                cmd = f'bash -c "{cmd_export} ' \
+                      f'&& aws s3 cp {path} ' \
+                      f's3://{settings.bucket}/{timestamp_name}/ --metadata sha256={checksum}"'
+                with span(f's3 upload {os.path.basename(path)}', 's3') as s3_span:
+                    stdout, _ = ssh.safe_execute(cmd)
+                    s3_span.add_bytes(size)
+                logging.info(stdout.read().decode())
+                logging.info('Uploaded')
         logging.info('Connection closed')
 
+    @traced
     def release_and_sign_stage(self, builder: Builder):
         """
         Signs and releases qcow2 image.
@@ -318,6 +797,7 @@ class BaseHypervisor:
         finally:
             shutil.rmtree(qcow_path)
 
+    @traced
     def build_stage(self, builder: Builder):
         """
         Executes packer commands to build Vagrant Box.
@@ -329,10 +809,6 @@ class BaseHypervisor:
         """
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
         cmd2 = ""
-        logging.info('Packer initialization')
-        stdout, _ = ssh.safe_execute('packer init ./cloud-images 2>&1')
-        logging.info(stdout.read().decode())
-        logging.info('Building %s', settings.image)
         build_log = f'{IMAGE}_{self.arch}_build_{DT_SUFFIX}.log'
         build_log_2 = f'{IMAGE}_{self.arch}_build_{DT_SUFFIX}_2.log'
         if settings.image == 'GenericCloud':
@@ -345,34 +821,48 @@ class BaseHypervisor:
                 cmd = self.packer_build_opennebula2.format(self.os_major_ver, build_log)
         else:
             cmd = self.packer_build_cmd.format(self.os_major_ver, build_log)
+        if settings.image == 'GenericCloud':
+            file = f'output-almalinux-{self.os_major_ver}-gencloud-{self.arch}/*.qcow2'
+            file2 = f'output-almalinux-{self.os_major_ver}-gencloud-uefi-{self.arch}/*.qcow2'
+        elif settings.image == 'OpenNebula':
+            file = f'output-almalinux-{self.os_major_ver}-opennebula-{self.arch}/*.qcow2'
+        else:
+            file = '*.box'
+        files = [build_log, file]
+        if settings.image == 'GenericCloud' and self.os_major_ver == '8' :
+            files.append(build_log_2)
+            files.append(file2)
+        logging.info('Packer initialization')
+        stdout, _ = ssh.safe_execute('packer init ./cloud-images 2>&1')
+        logging.info(stdout.read().decode())
+        cache_inputs = self.build_cache_inputs(ssh, [cmd, cmd2], [build_log, build_log_2])
+        if self.promote_cached_build(cache_inputs, ssh, self.cloud_images_path):
+            ssh.close()
+            logging.info('Connection closed')
+            return
+        logging.info('Building %s', settings.image)
         try:
-            stdout, _ = ssh.safe_execute(cmd)
-            logging.info(stdout.read().decode())
-            sftp_download(ssh, self.sftp_path, build_log, self.name)
-            if settings.image == 'GenericCloud' and self.os_major_ver == '8' :
-              stdout, _ = ssh.safe_execute(cmd2)
-              logging.info(stdout.read().decode())
-              sftp_download(ssh, self.sftp_path, build_log_2, self.name)
+            with self.resource_sampling(ssh, 'build'):
+                stdout, _ = ssh.safe_execute(cmd, **BUILD_LIMITS)
+                logging.info(stdout.read().decode())
+                sftp_download(ssh, self.sftp_path, build_log, self.name)
+                if settings.image == 'GenericCloud' and self.os_major_ver == '8' :
+                  stdout, _ = ssh.safe_execute(cmd2, **BUILD_LIMITS)
+                  logging.info(stdout.read().decode())
+                  sftp_download(ssh, self.sftp_path, build_log_2, self.name)
+            if settings.image in ['GenericCloud', 'OpenNebula']:
+                self.postprocess_qcow2(ssh, self.cloud_images_path)
             logging.info('%s built', settings.image)
         finally:
-            if settings.image == 'GenericCloud':
-                file = f'output-almalinux-{self.os_major_ver}-gencloud-{self.arch}/*.qcow2'
-                file2 = f'output-almalinux-{self.os_major_ver}-gencloud-uefi-{self.arch}/*.qcow2'
-            elif settings.image == 'OpenNebula':
-                file = f'output-almalinux-{self.os_major_ver}-opennebula-{self.arch}/*.qcow2'
-            else:
-                file = '*.box'
-            files = [build_log, file]
-            if settings.image == 'GenericCloud' and self.os_major_ver == '8' :
-                files.append(build_log_2)
-                files.append(file2)
             self.upload_to_bucket(
                 builder, files,
                 self.cloud_images_path, ssh
             )
+        self.record_cached_build(cache_inputs, ssh, self.cloud_images_path, files)
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
     def release_stage(self, builder: Builder):
         """
         Uploads vagrant box to Vagrant Cloud for the further release.
@@ -384,96 +874,162 @@ class BaseHypervisor:
         """
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
         logging.info('Creating new version for Vagrant Cloud')
-        box = f'https://app.vagrantup.com/api/v1/box/{settings.vagrant}'
         version = os.environ.get('VERSION')
         stdout, _ = ssh.safe_execute(
             f'bash -c "sha256sum {self.cloud_images_path}/*.box"'
         )
         checksum = stdout.read().decode().split()[0]
-        data = {'version': {'version': version,
-                            'description': os.environ.get('CHANGELOG')}
-                }
-        get_headers = {
-            'Authorization': f'Bearer {settings.vagrant_cloud_access_key}'
-        }
-        post_headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {settings.vagrant_cloud_access_key}'
-        }
-        response = requests.get(
-            f'{box}/version/{version}', headers=get_headers
-        )
-        if response.status_code == 404:
-            response = requests.post(
-                f'{box}/versions', headers=post_headers, data=json.dumps(data)
+        provider = PROVIDERS.get(self.name, 'libvirt')
+        vagrant_cloud = self.vagrant_cloud()
+        try:
+            vagrant_cloud.ensure_version(version, os.environ.get('CHANGELOG'))
+            logging.info('Preparing for uploading')
+            vagrant_cloud.ensure_provider(version, provider, checksum)
+            upload_path, callback = vagrant_cloud.get_upload_url(version, provider)
+            logging.info('Uploading the box')
+            stdout, _ = ssh.safe_execute(
+                f'bash -c "curl --fail --retry 5 \'{upload_path}\' --request PUT '
+                f'--upload-file {self.cloud_images_path}/*.box"'
             )
-            logging.info(response.content.decode())
-        unchanged = ['virtualbox', 'vmware_desktop', 'hyperv']
-        hypervisor = self.name if self.name in unchanged else 'libvirt'
-        logging.info('Preparing for uploading')
-        data = {
-            'provider': {
-                'name': hypervisor,
-                'checksum_type': 'sha256',
-                'checksum': checksum
-            }
-        }
-        response = requests.post(
-            f'{box}/version/{version}/providers',
-            headers=post_headers, data=json.dumps(data)
-        )
-        logging.info(response.content.decode())
-
-        response = requests.get(
-            f'{box}/version/{version}/provider/{hypervisor}/upload',
-            headers=get_headers
-        )
-        logging.info(response.content.decode())
-        upload_path = json.loads(response.content.decode()).get('upload_path')
-        logging.info('Uploading the box')
-        stdout, _ = ssh.safe_execute(
-            f'bash -c "curl {upload_path} --request PUT '
-            f'--upload-file {self.cloud_images_path}/*.box"'
-        )
-        logging.info(stdout.read().decode())
+            logging.info(stdout.read().decode())
+            if callback:
+                vagrant_cloud.complete_upload(callback)
+        finally:
+            vagrant_cloud.close()
         ssh.close()
         logging.info('Connection closed')
 
+    @staticmethod
+    def vagrant_cloud() -> VagrantCloud:
+        """
+        Gets Vagrant Cloud client of the released box.
+        """
+        return VagrantCloud(settings.vagrant, settings.vagrant_cloud_access_key,
+                            settings.vagrant_cloud_url,
+                            workers=len(PROVIDERS))
+
+    def find_release_boxes(self) -> list:
+        """
+        Finds boxes of the latest builds of every provider in S3 bucket.
+
+        Build prefixes don't include the OS major version, so builds are
+        checked from the latest one until a box of this version is found.
+
+        Returns
+        -------
+        list
+            Boxes to upload.
+        """
+        builds = collections.defaultdict(list)
+        pattern = re.compile(
+            rf'^(\d+)-{re.escape(IMAGE)}-(\w+)-{re.escape(self.arch)}-(\d{{8}})/$'
+        )
+        paginator = self.s3_bucket.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=settings.bucket, Delimiter='/'):
+            for prefix in page.get('CommonPrefixes', []):
+                match = pattern.match(prefix['Prefix'])
+                if not match or match.group(2) not in PROVIDERS:
+                    continue
+                build_id = (match.group(3), int(match.group(1)))
+                builds[match.group(2)].append((build_id, prefix['Prefix']))
+        sources = []
+        for name, prefixes in sorted(builds.items()):
+            key = self._find_box(paginator, [prefix for _, prefix in
+                                             sorted(prefixes, reverse=True)])
+            if key is None:
+                logging.warning('No AlmaLinux %s box found for %s',
+                                self.os_major_ver, name)
+                continue
+            head = self.s3_bucket.head_object(Bucket=settings.bucket, Key=key)
+            checksum = head.get('Metadata', {}).get('sha256')
+            if not checksum:
+                logging.warning('%s has no sha256 metadata, skipping', key)
+                continue
+            logging.info('Releasing %s as %s box', key, PROVIDERS[name])
+            sources.append(BoxSource(
+                provider=PROVIDERS[name],
+                size=head['ContentLength'],
+                checksum=checksum,
+                open=functools.partial(self._open_box, key),
+            ))
+        return sources
+
+    def _find_box(self, paginator, prefixes: list):
+        """
+        Finds the first box of this OS major version under the prefixes.
+        """
+        box_name = f'AlmaLinux-{self.os_major_ver}-'
+        for prefix in prefixes:
+            for page in paginator.paginate(Bucket=settings.bucket, Prefix=prefix):
+                for item in page.get('Contents', []):
+                    if item['Key'].endswith('.box') and \
+                            os.path.basename(item['Key']).startswith(box_name):
+                        return item['Key']
+        return None
+
+    def _open_box(self, key: str):
+        return self.s3_bucket.get_object(Bucket=settings.bucket, Key=key)['Body']
+
+    @traced
+    def release_all_stage(self):
+        """
+        Uploads boxes of all providers to Vagrant Cloud at once, streaming
+        them from S3 bucket.
+        """
+        sources = self.find_release_boxes()
+        if not sources:
+            raise Exception('No boxes to release found')
+        vagrant_cloud = self.vagrant_cloud()
+        try:
+            uploaded = vagrant_cloud.release_boxes(
+                os.environ.get('VERSION'), os.environ.get('CHANGELOG'), sources
+            )
+        finally:
+            vagrant_cloud.close()
+        for provider, size in uploaded.items():
+            run_metadata.record('vagrant_release', provider, size)
+
+    @traced
     def prepare_openstack(
             self, ssh, cloud_path: str, arch: str, test_path_tf: str
     ) -> str:
         """
         Prepares Openstack images for futher testing.
         """
+        steps = []
         if self.os_major_ver == '9':
             logging.info('Dirty fix to terraform test script ...')
-            stdout, _ = ssh.safe_execute(
+            steps.append(
                 f'sed -i \'s/-8-GenericCloud-8.7/-9-GenericCloud-9.1/g\' {test_path_tf}/*/{arch}/*.tf 2>&1 && '
                 f'sed -i \'s/AlmaLinux OS 8.7/AlmaLinux OS 9.1/g\' {test_path_tf}/*/{arch}/*.tf 2>&1'
             )
-            logging.info(stdout.read().decode())
-        logging.info('Uploading openstack image')
-        stdout, _ = ssh.safe_execute(
+        logging.info('Uploading openstack image and creating test instances')
+        steps.append(
             f'cp '
             f'{cloud_path}/output-almalinux-{self.os_major_ver}-gencloud-{self.arch}/*.qcow2 '
             f'{test_path_tf}/upload_image/{arch}/'
         )
-        logging.info(stdout.read().decode())
         terraform_commands = ['terraform init', 'terraform fmt',
                               'terraform validate',
                               'terraform apply --auto-approve']
-        for command in terraform_commands:
-            stdout, _ = ssh.safe_execute(
-                f'cd {test_path_tf}/upload_image/{arch}/ && {command}'
+        for tf_dir in ['upload_image', 'launch_test_instances']:
+            steps.extend(
+                f'cd {test_path_tf}/{tf_dir}/{arch}/ && {command}'
+                for command in terraform_commands
             )
-            logging.info(stdout.read().decode())
-        logging.info('Creating test instances')
-        for command in terraform_commands:
-            stdout, _ = ssh.safe_execute(
-                f'cd {test_path_tf}/launch_test_instances/{arch}/ && {command}'
+        for result in ssh.safe_execute_batch(steps, **TERRAFORM_LIMITS):
+            logging.info(result.output)
+        instances_dir = f'{test_path_tf}/launch_test_instances/{arch}'
+        for host in TEST_HOSTS:
+            # Instances accept SSH connections once cloud-init is done
+            retry_call(
+                ssh.safe_execute,
+                f'cd {instances_dir} && ssh -F ssh-config -o BatchMode=yes '
+                f'-o ConnectTimeout=10 -o StrictHostKeyChecking=no '
+                f'-o UserKnownHostsFile=/dev/null {host} true',
+                operation=f'{host} boot', policy=POLICIES['boot'],
+                classifier=lambda error: isinstance(error, ExecuteError)
             )
-            logging.info(stdout.read().decode())
-        time.sleep(120)
         logging.info('Test instances are ready')
         logging.info('Starting testing')
         return f'genericcloud_test_{DT_SUFFIX}.log'
@@ -484,6 +1040,21 @@ class LinuxHypervisors(BaseHypervisor):
     Stages for Linux instances.
     """
 
+    # Whether the vagrant provider brings machines up in parallel itself
+    vagrant_parallel = True
+
+    def vagrant_up_command(self) -> str:
+        """
+        Makes a command bringing all test machines up.
+
+        Providers which can't do it in parallel bring machines up one by
+        one. The output is machine readable to time every machine.
+        """
+        if self.vagrant_parallel:
+            return 'vagrant up --parallel --machine-readable'
+        return 'vagrant up --machine-readable'
+
+    @traced
     def init_stage(self, builder: Builder):
         """
         Creates and provisions AWS Instance.
@@ -521,10 +1092,12 @@ class LinuxHypervisors(BaseHypervisor):
         playbook = 'configure_aws_instance.yml'
         if settings.image == 'Docker':
             playbook = 'configure_docker.yml'
+        import ansible_runner
         ansible_runner.interface.run(project_dir='./ansible',
                                      playbook=playbook,
                                      inventory=inv)
 
+    @traced
     def test_stage(self, builder: Builder):
         """
         Runs testinfra tests for vagrant box and uploads its log to S3 bucket.
@@ -536,13 +1109,24 @@ class LinuxHypervisors(BaseHypervisor):
         """
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
         logging.info('Preparing to test')
+        box_name = f'almalinux-{self.os_major_ver}-test'
+        ssh.safe_execute_batch([
+            f'cp {self.cloud_images_path}/tests/vagrant/Vagrantfile '
+            f'{self.cloud_images_path}/',
+            f'vagrant box add --force --name {box_name} '
+            f'{self.cloud_images_path}/*.box',
+        ])
         stdout, _ = ssh.safe_execute(
             f'cd {self.cloud_images_path}/ '
-            f'&& cp {self.cloud_images_path}/tests/vagrant/Vagrantfile . '
             f'&& export OS_MAJOR_VER={self.os_major_ver} '
-            f'&& vagrant box add --name almalinux-{self.os_major_ver}-test *.box && vagrant up'
+            f'&& {self.vagrant_up_command()}', **VAGRANT_UP_LIMITS
         )
-        logging.info(stdout.read().decode())
+        messages, timings = parse_vagrant_output(stdout.read().decode())
+        logging.info(messages)
+        for host, seconds in sorted(timings.items()):
+            logging.info('%s is up in %ds', host, seconds)
+            registry.set('alcib_vagrant_up_seconds', seconds, vm=host)
+            run_metadata.record('vagrant_up', host, seconds)
         logging.info('Prepared for test')
         stdout, _ = ssh.safe_execute(
             f'cd {self.cloud_images_path}/ && '
@@ -553,13 +1137,14 @@ class LinuxHypervisors(BaseHypervisor):
         vb_test_log = f'vagrant_box_test_{DT_SUFFIX}.log'
         try:
             stdout, _ = ssh.safe_execute(
-                f'cd {self.cloud_images_path}/ '
-                f'&& py.test -v --hosts=almalinux-test-1,almalinux-test-2 '
-                f'--ssh-config=.vagrant/ssh-config '
-                f'{self.cloud_images_path}/tests/vagrant/test_vagrant.py '
-                f'2>&1 | tee ./{vb_test_log}')
+                f'cd {self.cloud_images_path}/ && ' + self.testinfra_command(
+                    '.vagrant/ssh-config',
+                    f'{self.cloud_images_path}/tests/vagrant/test_vagrant.py',
+                    vb_test_log
+                ), **TEST_LIMITS)
             logging.info(stdout.read().decode())
             sftp_download(ssh, self.cloud_images_path, vb_test_log, self.name)
+            self.collect_test_report(ssh, self.cloud_images_path, vb_test_log)
             logging.info('Tested')
         finally:
             self.upload_to_bucket(
@@ -568,6 +1153,128 @@ class LinuxHypervisors(BaseHypervisor):
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
+    def docker_conf_changed(self, ssh, manifest_path: str) -> bool:
+        """
+        Checks if a rebuilt rootfs would get a different package set.
+
+        The latest available versions of the committed manifest packages
+        are resolved with dnf on the builder host from the upstream
+        repositories the rootfs is built from, not the host ones. If none
+        of them has an update, the dependency closure and so the rootfs
+        stay the same.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        manifest_path : str
+            Path to the committed rpm-packages manifest.
+
+        Returns
+        -------
+        bool
+            False if the manifest would stay the same.
+        """
+        try:
+            stdout, _ = ssh.safe_execute(f'cat {manifest_path}')
+            committed = load_manifest(stdout.read().decode())
+            names = sorted({package.name for package in committed})
+            if not names:
+                return True
+            repos = ' '.join(
+                f'--repofrompath={repo},{REPO_URL.format(self.os_major_ver, repo, self.arch)} '
+                f'--repo={repo}'
+                for repo in REPOSITORIES
+            )
+            stdout, _ = ssh.safe_execute(
+                f'dnf repoquery --quiet --latest-limit=1 '
+                f'--setopt=reposdir=/dev/null {repos} '
+                f'--releasever={self.os_major_ver} --arch={self.arch},noarch '
+                f'--qf \'%{{name}}-%{{version}}-%{{release}}.%{{arch}}\' '
+                + ' '.join(names)
+            )
+        except ExecuteError as error:
+            logging.info('Package set is not resolved, rebuilding: %s', error)
+            return True
+        diff = diff_manifests(committed, load_manifest(stdout.read().decode()))
+        changed = [change.new for change in diff.upgraded + diff.downgraded] + diff.added
+        # Packages which are not available anymore are changes too
+        changed.extend(diff.removed)
+        if changed:
+            logging.info('%s: %d packages changed: %s', manifest_path, len(changed),
+                         ', '.join(f'{package.name}-{package.version}-{package.release}'
+                                   for package in changed))
+        return bool(changed)
+
+    @traced
+    def rootfs_compression(self, ssh, tarball: str):
+        """
+        Records compression ratio of a rootfs tarball. If DOCKER_ZSTD_LEVEL
+        is set, makes its zstd copy and compares decompression times.
+
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client of the builder host.
+        tarball : str
+            Remote path to rootfs tar.xz.
+
+        Returns
+        -------
+        str or None
+            Remote path to rootfs tar.zst.
+        """
+        zstd_file = None
+        cmd = (
+            f'f={tarball} && '
+            f'xz --robot --list "$f" | awk \'$1 == "totals" {{print "ROOTFS xz", $4, $5}}\''
+        )
+        if settings.docker_zstd_level:
+            zstd_file = tarball[:-len('.xz')] + '.zst'
+            cmd += (
+                f' && start=$(date +%s.%N) && xz -dc -T0 "$f" > /dev/null && '
+                f'echo "ROOTFS xz_decompress $start $(date +%s.%N)"'
+                f' && start=$(date +%s.%N) && '
+                f'xz -dc -T0 "$f" | zstd -q -f -T0 -{settings.docker_zstd_level} -o {zstd_file} && '
+                f'echo "ROOTFS zstd_compress $start $(date +%s.%N)" && '
+                f'echo "ROOTFS zstd $(stat -L -c %s {zstd_file})" && '
+                f'start=$(date +%s.%N) && zstd -dc -T0 {zstd_file} > /dev/null && '
+                f'echo "ROOTFS zstd_decompress $start $(date +%s.%N)"'
+            )
+        stdout, _ = ssh.safe_execute(cmd)
+        values = {}
+        for line in stdout.read().decode().splitlines():
+            if line.startswith('ROOTFS '):
+                fields = line.split()
+                values[fields[1]] = [float(value) for value in fields[2:]]
+        compressed, uncompressed = values['xz']
+        stats = {'uncompressed_size': int(uncompressed), 'xz': {
+            'size': int(compressed),
+            'ratio': round(uncompressed / compressed, 2),
+        }}
+        if zstd_file:
+            stats['xz']['decompress_seconds'] = round(
+                values['xz_decompress'][1] - values['xz_decompress'][0], 1
+            )
+            # The zstd pipeline also decompresses xz, its time is excluded
+            compress = values['zstd_compress'][1] - values['zstd_compress'][0]
+            stats['zstd'] = {
+                'size': int(values['zstd'][0]),
+                'ratio': round(uncompressed / values['zstd'][0], 2),
+                'compress_seconds': round(
+                    max(compress - stats['xz']['decompress_seconds'], 0), 1
+                ),
+                'decompress_seconds': round(values['zstd_decompress'][1] - values['zstd_decompress'][0], 1),
+            }
+        for name in ('xz', 'zstd'):
+            if name in stats:
+                logging.info('%s %s: ratio %.2f, %s', os.path.basename(tarball), name,
+                             stats[name]['ratio'], stats[name])
+        run_metadata.record('rootfs_compression', os.path.basename(tarball), stats)
+        return zstd_file
+
+    @traced
     def build_docker_stage(self, builder: Builder):
         """
         Executes packer commands to build Vagrant Box.
@@ -591,28 +1298,29 @@ class LinuxHypervisors(BaseHypervisor):
             'Accept': 'application/vnd.github.v3+json',
         }
         repo = 'https://api.github.com/repos/AlmaLinux/docker-images'
-        response = requests.post(
-            f'{repo}/merge-upstream',
+        response = http_request(
+            'POST', f'{repo}/merge-upstream', operation='github',
             headers=headers, data='{"branch":"master"}'
         )
-        logging.info(response.status_code, response.content.decode())
+        logging.info('%s %s', response.status_code, response.content.decode())
         stdout, _ = ssh.safe_execute(
             f'mkdir /home/{user}/.aws/ && mkdir {docker_tmp} && '
             f'sudo chown -R {user}:{user} {docker_tmp} && '
             f'sudo chown -R {user}:{user} {docker_images} && '
             f'sudo chown -R {user}:{user} /home/{user}/.aws/'
         )
-        sftp = ssh.open_sftp()
-        sftp.put(str(builder.AWS_KEY_PATH.absolute()), f'/home/{user}/aws_test')
-        sftp.putfo(StringIO(builder.SSH_CONFIG), f'/home/{user}/.ssh/config')
-        sftp.putfo(StringIO(builder.AWS_CREDENTIALS), f'/home/{user}/.aws/credentials')
-        sftp.putfo(StringIO(builder.AWS_CONFIG), f'/home/{user}/.aws/config')
+        upload_many(ssh, [
+            (str(builder.AWS_KEY_PATH.absolute()), f'/home/{user}/aws_test'),
+            (StringIO(builder.SSH_CONFIG), f'/home/{user}/.ssh/config'),
+            (StringIO(builder.AWS_CREDENTIALS), f'/home/{user}/.aws/credentials'),
+            (StringIO(builder.AWS_CONFIG), f'/home/{user}/.aws/config'),
+        ])
         logging.info('%s built', settings.image)
         repo = 'https://api.github.com/repos/AlmaLinux/docker-images'
         branches = get_git_branches(headers, repo)
         branch = branches[-1]
-        requests.post(
-            f'{repo}/merge-upstream',
+        http_request(
+            'POST', f'{repo}/merge-upstream', operation='github',
             headers=headers, data='{"branch":"master"}'
         )
         stdout, _ = ssh.safe_execute(
@@ -623,15 +1331,22 @@ class LinuxHypervisors(BaseHypervisor):
             f'git config --global user.name "Mariia Boldyreva" && '
             f'git config --global user.email "shelterly@gmail.com"'
         )
+        self.changed_docker_confs = []
         for conf in docker_list:
+            if not self.docker_conf_changed(ssh, f'{docker_tmp}rpm-packages-{conf}'):
+                logging.info('Docker Image %s is up to date, skipped', conf)
+                continue
+            self.changed_docker_confs.append(conf)
             stdout, _ = ssh.safe_execute(
                 f'cd {docker_images} && git reset --hard && git checkout master && git pull'
             )
             build_log = f'{IMAGE}_{conf}_{self.arch}_build_{DT_SUFFIX}.log'
             try:
+                # Multi-block xz is compressed and decompressed by all cores
                 stdout, _ = ssh.safe_execute(
                     f'cd {docker_images} && '
-                    f'sudo ./build.sh -o {conf} -t {conf} 2>&1 | tee ./{build_log}'
+                    f'sudo env XZ_OPT="{settings.docker_xz_opt}" '
+                    f'./build.sh -o {conf} -t {conf} 2>&1 | tee ./{build_log}'
                 )
                 sftp_download(
                     ssh, docker_images,
@@ -644,22 +1359,52 @@ class LinuxHypervisors(BaseHypervisor):
                     f'{conf}_{self.arch}-{conf}/rpm-packages-{self.arch}-{conf}',
                     f'{conf}_{self.arch}-{conf}/almalinux-{self.os_major_ver}-docker-{self.arch}-{conf}.tar.xz'
                 ]
-                self.upload_to_bucket(builder, files, docker_images, ssh)
-                for file in files:
-                    stdout, _ = ssh.safe_execute(
-                        f'cp {docker_images}{file} {docker_tmp}'
-                    )
-                stdout, _ = ssh.safe_execute(
+                zstd_file = self.rootfs_compression(ssh, f'{docker_images}{files[-1]}')
+                # zstd rootfs is an extra artifact, the repository keeps tar.xz
+                extra = [zstd_file.replace(docker_images, '', 1)] if zstd_file else []
+                self.upload_to_bucket(builder, files + extra, docker_images, ssh)
+                steps = [f'cp {docker_images}{file} {docker_tmp}' for file in files]
+                steps.append(
                     f'mv {docker_tmp}rpm-packages-{self.arch}-{conf} '
                     f'{docker_tmp}rpm-packages-{conf}'
                 )
+                ssh.safe_execute_batch(steps)
             finally:
                 logging.info(f'Docker Image {conf} built')
         ssh.close()
         logging.info('Connection closed')
 
+    def docker_rpm_query(self, ssh, user: str, root: str, tarball: str) -> str:
+        """
+        Unpacks the rpm database of a docker rootfs tarball.
+
+        Only the database is extracted and read with the host rpm. If the
+        host rpm can't read it, as its database backend may differ, the
+        whole rootfs is extracted and its own rpm runs in a chroot.
+
+        Returns
+        -------
+        str
+            rpm command querying the rootfs database.
+        """
+        dbpath = 'usr/lib/sysimage/rpm' if int(self.os_major_ver) >= 10 else 'var/lib/rpm'
+        extract = f'tar --use-compress-program="xz -dc -T0" -xf {tarball} -C {root}'
+        ssh.safe_execute(
+            f'mkdir {root}/ && sudo chown -R {user}:{user} {root}/ && '
+            f'{extract} --wildcards \'*{dbpath}/*\''
+        )
+        rpm_query = f'rpm --dbpath {root}/{dbpath}'
+        try:
+            ssh.safe_execute(f'{rpm_query} -q rpm')
+            return rpm_query
+        except ExecuteError:
+            logging.info('Host rpm can\'t read %s database, extracting rootfs', tarball)
+        ssh.safe_execute(extract)
+        return f'sudo chroot {root}/ rpm'
+
+    @traced
     def create_docker_branch(self, builder):
-        docker_list = settings.docker_configuration.split(',')
+        docker_list = list(self.changed_docker_confs)
         text = [f'Updates AlmaLinux 8.5 {self.arch} {", ".join(docker_list)} rootfs']
         if self.arch == 'ppc64le':
             user = 'alcib'
@@ -667,47 +1412,42 @@ class LinuxHypervisors(BaseHypervisor):
         else:
             user = 'ec2-user'
             ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
-        docker_tmp = '/home/{user}/docker-tmp/'
+        docker_tmp = f'/home/{user}/docker-tmp/'
         if 'micro' in docker_list:
             docker_list.remove('micro')
         for conf in docker_list:
-            stdout, _ = ssh.safe_execute(
-                f"cd {docker_tmp} && git diff --unified=0 "
-                f"{docker_tmp}rpm-packages-{conf} | grep '^[+|-][^+|-]' || true"
-            )
-            packages = stdout.read().decode()
-            packages = packages.split('\n')
-            stdout, _ = ssh.safe_execute(
-                f'mkdir {docker_tmp}fake-root-{conf}/ && '
-                f'sudo chown -R {user}:{user} {docker_tmp}fake-root-{conf}/ && '
-                f'tar -xvf {docker_tmp}almalinux-{self.os_major_ver}-docker-{self.arch}-{conf}.tar.xz -C {docker_tmp}fake-root-{conf}'
-            )
-            raw_packages = list(filter(None, packages))
-            packages = collections.defaultdict(dict)
-            for raw_package in raw_packages:
-                sign, raw_package = raw_package[0], raw_package[1:]
-                package = parse_package(raw_package)
-                packages[package.name][sign] = package
-                if sign == '+':
-                    changelog, _ = ssh.safe_execute(
-                        f'sudo chroot {docker_tmp}fake-root-{conf}/ rpm -q --changelog {package.name}'
-                    )
-                    packages[package.name]['changelog'] = changelog.read().decode()
-            for pkg in packages.values():
-                if '+' not in pkg or '-' not in pkg:
-                    continue
-                added = pkg['+']
-                removed = pkg['-']
-                header = f'- {added.name} upgraded from {removed.version}-{removed.release} to {added.version}-{added.release}'
+            committed, current = ssh.safe_execute_batch([
+                f'cd {docker_tmp} && git show HEAD:rpm-packages-{conf} || true',
+                f'cat {docker_tmp}rpm-packages-{conf}',
+            ])
+            diff = diff_manifests(load_manifest(committed.output),
+                                  load_manifest(current.output))
+            logging.info('%s: %d added, %d removed, %d upgraded, %d downgraded',
+                         conf, len(diff.added), len(diff.removed),
+                         len(diff.upgraded), len(diff.downgraded))
+            changes = [(change, 'upgraded') for change in diff.upgraded]
+            changes.extend((change, 'downgraded') for change in diff.downgraded)
+            rpm_query = self.docker_rpm_query(
+                ssh, user, f'{docker_tmp}fake-root-{conf}',
+                f'{docker_tmp}almalinux-{self.os_major_ver}-docker-{self.arch}-{conf}.tar.xz'
+            ) if changes else None
+            changelogs = ssh.safe_execute_batch([
+                f'{rpm_query} -q --changelog {change.new.name}'
+                for change, _ in changes
+            ]) if changes else []
+            for (change, action), changelog in zip(changes, changelogs):
+                added, removed = change.new, change.old
+                clean_release = re.sub(r'\.el\d*', '', removed.release)
+                header = f'- {added.name} {action} from {removed.version}-{removed.release} to {added.version}-{added.release}'
                 cve_list = []
-                for changelog_record in pkg['changelog'].split('\n\n'):
+                for changelog_record in changelog.output.split('\n\n'):
                     changelog_record = changelog_record.strip()
                     if not changelog_record:
                         continue
                     version_str = changelog_record.split('\n')[0].split()[-1]
                     # Remove epoch from version, since we don't know it for removed package
                     version_str = re.sub('^\d+:', '', version_str)
-                    if f'{removed.version}-{removed.clean_release}' == version_str:
+                    if f'{removed.version}-{clean_release}' == version_str:
                         break
                     if f'{removed.version}-{removed.release}' == version_str:
                         break
@@ -725,12 +1465,12 @@ class LinuxHypervisors(BaseHypervisor):
             f'git checkout al-{settings.almalinux}-{TIMESTAMP} && git pull'
         )
         logging.info(stdout.read().decode())
-        for conf in docker_list:
-            stdout, _ = ssh.safe_execute(
-                f'cp {docker_tmp}{conf}_{self.arch}-{conf}/Dockerfile-{self.arch}-{conf} {docker_tmp} && '
-                f'cp {docker_tmp}{conf}_{self.arch}-{conf}/rpm-packages-{self.arch}-{conf} {docker_tmp}rpm-packages-{conf} && '
-                f'cp {docker_tmp}{conf}_{self.arch}-{conf}/almalinux-{self.os_major_ver}-docker-{self.arch}-{conf}.tar.xz {docker_tmp}'
-            )
+        ssh.safe_execute_batch([
+            f'cp {docker_tmp}{conf}_{self.arch}-{conf}/Dockerfile-{self.arch}-{conf} {docker_tmp} && '
+            f'cp {docker_tmp}{conf}_{self.arch}-{conf}/rpm-packages-{self.arch}-{conf} {docker_tmp}rpm-packages-{conf} && '
+            f'cp {docker_tmp}{conf}_{self.arch}-{conf}/almalinux-{self.os_major_ver}-docker-{self.arch}-{conf}.tar.xz {docker_tmp}'
+            for conf in docker_list
+        ])
         stdout, _ = ssh.safe_execute(
             f'cd /home/{user}/docker-tmp/ && '
             f'git add Dockerfile-{self.arch}* rpm-packages* *.tar.xz '
@@ -740,6 +1480,7 @@ class LinuxHypervisors(BaseHypervisor):
         logging.info(commit_msg)
 
     @staticmethod
+    @traced
     def clear_ppc64le_host(self, builder):
         ssh = builder.ssh_remote_connect(settings.ppc64le_host, 'alcib', 'PPC64LE')
         cmd = 'sudo rm -rf /home/alcib/docker-images && sudo rm -rf /home/alcib/*-tmp && sudo rm -rf /home/alcib/.aws'
@@ -755,6 +1496,7 @@ class HyperV(BaseHypervisor):
     """
     cloud_images_path = '/mnt/c/Users/Administrator/cloud-images'
     sftp_path = 'c:\\Users\\Administrator\\cloud-images\\'
+    supports_resource_sampling = False
     packer_build_cmd = (
         'cd c:\\Users\\Administrator\\cloud-images ; '
         'packer build -var hyperv_switch_name=\"HyperV-vSwitch\" '
@@ -768,6 +1510,26 @@ class HyperV(BaseHypervisor):
         """
         super().__init__('hyperv', arch)
 
+    def testinfra_command(self, ssh_config: str, script: str, test_log: str) -> str:
+        """
+        Makes a PowerShell command running testinfra tests on every test
+        host in its own background job.
+        """
+        hosts = ', '.join(f"'{host}'" for host in TEST_HOSTS)
+        junit = self.junit_name(test_log, '$testHost')
+        logs = ', '.join(f'{test_log}.{host}' for host in TEST_HOSTS)
+        return (
+            f'$shards = @({hosts}) | ForEach-Object {{ '
+            f'Start-Job -ArgumentList $_, $PWD.Path -ScriptBlock {{ '
+            f'param($testHost, $dir) Set-Location $dir ; '
+            f'py.test -v --hosts=$testHost --ssh-config={ssh_config} '
+            f'--junitxml="$dir\\{junit}" {script} *>&1 '
+            f'| Out-File -FilePath "$dir\\{test_log}.$testHost" }} }} ; '
+            f'$shards | Wait-Job | Remove-Job ; '
+            f'Get-Content {logs} | Tee-Object -FilePath {self.sftp_path}{test_log}'
+        )
+
+    @traced
     def init_stage(self, builder: Builder):
         """
         Creates and provisions AWS Instance.
@@ -801,11 +1563,13 @@ class HyperV(BaseHypervisor):
         logging.info('Running Ansible')
         playbook = 'configure_aws_instance.yml'
         execute_command('ansible-galaxy install -r ./ansible/requirements.yaml', os.getcwd())
+        import ansible_runner
         ansible_runner.interface.run(project_dir='./ansible',
                                      playbook=playbook,
                                      inventory=inv)
 
 
+    @traced
     def test_stage(self, builder: Builder):
         """
         Runs testinfra tests for vagrant box and uploads its log to S3 bucket.
@@ -825,7 +1589,7 @@ class HyperV(BaseHypervisor):
                 str(os.environ.get('WINDOWS_CREDS_PSW')),
                 str(self.os_major_ver)
                 )
-        stdout, _ = ssh.safe_execute(cmd)
+        stdout, _ = ssh.safe_execute(cmd, **VAGRANT_UP_LIMITS)
         logging.info(stdout.read().decode())
         logging.info('Prepared for test')
         stdout, _ = ssh.safe_execute(
@@ -837,14 +1601,14 @@ class HyperV(BaseHypervisor):
         vb_test_log = f'vagrant_box_test_{DT_SUFFIX}.log'
         try:
             stdout, _ = ssh.safe_execute(
-                f'cd {self.sftp_path} ; '
-                f'py.test -v --hosts=almalinux-test-1,almalinux-test-2 '
-                f'--ssh-config=.vagrant/ssh-config '
-                f'{self.sftp_path}tests\\vagrant\\test_vagrant.py '
-                f'| Out-File -FilePath {self.sftp_path}{vb_test_log}'
-            )
+                f'cd {self.sftp_path} ; ' + self.testinfra_command(
+                    '.vagrant/ssh-config',
+                    f'{self.sftp_path}tests\\vagrant\\test_vagrant.py',
+                    vb_test_log
+                ), **TEST_LIMITS)
             logging.info(stdout.read().decode())
             sftp_download(ssh, self.sftp_path, vb_test_log, self.name)
+            self.collect_test_report(ssh, self.sftp_path, vb_test_log)
             logging.info('Tested')
         finally:
             self.upload_to_bucket(
@@ -862,6 +1626,7 @@ class VirtualBox(LinuxHypervisors):
         'cd cloud-images && packer build -only=virtualbox-iso.almalinux-{} . '
         '2>&1 | tee ./{}'
     )
+    vagrant_parallel = False
 
     def __init__(self, arch):
         """
@@ -924,37 +1689,24 @@ class KVM(LinuxHypervisors):
         """
         super().__init__(name, arch)
 
+    @traced
     def publish_ami(self, builder: Builder):
         """
         Prepare AMI files for publishing.
         """
         with open(f'ami_id_{self.arch}.txt', 'r') as ami_file:
-            ami_id = ami_file.read()
-        ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
+            ami_id = ami_file.read().strip()
+        copies = AmiMirror().mirror(ami_id)
         logging.info('Preparing csv and md')
-        cmd = "cd {}/ && " \
-              "export AWS_DEFAULT_REGION='us-east-1' && " \
-              "export AWS_ACCESS_KEY_ID='{}' " \
-              "&& export AWS_SECRET_ACCESS_KEY='{}' " \
-              "&& {}/bin/aws_ami_mirror.py " \
-              "-a {} --csv-output aws_amis-{}.csv " \
-              "--md-output AWS_AMIS-{}.md --verbose".format(
-                  self.cloud_images_path,
-                  os.getenv('AWS_ACCESS_KEY_ID'),
-                  os.getenv('AWS_SECRET_ACCESS_KEY'),
-                  self.cloud_images_path,
-                  ami_id, self.arch, self.arch)
-        stdout, _ = ssh.safe_execute(cmd)
-        logging.info(stdout.read().decode())
-        self.upload_to_bucket(
-            builder,
-            [f'aws_amis-{self.arch}.csv', f'AWS_AMIS-{self.arch}.md'],
-            self.cloud_images_path, ssh
-        )
-        sftp_download(ssh, self.sftp_path, f'aws_amis-{self.arch}.csv', self.name)
-        sftp_download(ssh, self.sftp_path, f'AWS_AMIS-{self.arch}.md', self.name)
-        ssh.close()
-
+        csv_path = f'aws_amis-{self.arch}.csv'
+        md_path = f'AWS_AMIS-{self.arch}.md'
+        write_catalog(copies, csv_path, md_path)
+        for path in (csv_path, md_path):
+            self.upload_artifact(path)
+        upload_release(self.s3_bucket, settings.bucket,
+                       settings.ami_catalog_prefix, copies)
+
+    @traced
     def build_aws_stage(self, builder: Builder, arch: str):
         """
         Builds new AWS EC2 instance.
@@ -1009,7 +1761,8 @@ class KVM(LinuxHypervisors):
                     os.getenv('AWS_SECRET_ACCESS_KEY'),
                     self.os_major_ver, arch, aws_build_log)
         try:
-            stdout, _ = ssh.safe_execute(cmd)
+            with self.resource_sampling(ssh, 'build_aws'):
+                stdout, _ = ssh.safe_execute(cmd, **BUILD_LIMITS)
         finally:
             self.upload_to_bucket(
                 builder, [aws_build_log], self.cloud_images_path, ssh
@@ -1022,8 +1775,8 @@ class KVM(LinuxHypervisors):
                                     'terraform.tfvars.json')
         with open(tf_vars_file, 'w') as tf_file_fd:
             json.dump(tfvars, tf_file_fd)
-        sftp = ssh.open_sftp()
-        sftp.get(
+        download(
+            ssh.get_sftp(),
             os.path.join(self.cloud_images_path,
                          'build-tools-on-ec2-userdata.yml'),
             os.path.join(aws_hypervisor.terraform_dir,
@@ -1032,6 +1785,7 @@ class KVM(LinuxHypervisors):
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
     def test_aws_stage(self, builder: Builder):
         """
         builder: Builder
@@ -1040,7 +1794,7 @@ class KVM(LinuxHypervisors):
         Runs Testinfra tests for AWS AMI.
         """
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
-        sftp = ssh.open_sftp()
+        sftp = ssh.get_sftp()
         sftp.put(str(builder.AWS_KEY_PATH.absolute()),
                  '/home/ec2-user/.ssh/alcib_rsa4096')
         ssh.safe_execute(
@@ -1061,9 +1815,10 @@ class KVM(LinuxHypervisors):
             'mkdir /home/ec2-user/.aws/ && '
             'sudo chown -R ec2-user:ec2-user /home/ec2-user/.aws/'
         )
-        sftp = ssh.open_sftp()
-        sftp.putfo(StringIO(builder.AWS_CREDENTIALS), '/home/ec2-user/.aws/credentials')
-        sftp.putfo(StringIO(builder.AWS_CONFIG), '/home/ec2-user/.aws/config')
+        upload_many(ssh, [
+            (StringIO(builder.AWS_CREDENTIALS), '/home/ec2-user/.aws/credentials'),
+            (StringIO(builder.AWS_CONFIG), '/home/ec2-user/.aws/config'),
+        ])
         cmd_export = \
             "export AWS_DEFAULT_REGION='us-east-1' && " \
             "export AWS_ACCESS_KEY_ID='{}' && " \
@@ -1072,17 +1827,16 @@ class KVM(LinuxHypervisors):
                 os.getenv('AWS_SECRET_ACCESS_KEY'))
         terraform_commands = ['terraform init', 'terraform fmt',
                               'terraform validate',
-                              f'{cmd_export} && terraform plan && terraform apply --auto-approve']
-        for command in terraform_commands:
-            stdout, _ = ssh.safe_execute(
-                f'cd {test_path_tf} && {command}'
-            )
-            logging.info(stdout.read().decode())
-        logging.info('Checking if test instances are ready')
-        stdout, _ = ssh.safe_execute(
-            f'cd {test_path_tf} && {cmd_export} && terraform output --json'
+                              f'{cmd_export} && terraform plan && terraform apply --auto-approve',
+                              f'{cmd_export} && terraform output --json']
+        results = ssh.safe_execute_batch(
+            [f'cd {test_path_tf} && {command}' for command in terraform_commands],
+            **TERRAFORM_LIMITS
         )
-        output = stdout.read().decode()
+        for result in results[:-1]:
+            logging.info(result.output)
+        logging.info('Checking if test instances are ready')
+        output = results[-1].output
         logging.info(output)
         output_json = json.loads(output)
         self.wait_instance_ready([output_json['instance_id1']['value'],
@@ -1091,13 +1845,13 @@ class KVM(LinuxHypervisors):
         aws_test_log = f'aws_ami_test_{DT_SUFFIX}.log'
         try:
             stdout, _ = ssh.safe_execute(
-                f'cd {self.cloud_images_path} && '
-                f'py.test -v --hosts=almalinux-test-1,almalinux-test-2 '
-                f'--ssh-config={test_path_tf}/ssh-config '
-                f'{self.cloud_images_path}/tests/ami/test_ami.py '
-                f'2>&1 | tee ./{aws_test_log}'
-            )
+                f'cd {self.cloud_images_path} && ' + self.testinfra_command(
+                    f'{test_path_tf}/ssh-config',
+                    f'{self.cloud_images_path}/tests/ami/test_ami.py',
+                    aws_test_log
+                ), **TEST_LIMITS)
             logging.info(stdout.read().decode())
+            self.collect_test_report(ssh, self.cloud_images_path, aws_test_log)
         finally:
             self.upload_to_bucket(
                 builder, ['aws_ami_test*.log'], self.cloud_images_path, ssh
@@ -1106,12 +1860,13 @@ class KVM(LinuxHypervisors):
         logging.info('Tested')
         stdout, _ = ssh.safe_execute(
             f'cd {test_path_tf} && {cmd_export} && '
-            f'terraform destroy --auto-approve'
+            f'terraform destroy --auto-approve', **TERRAFORM_LIMITS
         )
         logging.info(stdout.read().decode())
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
     def test_openstack(self, builder: Builder):
         """
         builder: Builder
@@ -1123,7 +1878,7 @@ class KVM(LinuxHypervisors):
         content = open(yaml, 'r').read()
         yaml_content = generate_clouds(content)
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
-        sftp = ssh.open_sftp()
+        sftp = ssh.get_sftp()
         stdout, _ = ssh.safe_execute('mkdir -p /home/ec2-user/.config/openstack/')
         sftp.put(str(builder.AWS_KEY_PATH.absolute()),
                  '/home/ec2-user/.ssh/alcib_rsa4096')
@@ -1140,29 +1895,28 @@ class KVM(LinuxHypervisors):
             ssh, '/home/ec2-user/cloud-images', arch, test_path_tf
         )
         script = f'{test_path_tf}/launch_test_instances/{arch}/test_genericcloud.py'
-        cmd = f'cd {self.cloud_images_path} && ' \
-              f'py.test -v --hosts=almalinux-test-1,almalinux-test-2 ' \
-              f'--ssh-config={test_path_tf}/launch_test_instances/{arch}/ssh-config ' \
-              f'{script} 2>&1 | tee ./{gc_test_log}'
+        cmd = f'cd {self.cloud_images_path} && ' + self.testinfra_command(
+            f'{test_path_tf}/launch_test_instances/{arch}/ssh-config',
+            script, gc_test_log
+        )
         try:
-            stdout, _ = ssh.safe_execute(cmd)
+            stdout, _ = ssh.safe_execute(cmd, **TEST_LIMITS)
             logging.info(stdout.read().decode())
+            self.collect_test_report(ssh, self.cloud_images_path, gc_test_log)
         finally:
             self.upload_to_bucket(
                 builder, ['genericcloud_test*.log'], self.cloud_images_path, ssh
             )
             sftp_download(ssh, self.cloud_images_path, gc_test_log, self.arch)
             logging.info('Tested')
-            stdout, _ = ssh.safe_execute(
+            results = ssh.safe_execute_batch([
                 f'cd {test_path_tf}/launch_test_instances/{arch}/ && '
-                f'terraform destroy --auto-approve'
-            )
-            logging.info(stdout.read().decode())
-            stdout, _ = ssh.safe_execute(
+                f'terraform destroy --auto-approve',
                 f'cd {test_path_tf}/upload_image/{arch}/ && '
                 f'terraform destroy --auto-approve'
-            )
-            logging.info(stdout.read().decode())
+            ], **TERRAFORM_LIMITS)
+            for result in results:
+                logging.info(result.output)
         ssh.close()
         logging.info('Connection closed')
 
@@ -1175,6 +1929,7 @@ class AwsStage2(KVM):
     def __init__(self, arch):
         super().__init__('aws-stage-2', arch)
 
+    @traced
     def build_aws_stage(self, builder: Builder, arch: str):
         ssh = builder.ssh_aws_connect(self.instance_ip, self.name)
         logging.info('Packer initialization')
@@ -1185,17 +1940,18 @@ class AwsStage2(KVM):
         logging.info('Building AWS AMI')
         aws2_build_log = f'aws_ami_stage2_build_{DT_SUFFIX}.log'
         try:
-            stdout, _ = ssh.safe_execute(
-                'cd cloud-images && sudo AWS_ACCESS_KEY_ID="{}" '
-                'AWS_SECRET_ACCESS_KEY="{}" AWS_DEFAULT_REGION="us-east-1" '
-                'packer.io build -only=amazon-chroot.almalinux-{}-aws-stage2 '
-                '. 2>&1 | tee ./{}'.format(
-                    os.getenv('AWS_ACCESS_KEY_ID'),
-                    os.getenv('AWS_SECRET_ACCESS_KEY'),
-                    self.os_major_ver,
-                    aws2_build_log
+            with self.resource_sampling(ssh, 'build_aws_stage2'):
+                stdout, _ = ssh.safe_execute(
+                    'cd cloud-images && sudo AWS_ACCESS_KEY_ID="{}" '
+                    'AWS_SECRET_ACCESS_KEY="{}" AWS_DEFAULT_REGION="us-east-1" '
+                    'packer.io build -only=amazon-chroot.almalinux-{}-aws-stage2 '
+                    '. 2>&1 | tee ./{}'.format(
+                        os.getenv('AWS_ACCESS_KEY_ID'),
+                        os.getenv('AWS_SECRET_ACCESS_KEY'),
+                        self.os_major_ver,
+                        aws2_build_log
+                    ), **BUILD_LIMITS
                 )
-            )
             output = stdout.read().decode()
             logging.info(output)
             save_ami_id(output, self.arch)
@@ -1205,9 +1961,11 @@ class AwsStage2(KVM):
         stdout, _ = ssh.safe_execute(cmd)
         sftp_download(ssh, self.sftp_path, aws2_build_log, self.name)
         try:
-            self.s3_bucket.upload_file(
-                f'{self.name}-{aws2_build_log}', settings.bucket,
-                f'{self.build_number}-{IMAGE}-{self.name}-{self.arch}-{TIMESTAMP}/{aws2_build_log}')
+            with span(f's3 upload {aws2_build_log}', 's3') as s3_span:
+                self.s3_bucket.upload_file(
+                    f'{self.name}-{aws2_build_log}', settings.bucket,
+                    f'{self.bucket_path}/{aws2_build_log}')
+                s3_span.add_bytes(os.path.getsize(f'{self.name}-{aws2_build_log}'))
         except Exception as error:
             logging.exception('%s', error)
         ssh.close()
@@ -1237,7 +1995,12 @@ class Equinix(BaseHypervisor):
         """
         super().__init__(name, arch)
 
+    @property
+    def host_type(self) -> str:
+        return self.name
+
     @staticmethod
+    @traced
     def init_stage(builder: Builder):
         """
         Makes initialization of Equinix Server for the image building.
@@ -1254,33 +2017,44 @@ class Equinix(BaseHypervisor):
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
     def build_stage(self, builder: Builder):
         ssh = builder.ssh_remote_connect(settings.equinix_ip, 'jenkins', 'Equinix')
-        logging.info('Packer initialization')
-        stdout, _ = ssh.safe_execute('packer.io init cloud-images 2>&1')
-        logging.info(stdout.read().decode())
         gc_build_log = f'{IMAGE}_{self.arch}_build_{DT_SUFFIX}.log'
-        logging.info('Building %s', settings.image)
         if settings.image == 'GenericCloud':
             cmd = self.packer_build_gencloud.format(self.os_major_ver, gc_build_log)
         else:
             cmd = self.packer_build_opennebula.format(self.os_major_ver, gc_build_log)
+        if settings.image == 'GenericCloud':
+            file = 'output-almalinux-{}-gencloud-aarch64/*.qcow2'.format(self.os_major_ver)
+        else:
+            file = 'output-almalinux-{}-opennebula-aarch64/*.qcow2'.format(self.os_major_ver)
+        logging.info('Packer initialization')
+        stdout, _ = ssh.safe_execute('packer.io init cloud-images 2>&1')
+        logging.info(stdout.read().decode())
+        cache_inputs = self.build_cache_inputs(ssh, [cmd], [gc_build_log],
+                                               packer='packer.io')
+        if self.promote_cached_build(cache_inputs, ssh, 'cloud-images'):
+            ssh.close()
+            logging.info('Connection closed')
+            return
+        logging.info('Building %s', settings.image)
         try:
-            stdout, _ = ssh.safe_execute(cmd)
+            with self.resource_sampling(ssh, 'build'):
+                stdout, _ = ssh.safe_execute(cmd, **BUILD_LIMITS)
+            self.postprocess_qcow2(ssh, 'cloud-images')
         finally:
-            if settings.image == 'GenericCloud':
-                file = 'output-almalinux-{}-gencloud-aarch64/*.qcow2'.format(self.os_major_ver)
-            else:
-                file = 'output-almalinux-{}-opennebula-aarch64/*.qcow2'.format(self.os_major_ver)
             self.upload_to_bucket(
                 builder, [f'{IMAGE}_{self.arch}_build*.log', file],
                 'cloud-images/', ssh
             )
         sftp_download(ssh, 'cloud-images/', gc_build_log, self.name)
         logging.info('%s built', settings.image)
+        self.record_cached_build(cache_inputs, ssh, 'cloud-images', [file])
         ssh.close()
         logging.info('Connection closed')
 
+    @traced
     def test_openstack(self, builder: Builder):
         """
         builder: Builder
@@ -1292,7 +2066,7 @@ class Equinix(BaseHypervisor):
         content = open(yaml, 'r').read()
         yaml_content = generate_clouds(content)
         ssh = builder.ssh_remote_connect(settings.equinix_ip, 'jenkins', 'Equinix')
-        sftp = ssh.open_sftp()
+        sftp = ssh.get_sftp()
         sftp.put(str(builder.AWS_KEY_PATH.absolute()),
                  '.ssh/alcib_rsa4096')
         stdout, _ = ssh.safe_execute('sudo chmod 600 .ssh/alcib_rsa4096')
@@ -1309,27 +2083,27 @@ class Equinix(BaseHypervisor):
         script = f'{test_path_tf}/launch_test_instances/{arch}/test_genericcloud.py'
         try:
             stdout, _ = ssh.safe_execute(
-                f'cd cloud-images && '
-                f'py.test -v --hosts=almalinux-test-1,almalinux-test-2 '
-                f'--ssh-config={test_path_tf}/launch_test_instances/{arch}/ssh-config '
-                f'{script} 2>&1 | tee ./{gc_test_log}')
+                'cd cloud-images && ' + self.testinfra_command(
+                    f'{test_path_tf}/launch_test_instances/{arch}/ssh-config',
+                    script, gc_test_log
+                ), **TEST_LIMITS)
             logging.info(stdout.read().decode())
+            self.collect_test_report(ssh, 'cloud-images', gc_test_log)
         finally:
             self.upload_to_bucket(builder, [gc_test_log], 'cloud-images/', ssh)
             sftp_download(ssh, 'cloud-images/', gc_test_log, self.arch)
             logging.info('Tested')
-            stdout, _ = ssh.safe_execute(
+            ssh.safe_execute_batch([
                 f'cd {test_path_tf}/launch_test_instances/{arch}/ && '
-                f'terraform destroy --auto-approve'
-            )
-            stdout, _ = ssh.safe_execute(
+                f'terraform destroy --auto-approve',
                 f'cd {test_path_tf}/upload_image/{arch}/ && '
                 f'terraform destroy --auto-approve'
-            )
+            ], **TERRAFORM_LIMITS)
         ssh.close()
         logging.info('Connection closed')
 
     @staticmethod
+    @traced
     def teardown_equinix_stage(builder: Builder):
         """
         builder: Builder
@@ -1360,6 +2134,7 @@ class AgentHypervisor(Equinix):
         """
         super().__init__(name, arch)
 
+    @traced
     def prepare_files(self, keys_list):
         """
         Sign Preparation for staging
@@ -1382,6 +2157,7 @@ class AgentHypervisor(Equinix):
     ##    logging.info('Done ...!')
         logging.info(keys_list)
         keys = keys_list.split(",")
+        commands = []
         for key in keys:
             name = parse_for_filename(key)
             latest = generate_latest_name(name)
@@ -1390,22 +2166,21 @@ class AgentHypervisor(Equinix):
             awscmd = (f'aws s3api get-object --bucket alcib --key {key} {name} '
                 f'> ./{name}.json')
 #                f'| tee  ./{name}.json')
-            logging.info("Copy file from AWS S3 bucket")
-            shell_command(awscmd, cwd)
             shacheck= (f'A1=$(cat {name}.json | jq \'.Metadata.sha256\' '
                 f'| tr -d \'"\') && echo "$A1  {name}"  | sha256sum -c -')
-            logging.info("SHA Check for received file")
-            shell_command(shacheck, cwd)
-            logging.info("Remove json file and old symlink. Create new link ...")
             cmd_symlink = (f'rm -f {name}.json && rm -f {latest} && ln -sf {name} {latest}')
-            shell_command(cmd_symlink, cwd)
-            logging.info(f'Symlink {latest} create completed.')
+            commands.append(Command(f'{awscmd} && {shacheck} && {cmd_symlink}', cwd))
+        # Every key is fetched, checked and linked independently
+        logging.info("Copy files from AWS S3 bucket, check SHA and create new links ...")
+        run_parallel(commands, limit=4)
+        logging.info('Symlinks create completed.')
 
         gensha=f'sha256sum *.qcow2 > CHECKSUM && cat CHECKSUM'
         logging.info("Export CHECKSUM file ...")
         shell_command(gensha, cwd)
         logging.info('Exit prepare_files ...')
 
+    @traced
     def sign_prep(self, builder: AgentBuilder):
         """
         Sign Preparation for staging
@@ -1444,9 +2219,10 @@ class AgentHypervisor(Equinix):
             'pgp_keyid': f'{pgy_keyid}',
         }
         logging.info('Before request ..')
-        response = requests.post(
-            'https://build.almalinux.org/api/v1/sign-tasks/sync_sign_task/',
-            headers=headers, json=json_data)
+        response = http_request(
+            'POST', 'https://build.almalinux.org/api/v1/sign-tasks/sync_sign_task/',
+            operation='sign', headers=headers, json=json_data)
+        response.raise_for_status()
         logging.info('After request ..')
         content = json.loads(response.content.decode())
         logging.info('received content')
@@ -0,0 +1,82 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+JUnit XML reports of sharded test runs.
+"""
+
+import collections
+import logging
+import os
+import xml.etree.ElementTree as ElementTree
+
+
+__all__ = ['JunitSummary', 'merge_junit']
+
+
+JunitSummary = collections.namedtuple(
+    'junit_summary', ['tests', 'failures', 'errors', 'skipped', 'time']
+)
+
+COUNTERS = ('tests', 'failures', 'errors', 'skipped')
+
+
+def _suites(path: str) -> list:
+    root = ElementTree.parse(path).getroot()
+    # pytest writes testsuites since 5.1 and a single testsuite before
+    return [root] if root.tag == 'testsuite' else root.findall('testsuite')
+
+
+def _missing_suite(shard: str, path: str) -> ElementTree.Element:
+    suite = ElementTree.Element('testsuite', name=shard, tests='1', failures='0',
+                                errors='1', skipped='0', time='0')
+    case = ElementTree.SubElement(suite, 'testcase', classname=shard,
+                                  name='shard')
+    error = ElementTree.SubElement(case, 'error',
+                                   message=f'{os.path.basename(path)} is missing')
+    error.text = 'The shard crashed before writing its report.'
+    return suite
+
+
+def merge_junit(shards: dict, output: str) -> JunitSummary:
+    """
+    Merges JUnit XML reports of test shards into one report.
+
+    Parameters
+    ----------
+    shards : dict
+        Report paths by shard name, e.g. test host. Missing or broken
+        reports are counted as a shard error.
+    output : str
+        Path of the merged report.
+
+    Returns
+    -------
+    JunitSummary
+        Totals of all shards, time is the longest shard time as shards
+        run concurrently.
+    """
+    merged = ElementTree.Element('testsuites')
+    totals = dict.fromkeys(COUNTERS, 0)
+    wall_time = 0.0
+    for shard, path in sorted(shards.items()):
+        try:
+            suites = _suites(path)
+        except (OSError, ElementTree.ParseError) as error:
+            logging.warning('%s report of %s is unusable: %s', path, shard, error)
+            suites = [_missing_suite(shard, path)]
+        shard_time = 0.0
+        for suite in suites:
+            suite.set('name', shard)
+            suite.set('hostname', shard)
+            for counter in COUNTERS:
+                totals[counter] += int(suite.get(counter, 0))
+            shard_time += float(suite.get('time', 0))
+            merged.append(suite)
+        wall_time = max(wall_time, shard_time)
+    for counter in COUNTERS:
+        merged.set(counter, str(totals[counter]))
+    merged.set('time', f'{wall_time:.3f}')
+    ElementTree.ElementTree(merged).write(output, encoding='utf-8',
+                                          xml_declaration=True)
+    return JunitSummary(time=wall_time, **totals)
@@ -0,0 +1,171 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Package manifests diff with RPM version ordering.
+"""
+
+import collections
+import re
+
+
+__all__ = ['Nevra', 'Change', 'ManifestDiff', 'parse_nevra', 'load_manifest',
+           'rpmvercmp', 'compare_evr', 'diff_manifests']
+
+
+Nevra = collections.namedtuple(
+    'nevra', ['name', 'epoch', 'version', 'release', 'arch']
+)
+
+Change = collections.namedtuple('change', ['old', 'new'])
+
+ManifestDiff = collections.namedtuple(
+    'manifest_diff', ['added', 'removed', 'upgraded', 'downgraded']
+)
+
+_SEPARATOR = re.compile(r'[^a-zA-Z0-9~^]*')
+_DIGITS = re.compile(r'[0-9]*')
+_ALPHA = re.compile(r'[a-zA-Z]*')
+
+
+def parse_nevra(package: str) -> Nevra:
+    """
+    Parses name-[epoch:]version-release.arch[.rpm].
+
+    Returns
+    -------
+    Nevra
+        Package with epoch 0 if it's not set.
+    """
+    if package.endswith('.rpm'):
+        package = package[:-len('.rpm')]
+    package, _, arch = package.rpartition('.')
+    package, _, release = package.rpartition('-')
+    name, _, version = package.rpartition('-')
+    epoch = 0
+    if ':' in version:
+        epoch, version = version.split(':', 1)
+        epoch = int(epoch)
+    return Nevra(name, epoch, version, release, arch)
+
+
+def load_manifest(manifest: str) -> set:
+    """
+    Loads rpm-packages manifest into a set of packages.
+    """
+    packages = set()
+    for line in manifest.splitlines():
+        line = line.strip()
+        if line and not line.startswith('gpg-pubkey'):
+            packages.add(parse_nevra(line))
+    return packages
+
+
+def rpmvercmp(one: str, two: str) -> int:
+    """
+    Compares version or release strings like rpm does.
+
+    Returns
+    -------
+    int
+        1 if one is newer, -1 if two is newer, 0 if they are equal.
+    """
+    if one == two:
+        return 0
+    while True:
+        one = one[_SEPARATOR.match(one).end():]
+        two = two[_SEPARATOR.match(two).end():]
+        # Tilde sorts before everything, even the end of a string
+        if one.startswith('~') or two.startswith('~'):
+            if not one.startswith('~'):
+                return 1
+            if not two.startswith('~'):
+                return -1
+            one, two = one[1:], two[1:]
+            continue
+        # Caret sorts after the end of a string but before anything else
+        if one.startswith('^') or two.startswith('^'):
+            if not one:
+                return -1
+            if not two:
+                return 1
+            if not one.startswith('^'):
+                return 1
+            if not two.startswith('^'):
+                return -1
+            one, two = one[1:], two[1:]
+            continue
+        if not one or not two:
+            break
+        numeric = '0' <= one[0] <= '9'
+        pattern = _DIGITS if numeric else _ALPHA
+        segment_one = pattern.match(one).group()
+        segment_two = pattern.match(two).group()
+        one, two = one[len(segment_one):], two[len(segment_two):]
+        if not segment_two:
+            # Numeric segments are newer than alphabetic ones
+            return 1 if numeric else -1
+        if numeric:
+            segment_one = segment_one.lstrip('0')
+            segment_two = segment_two.lstrip('0')
+            if len(segment_one) != len(segment_two):
+                return 1 if len(segment_one) > len(segment_two) else -1
+        if segment_one != segment_two:
+            return 1 if segment_one > segment_two else -1
+    if not one and not two:
+        return 0
+    return 1 if one else -1
+
+
+def compare_evr(one: Nevra, two: Nevra) -> int:
+    """
+    Compares epoch, version and release of two packages.
+    """
+    if one.epoch != two.epoch:
+        return 1 if one.epoch > two.epoch else -1
+    return rpmvercmp(one.version, two.version) or rpmvercmp(one.release, two.release)
+
+
+def diff_manifests(old: set, new: set) -> ManifestDiff:
+    """
+    Finds packages added, removed, upgraded and downgraded between
+    manifests.
+
+    Identical packages are dropped by set difference, the rest are paired
+    by name and arch, so the diff is linear in the manifests size.
+    Packages installed in several versions, like kernels, which can't be
+    paired one to one are reported as added and removed.
+
+    Parameters
+    ----------
+    old : set
+        Packages of the committed manifest.
+    new : set
+        Packages of the new manifest.
+
+    Returns
+    -------
+    ManifestDiff
+        Lists sorted by package name.
+    """
+    removed_by_key = collections.defaultdict(list)
+    for package in old - new:
+        removed_by_key[(package.name, package.arch)].append(package)
+    added, upgraded, downgraded = [], [], []
+    for package in new - old:
+        candidates = removed_by_key.get((package.name, package.arch))
+        if not candidates or len(candidates) > 1:
+            added.append(package)
+            continue
+        previous = candidates.pop()
+        if compare_evr(package, previous) >= 0:
+            upgraded.append(Change(previous, package))
+        else:
+            downgraded.append(Change(previous, package))
+    removed = [package for packages in removed_by_key.values() for package in packages]
+    return ManifestDiff(
+        added=sorted(added),
+        removed=sorted(removed),
+        upgraded=sorted(upgraded, key=lambda change: change.new.name),
+        downgraded=sorted(downgraded, key=lambda change: change.new.name),
+    )
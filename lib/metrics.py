@@ -0,0 +1,220 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Prometheus metrics of build pipelines.
+"""
+
+import logging
+import os
+import threading
+import time
+from urllib.parse import quote
+
+from lib.config import settings
+
+
+__all__ = ['METRICS', 'MetricsRegistry', 'registry', 'collect_from_tracer',
+           'export_metrics']
+
+
+# The schema is stable: dashboards and alerts rely on these names and labels.
+# Only add new metrics, never rename or drop existing ones.
+METRICS = {
+    'alcib_run_success': (
+        'gauge', 'Whether the last run of a stage succeeded (1) or failed (0).'
+    ),
+    'alcib_run_timestamp_seconds': (
+        'gauge', 'Unix time when the last run of a stage finished.'
+    ),
+    'alcib_stage_duration_seconds': (
+        'gauge', 'Duration of a hypervisor stage method in seconds.'
+    ),
+    'alcib_artifact_size_bytes': (
+        'gauge', 'Size of an artifact uploaded to S3 bucket.'
+    ),
+    'alcib_s3_transfer_bytes_total': (
+        'counter', 'Bytes transferred to or from S3 bucket.'
+    ),
+    'alcib_s3_transfer_seconds_total': (
+        'counter', 'Seconds spent transferring to or from S3 bucket.'
+    ),
+    'alcib_build_cache_hit': (
+        'gauge', 'Whether the build was promoted from the build cache.'
+    ),
+    'alcib_sftp_transfer_bytes_total': (
+        'counter', 'Bytes transferred to or from builder hosts over SFTP.'
+    ),
+    'alcib_sftp_transfer_seconds_total': (
+        'counter', 'Seconds spent in SFTP transfers.'
+    ),
+    'alcib_ssh_commands_total': (
+        'counter', 'Remote commands executed over SSH.'
+    ),
+    'alcib_retries_total': (
+        'counter', 'Retried attempts of an operation.'
+    ),
+    'alcib_retry_exhausted_total': (
+        'counter', 'Operations which failed after all retry attempts.'
+    ),
+    'alcib_command_timeouts_total': (
+        'counter', 'Commands killed after their deadline or idle output limit.'
+    ),
+    'alcib_ami_copy_seconds': (
+        'gauge', 'Seconds until an AMI copy became available in a region.'
+    ),
+    'alcib_vagrant_up_seconds': (
+        'gauge', 'Seconds to bring a Vagrant test machine up.'
+    ),
+    'alcib_builder_peak_utilization': (
+        'gauge', 'Peak builder host resource usage during an operation, '
+                 'percent or MiB/s.'
+    ),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class MetricsRegistry:
+
+    """
+    In-process storage of metric samples.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.base_labels = {}
+
+    def _key(self, name: str, labels: dict) -> tuple:
+        if name not in METRICS:
+            raise KeyError(f'Unknown metric {name}')
+        labels = {**self.base_labels, **labels}
+        return name, tuple(sorted(labels.items()))
+
+    def set(self, name: str, value: float, **labels):
+        """
+        Sets a gauge value.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = value
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Increments a counter value.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            self._samples[key] = self._samples.get(key, 0) + value
+
+    def samples(self, name: str) -> list:
+        """
+        Gets samples of a metric as (labels, value) pairs.
+        """
+        with self._lock:
+            return [(dict(labels), value) for (sample_name, labels), value
+                    in self._samples.items() if sample_name == name]
+
+    def render(self) -> str:
+        """
+        Renders samples in Prometheus text exposition format.
+
+        Returns
+        -------
+        str
+        """
+        with self._lock:
+            samples = sorted(self._samples.items())
+        lines = []
+        described = set()
+        for (name, labels), value in samples:
+            if name not in described:
+                metric_type, help_text = METRICS[name]
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                described.add(name)
+            label_str = ','.join(f'{key}="{_escape(val)}"' for key, val in labels)
+            lines.append(f'{name}{{{label_str}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def collect_from_tracer(tracer):
+    """
+    Derives stage durations, S3 and SFTP throughput and SSH round-trips
+    from spans.
+
+    Parameters
+    ----------
+    tracer : lib.tracing.Tracer
+        Tracer with finished spans of the run.
+    """
+    durations = {}
+    for stage_span in tracer.by_category('stage'):
+        stage = stage_span.name.split('.')[-1]
+        durations[stage] = durations.get(stage, 0) + stage_span.duration
+    for stage, duration in durations.items():
+        registry.set('alcib_stage_duration_seconds', duration, stage=stage)
+    for s3_span in tracer.by_category('s3'):
+        direction = 'download' if 'download' in s3_span.name else 'upload'
+        registry.inc('alcib_s3_transfer_bytes_total',
+                     s3_span.attrs.get('bytes', 0), direction=direction)
+        registry.inc('alcib_s3_transfer_seconds_total',
+                     s3_span.duration, direction=direction)
+    for sftp_span in tracer.by_category('sftp'):
+        direction = 'download' if sftp_span.name.startswith('sftp get') else 'upload'
+        registry.inc('alcib_sftp_transfer_bytes_total',
+                     sftp_span.attrs.get('bytes', 0), direction=direction)
+        registry.inc('alcib_sftp_transfer_seconds_total',
+                     sftp_span.duration, direction=direction)
+    ssh_spans = tracer.by_category('ssh')
+    if ssh_spans:
+        registry.inc('alcib_ssh_commands_total', len(ssh_spans))
+
+
+def export_metrics(stage: str, success: bool):
+    """
+    Writes metrics to the textfile collector directory and/or pushes them
+    to Prometheus Pushgateway, whichever is configured.
+
+    Parameters
+    ----------
+    stage : str
+        Pipeline stage name.
+    success : bool
+        Whether the stage finished without errors.
+    """
+    registry.set('alcib_run_success', int(success), run_stage=stage)
+    registry.set('alcib_run_timestamp_seconds', time.time(), run_stage=stage)
+    payload = registry.render()
+    labels = registry.base_labels
+    job_name = '_'.join(
+        [stage] + [str(labels[key]) for key in sorted(labels)]
+    ).replace(' ', '_').replace('/', '_')
+    if settings.metrics_textfile_dir:
+        os.makedirs(settings.metrics_textfile_dir, exist_ok=True)
+        path = os.path.join(settings.metrics_textfile_dir, f'alcib_{job_name}.prom')
+        # The node exporter must never see a partially written file
+        with open(f'{path}.tmp', 'w') as prom_file:
+            prom_file.write(payload)
+        os.replace(f'{path}.tmp', path)
+        logging.info('Metrics saved to %s', path)
+    if settings.pushgateway_url:
+        import requests
+        grouping = '/'.join(
+            f'{key}/{quote(str(labels[key]), safe="")}' for key in sorted(labels)
+        )
+        url = f'{settings.pushgateway_url.rstrip("/")}/metrics/job/alcib/' \
+              f'run_stage/{stage}'
+        if grouping:
+            url = f'{url}/{grouping}'
+        try:
+            response = requests.put(url, data=payload, timeout=30)
+            logging.info('Metrics pushed to %s: %s', url, response.status_code)
+        except requests.RequestException as error:
+            logging.exception('Metrics push failed: %s', error)
@@ -0,0 +1,307 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Historical build performance database and regression detection.
+
+Every run stores a small JSON record in S3 bucket, so parallel Jenkins jobs
+never overwrite each other. The SQLite database is a local index of these
+records which is synchronized before reporting.
+"""
+
+import collections
+import json
+import logging
+import sqlite3
+import statistics
+import time
+
+
+__all__ = ['Regression', 'PerfHistory', 'build_record', 'upload_record',
+           'perf_report']
+
+
+Regression = collections.namedtuple(
+    'regression', ['stage', 'duration', 'baseline_mean', 'baseline_stdev',
+                   'z_score', 'slowdown']
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    build_number TEXT NOT NULL,
+    image TEXT NOT NULL,
+    hypervisor TEXT NOT NULL,
+    arch TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    host_type TEXT,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    success INTEGER NOT NULL,
+    UNIQUE (build_number, image, hypervisor, arch, stage)
+);
+CREATE INDEX IF NOT EXISTS runs_lookup
+    ON runs (image, hypervisor, arch, stage, started);
+CREATE TABLE IF NOT EXISTS stage_timings (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    stage TEXT NOT NULL,
+    duration REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_timings_run ON stage_timings (run_id);
+CREATE TABLE IF NOT EXISTS artifacts (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def build_record(stage: str, hypervisor, tracer, registry, success: bool,
+                 host_type: str) -> dict:
+    """
+    Makes a performance record of the finished run.
+
+    Parameters
+    ----------
+    stage : str
+        Pipeline stage name.
+    hypervisor : BaseHypervisor
+        Hypervisor the stage was executed for.
+    tracer : lib.tracing.Tracer
+        Tracer with finished spans of the run.
+    registry : lib.metrics.MetricsRegistry
+        Metrics collected during the run.
+    success : bool
+        Whether the stage finished without errors.
+    host_type : str
+        Builder host type, e.g. EC2 instance type.
+
+    Returns
+    -------
+    dict
+    """
+    runs = tracer.by_category('run')
+    started = runs[0].start if runs else time.time()
+    duration = runs[0].duration if runs else 0
+    stages = {}
+    for stage_span in tracer.by_category('stage'):
+        name = stage_span.name.split('.')[-1]
+        stages[name] = stages.get(name, 0) + stage_span.duration
+    artifacts = {
+        labels['artifact']: value for labels, value
+        in registry.samples('alcib_artifact_size_bytes')
+    }
+    return {
+        'build_number': hypervisor.build_number,
+        'image': registry.base_labels.get('image', ''),
+        'hypervisor': hypervisor.name,
+        'arch': hypervisor.arch,
+        'stage': stage,
+        'host_type': host_type,
+        'started': started,
+        'duration': duration,
+        'success': success,
+        'stages': stages,
+        'artifacts': artifacts,
+    }
+
+
+def _record_key(prefix: str, record: dict) -> str:
+    image = record['image'].replace(' ', '_')
+    return f'{prefix}/{image}/{record["hypervisor"]}/{record["arch"]}/' \
+           f'{record["build_number"]}-{record["stage"]}.json'
+
+
+def upload_record(s3_client, bucket: str, prefix: str, record: dict):
+    """
+    Stores a performance record in S3 bucket.
+    """
+    key = _record_key(prefix, record)
+    s3_client.put_object(Bucket=bucket, Key=key,
+                         Body=json.dumps(record).encode())
+    logging.info('Performance record saved to s3://%s/%s', bucket, key)
+
+
+class PerfHistory:
+
+    """
+    SQLite index of performance records.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def add_run(self, record: dict) -> bool:
+        """
+        Adds a run record, duplicates are ignored.
+
+        Returns
+        -------
+        bool
+            True if the record is new.
+        """
+        with self.conn:
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO runs (build_number, image, hypervisor, '
+                'arch, stage, host_type, started, duration, success) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (record['build_number'], record['image'], record['hypervisor'],
+                 record['arch'], record['stage'], record.get('host_type'),
+                 record['started'], record['duration'], int(record['success']))
+            )
+            if not cursor.rowcount:
+                return False
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                'INSERT INTO stage_timings (run_id, stage, duration) VALUES (?, ?, ?)',
+                [(run_id, name, value) for name, value in record['stages'].items()]
+            )
+            self.conn.executemany(
+                'INSERT INTO artifacts (run_id, name, size) VALUES (?, ?, ?)',
+                [(run_id, name, value) for name, value in record['artifacts'].items()]
+            )
+        return True
+
+    def known_builds(self) -> set:
+        rows = self.conn.execute(
+            'SELECT build_number, image, hypervisor, arch, stage FROM runs'
+        )
+        return set(rows)
+
+    def sync_from_s3(self, s3_client, bucket: str, prefix: str) -> int:
+        """
+        Loads records from S3 bucket which are not in the database yet.
+
+        Returns
+        -------
+        int
+            Number of added records.
+        """
+        known = {_record_key(prefix, dict(zip(
+            ('build_number', 'image', 'hypervisor', 'arch', 'stage'), row
+        ))) for row in self.known_builds()}
+        added = 0
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f'{prefix}/'):
+            for item in page.get('Contents', []):
+                if item['Key'] in known:
+                    continue
+                body = s3_client.get_object(Bucket=bucket, Key=item['Key'])['Body']
+                added += self.add_run(json.loads(body.read().decode()))
+        logging.info('%d performance records synchronized', added)
+        return added
+
+    def latest_run(self, image: str, hypervisor: str, arch: str, stage: str):
+        return self.conn.execute(
+            'SELECT id, build_number, started FROM runs WHERE image = ? AND '
+            'hypervisor = ? AND arch = ? AND stage = ? AND success = 1 '
+            'ORDER BY started DESC LIMIT 1',
+            (image, hypervisor, arch, stage)
+        ).fetchone()
+
+    def stage_timings(self, run_id: int) -> dict:
+        return dict(self.conn.execute(
+            'SELECT stage, duration FROM stage_timings WHERE run_id = ?', (run_id,)
+        ))
+
+    def baseline(self, image: str, hypervisor: str, arch: str, stage: str,
+                 before: float, window: int) -> dict:
+        """
+        Gets stage timings of the previous successful runs.
+
+        Returns
+        -------
+        dict
+            Stage name to list of durations.
+        """
+        rows = self.conn.execute(
+            'SELECT t.stage, t.duration FROM stage_timings t JOIN ('
+            '  SELECT id FROM runs WHERE image = ? AND hypervisor = ? AND '
+            '  arch = ? AND stage = ? AND success = 1 AND started < ? '
+            '  ORDER BY started DESC LIMIT ?'
+            ') r ON t.run_id = r.id',
+            (image, hypervisor, arch, stage, before, window)
+        )
+        timings = collections.defaultdict(list)
+        for name, duration in rows:
+            timings[name].append(duration)
+        return timings
+
+    def detect_regressions(self, image: str, hypervisor: str, arch: str,
+                           stage: str, window: int = 10, z_threshold: float = 3.0,
+                           min_slowdown: float = 0.2, min_samples: int = 3):
+        """
+        Compares the latest run against a rolling baseline.
+
+        A stage is flagged when its duration is more than ``z_threshold``
+        standard deviations above the baseline mean and at least
+        ``min_slowdown`` slower in relative terms.
+
+        Returns
+        -------
+        tuple
+            Latest run build number and list of Regression.
+        """
+        latest = self.latest_run(image, hypervisor, arch, stage)
+        if not latest:
+            return None, []
+        run_id, build_number, started = latest
+        baseline = self.baseline(image, hypervisor, arch, stage, started, window)
+        regressions = []
+        for name, duration in sorted(self.stage_timings(run_id).items()):
+            samples = baseline.get(name, [])
+            if len(samples) < min_samples:
+                continue
+            mean = statistics.mean(samples)
+            stdev = statistics.stdev(samples)
+            slowdown = duration / mean - 1 if mean else 0
+            # Zero spread means any slowdown above the floor is significant
+            z_score = (duration - mean) / stdev if stdev else float('inf')
+            if z_score > z_threshold and slowdown > min_slowdown:
+                regressions.append(
+                    Regression(name, duration, mean, stdev, z_score, slowdown)
+                )
+        return build_number, regressions
+
+
+def perf_report(history: PerfHistory, image: str, hypervisor: str, arch: str,
+                stages, report_path: str) -> list:
+    """
+    Writes the regression report for all pipeline stages of a hypervisor.
+
+    Returns
+    -------
+    list
+        Found regressions.
+    """
+    found = []
+    lines = [f'Performance report for {image} {hypervisor} {arch}']
+    for stage in stages:
+        build_number, regressions = history.detect_regressions(
+            image, hypervisor, arch, stage
+        )
+        if build_number is None:
+            continue
+        lines.append(f'\n{stage}: build {build_number}')
+        if not regressions:
+            lines.append('  no significant slowdowns')
+        for item in regressions:
+            lines.append(
+                f'  {item.stage}: {item.duration:.1f}s vs baseline '
+                f'{item.baseline_mean:.1f}s +/- {item.baseline_stdev:.1f}s '
+                f'({item.slowdown:+.0%}, z={item.z_score:.1f})'
+            )
+        found.extend(regressions)
+    report = '\n'.join(lines)
+    with open(report_path, 'w') as report_file:
+        report_file.write(report + '\n')
+    if found:
+        logging.warning(report)
+    else:
+        logging.info(report)
+    return found
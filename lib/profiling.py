@@ -0,0 +1,107 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Opt-in cProfile hooks for the controller process.
+"""
+
+import cProfile
+import glob
+import io
+import logging
+import os
+import pstats
+
+
+__all__ = ['StageProfiler', 'aggregate_profiles']
+
+
+PROFILES_DIR = 'profiles'
+
+
+def write_summary(stats: pstats.Stats, path: str, top: int, title: str) -> str:
+    """
+    Writes top-N hotspots by cumulative and own time.
+    """
+    stream = io.StringIO()
+    stats.stream = stream
+    stream.write(f'{title}\n\nTop {top} by cumulative time\n')
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stream.write(f'\nTop {top} by own time\n')
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    with open(path, 'w') as summary_file:
+        summary_file.write(stream.getvalue())
+    return path
+
+
+class StageProfiler:
+
+    """
+    Profiles a single main.py run.
+    """
+
+    def __init__(self, name: str, directory: str = PROFILES_DIR):
+        """
+        Parameters
+        ----------
+        name : str
+            Profile file name without extension.
+        directory : str
+            Directory to keep profiles of all stages of a job.
+        """
+        self.name = name
+        self.directory = directory
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, top: int = 30) -> list:
+        """
+        Writes raw profile and its hotspot summary.
+
+        Returns
+        -------
+        list
+            Paths to the written files.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        prof_path = os.path.join(self.directory, f'{self.name}.prof')
+        self.profiler.dump_stats(prof_path)
+        summary_path = write_summary(
+            pstats.Stats(prof_path), os.path.join(self.directory, f'{self.name}.txt'),
+            top, self.name
+        )
+        logging.info('Profile saved to %s, hotspots in %s', prof_path, summary_path)
+        return [prof_path, summary_path]
+
+
+def aggregate_profiles(directory: str = PROFILES_DIR, top: int = 30):
+    """
+    Merges profiles of all stages found in a directory.
+
+    Returns
+    -------
+    list
+        Paths to the aggregated profile and its summary, empty if there are
+        no profiles.
+    """
+    paths = sorted(
+        path for path in glob.glob(os.path.join(directory, '*.prof'))
+        if not os.path.basename(path).startswith('aggregate')
+    )
+    if not paths:
+        logging.info('No profiles found in %s', directory)
+        return []
+    stats = pstats.Stats(*paths)
+    prof_path = os.path.join(directory, 'aggregate.prof')
+    stats.dump_stats(prof_path)
+    summary_path = write_summary(
+        stats, os.path.join(directory, 'aggregate.txt'), top,
+        'Aggregated: ' + ', '.join(os.path.basename(path) for path in paths)
+    )
+    logging.info('%d profiles aggregated into %s', len(paths), prof_path)
+    return [prof_path, summary_path]
@@ -0,0 +1,165 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Client of the persistent agent on builder hosts.
+"""
+
+import collections
+import itertools
+import json
+import logging
+import os
+import threading
+
+from lib.tracing import span
+from lib.watchdog import Watchdog
+
+
+__all__ = ['AgentError', 'ExecResult', 'RemoteAgent']
+
+
+AGENT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'agent_server.py')
+# Relative SFTP paths are resolved against the home directory
+AGENT_PATH = '.alcib_agent.py'
+
+# expired is the reason and message of an expired limit, None if the
+# command exited by itself
+ExecResult = collections.namedtuple(
+    'exec_result', ['exit_status', 'stdout', 'stderr', 'expired', 'diagnostics']
+)
+
+
+class AgentError(Exception):
+    """
+    Remote agent request Exception.
+    """
+    pass
+
+
+class RemoteAgent:
+
+    """
+    Sends requests to lib/agent_server.py over a single SSH channel.
+    """
+
+    def __init__(self, ssh):
+        """
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client.
+        """
+        self.ssh = ssh
+        self._channel = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Uploads the agent and starts it on the remote host.
+        """
+        with span('agent start', 'ssh'):
+            self.ssh.get_sftp().put(AGENT_SOURCE, AGENT_PATH)
+            self._channel = self.ssh.get_transport().open_session()
+            self._channel.exec_command(f'python3 {AGENT_PATH}')
+            self._reader = self._channel.makefile('r')
+        logging.info('Remote agent started')
+        return self
+
+    def _request(self, op: str, **params):
+        """
+        Sends a request and yields its response messages.
+        """
+        request_id = next(self._ids)
+        params.update(id=request_id, op=op)
+        self._channel.sendall(json.dumps(params) + '\n')
+        while True:
+            line = self._reader.readline()
+            if not line:
+                raise AgentError(
+                    f'Agent exited with {self._channel.recv_exit_status()}'
+                )
+            message = json.loads(line)
+            if message['event'] == 'error':
+                raise AgentError(message['error'])
+            yield message
+            if message['event'] in ('exit', 'result'):
+                return
+
+    def execute(self, cmd: str, watchdog: Watchdog, cwd_path: str = None,
+                stdin_data: str = None) -> ExecResult:
+        """
+        Executes a command with bash on the remote host.
+
+        The agent enforces the limits of the watchdog and kills the process
+        group of an expired command, the watchdog is fed with the output.
+
+        Parameters
+        ----------
+        cmd : str
+            A command to execute.
+        watchdog : Watchdog
+            Limits of the command.
+        cwd_path : str
+            Working directory of the command.
+        stdin_data : str
+            Input of the command.
+
+        Returns
+        -------
+        ExecResult
+        """
+        output = {'stdout': bytearray(), 'stderr': bytearray()}
+        with self._lock:
+            for message in self._request('exec', cmd=cmd, cwd=cwd_path,
+                                         stdin=stdin_data,
+                                         timeout=watchdog.timeout,
+                                         idle_timeout=watchdog.idle_timeout):
+                if message['event'] == 'output':
+                    data = message['data'].encode()
+                    output[message['stream']].extend(data)
+                    watchdog.feed(data)
+                else:
+                    result = message
+        return ExecResult(
+            exit_status=result['status'],
+            stdout=bytes(output['stdout']),
+            stderr=bytes(output['stderr']),
+            expired=tuple(result['expired']) if result.get('expired') else None,
+            diagnostics=result.get('diagnostics', '')
+        )
+
+    def sha256(self, path: str) -> tuple:
+        """
+        Calculates checksum of a remote file.
+
+        Returns
+        -------
+        tuple
+            Hex digest and size of a file in bytes.
+        """
+        with self._lock, span(f'sha256 {os.path.basename(path)}', 'ssh'):
+            *_, result = self._request('sha256', path=path)
+        return result['sha256'], result['size']
+
+    def glob(self, pattern: str) -> list:
+        """
+        Expands a shell pattern on the remote host.
+        """
+        with self._lock:
+            *_, result = self._request('glob', pattern=pattern)
+        return result['paths']
+
+    def close(self):
+        if self._channel is None:
+            return
+        try:
+            self._channel.sendall(json.dumps({'op': 'quit'}) + '\n')
+            self._channel.shutdown_write()
+            self._channel.recv_exit_status()
+        finally:
+            self._channel.close()
+            self._channel = None
@@ -0,0 +1,168 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Retries of transient failures with exponential backoff and jitter.
+"""
+
+import collections
+import logging
+import random
+import socket
+import sys
+import time
+
+from lib.metrics import registry
+
+
+__all__ = ['RetryPolicy', 'POLICIES', 'is_retryable', 'backoff_delay',
+           'retry_call', 'http_request']
+
+
+RetryPolicy = collections.namedtuple(
+    'retry_policy', ['attempts', 'base_delay', 'max_delay', 'deadline']
+)
+
+# Deadline is the time budget of all attempts of one operation in seconds
+POLICIES = {
+    'default': RetryPolicy(attempts=5, base_delay=2, max_delay=60, deadline=600),
+    'ssh': RetryPolicy(attempts=8, base_delay=2, max_delay=30, deadline=300),
+    'http': RetryPolicy(attempts=6, base_delay=1, max_delay=30, deadline=300),
+    'boot': RetryPolicy(attempts=60, base_delay=5, max_delay=15, deadline=600),
+}
+
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+RETRYABLE_AWS_CODES = (
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestThrottled', 'RequestThrottledException', 'TooManyRequestsException',
+    'SlowDown', 'RequestLimitExceeded', 'RequestTimeout', 'RequestTimeoutException',
+    'InternalError', 'ServiceUnavailable', 'InternalFailure',
+)
+
+
+def _is_retryable_botocore(error, exceptions) -> bool:
+    if isinstance(error, exceptions.ClientError):
+        details = error.response.get('Error', {})
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return details.get('Code') in RETRYABLE_AWS_CODES or status >= 500
+    return isinstance(error, (exceptions.EndpointConnectionError,
+                              exceptions.ConnectionClosedError,
+                              exceptions.ReadTimeoutError,
+                              exceptions.ConnectTimeoutError,
+                              exceptions.IncompleteReadError))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Classifies errors of boto3, paramiko, requests and sockets as
+    transient ones worth another attempt.
+
+    Client libraries are checked only if they are already loaded, an error
+    can't come from a library which was never imported.
+    """
+    botocore = sys.modules.get('botocore.exceptions')
+    if botocore is not None and isinstance(
+            error, (botocore.BotoCoreError, botocore.ClientError)):
+        return _is_retryable_botocore(error, botocore)
+    requests = sys.modules.get('requests.exceptions')
+    if requests is not None and isinstance(error, requests.RequestException):
+        if isinstance(error, requests.HTTPError):
+            response = error.response
+            return response is not None and \
+                response.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout,
+                                  requests.ChunkedEncodingError))
+    paramiko = sys.modules.get('paramiko')
+    if paramiko is not None and isinstance(error, paramiko.SSHException):
+        # Wrong credentials don't get better with time
+        return not isinstance(error, (paramiko.AuthenticationException,
+                                      paramiko.BadHostKeyException))
+    if paramiko is not None and isinstance(
+            error, paramiko.ssh_exception.NoValidConnectionsError):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError, socket.timeout,
+                              socket.gaierror, EOFError))
+
+
+def backoff_delay(policy: RetryPolicy, attempt: int) -> float:
+    """
+    Gets delay before the next attempt with full jitter, so concurrent
+    retries of parallel jobs don't hit a service at once.
+    """
+    return random.uniform(0, min(policy.max_delay,
+                                 policy.base_delay * 2 ** (attempt - 1)))
+
+
+def retry_call(func, *args, operation: str, policy: RetryPolicy = None,
+               classifier=is_retryable, **kwargs):
+    """
+    Calls a function until it succeeds, fails with a permanent error or
+    runs out of attempts or time budget.
+
+    Parameters
+    ----------
+    func : callable
+        Called with the rest of positional and keyword arguments.
+    operation : str
+        Operation name for logs and metrics.
+    policy : RetryPolicy
+        Attempts and backoff, the default policy if it's not set.
+    classifier : callable
+        Returns True for errors which should be retried.
+
+    Returns
+    -------
+    object
+        Result of the function.
+
+    Raises
+    ------
+    Exception
+        The last error of the function.
+    """
+    policy = policy or POLICIES['default']
+    started = time.monotonic()
+    for attempt in range(1, policy.attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as error:
+            if not classifier(error):
+                raise
+            delay = backoff_delay(policy, attempt)
+            elapsed = time.monotonic() - started
+            if attempt == policy.attempts or elapsed + delay > policy.deadline:
+                registry.inc('alcib_retry_exhausted_total', operation=operation)
+                logging.error('%s failed after %d attempts in %.0fs: %s',
+                              operation, attempt, elapsed, error)
+                raise
+            registry.inc('alcib_retries_total', operation=operation)
+            logging.warning('%s attempt %d failed: %s, retrying in %.1fs',
+                            operation, attempt, error, delay)
+            time.sleep(delay)
+
+
+def http_request(method: str, url: str, operation: str, **kwargs):
+    """
+    Sends HTTP request retrying connection errors and transient statuses.
+
+    Returns
+    -------
+    requests.Response
+        Response which may have a non-transient error status, it's left
+        to the caller.
+
+    Raises
+    ------
+    requests.HTTPError
+        If a transient error status persists.
+    """
+    import requests
+    kwargs.setdefault('timeout', 120)
+
+    def send():
+        response = requests.request(method, url, **kwargs)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            response.raise_for_status()
+        return response
+
+    return retry_call(send, operation=operation, policy=POLICIES['http'])
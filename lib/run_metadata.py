@@ -0,0 +1,50 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Metadata of a run uploaded next to the build logs.
+"""
+
+import json
+import threading
+
+
+__all__ = ['RunMetadata', 'run_metadata']
+
+
+class RunMetadata:
+
+    """
+    Sections of free-form facts about a run, e.g. artifact checksums.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self._lock = threading.Lock()
+
+    def record(self, section: str, key: str, value):
+        """
+        Records a JSON serializable value.
+
+        Parameters
+        ----------
+        section : str
+            Section name, e.g. qcow2_postprocess.
+        key : str
+            Key in a section, e.g. artifact file name.
+        value : object
+            Recorded value.
+        """
+        with self._lock:
+            self.sections.setdefault(section, {})[key] = value
+
+    def export_json(self, path: str) -> str:
+        """
+        Writes recorded sections as JSON.
+        """
+        with self._lock, open(path, 'w') as json_file:
+            json.dump(self.sections, json_file, indent=2, sort_keys=True)
+        return path
+
+
+run_metadata = RunMetadata()
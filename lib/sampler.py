@@ -0,0 +1,146 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Resource usage sampler for remote builder hosts.
+"""
+
+import collections
+import logging
+import threading
+
+
+__all__ = ['Sample', 'RemoteSampler']
+
+
+# One line per interval: timestamp, busy and total CPU jiffies, MemTotal and
+# MemAvailable in kB, sectors read and written, bytes received and sent.
+SAMPLER_SCRIPT = """
+while :; do
+  set -- $(head -1 /proc/stat)
+  shift
+  idle=$(( $4 + $5 ))
+  # guest and guest_nice are already counted in user and nice
+  total=$(( $1 + $2 + $3 + $4 + $5 + $6 + $7 + ${8:-0} ))
+  mem=$(awk '/^MemTotal:/ {t=$2} /^MemAvailable:/ {a=$2} END {print t+0, a+0}' /proc/meminfo)
+  disk=$(awk '$3 ~ /^(sd[a-z]+|vd[a-z]+|xvd[a-z]+|nvme[0-9]+n[0-9]+)$/ {r+=$6; w+=$10} END {print r+0, w+0}' /proc/diskstats)
+  net=$(awk -F'[: ]+' 'NR > 2 && $2 != "lo" {rx+=$3; tx+=$11} END {print rx+0, tx+0}' /proc/net/dev)
+  echo "$(date +%s) $(( total - idle )) $total $mem $disk $net"
+  sleep {interval}
+done
+"""
+
+SECTOR_SIZE = 512
+MIB = 1024 * 1024
+
+Sample = collections.namedtuple(
+    'sample', ['timestamp', 'cpu_pct', 'mem_used_pct', 'disk_read_mibps',
+               'disk_write_mibps', 'net_rx_mibps', 'net_tx_mibps']
+)
+
+
+class RemoteSampler:
+
+    """
+    Collects /proc statistics of a remote host over a separate channel of
+    an existing SSH transport while long commands are running.
+    """
+
+    def __init__(self, ssh, interval: int = 15):
+        """
+        Parameters
+        ----------
+        ssh : builder.ParamikoWrapper
+            Connected SSH client.
+        interval : int
+            Sampling interval in seconds.
+        """
+        self.ssh = ssh
+        self.interval = interval
+        self.samples = []
+        self._channel = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts sampling in a background thread.
+        """
+        self._channel = self.ssh.get_transport().open_session()
+        self._channel.exec_command('bash -s')
+        self._channel.sendall(SAMPLER_SCRIPT.replace('{interval}', str(self.interval)))
+        self._channel.shutdown_write()
+        self._thread = threading.Thread(target=self._read, name='sampler', daemon=True)
+        self._thread.start()
+
+    def _read(self):
+        previous = None
+        try:
+            for line in self._channel.makefile('r'):
+                try:
+                    current = [int(value) for value in line.split()]
+                except ValueError:
+                    continue
+                if len(current) != 9:
+                    continue
+                if previous:
+                    self.samples.append(self._rates(previous, current))
+                previous = current
+        except Exception as error:
+            # The channel is closed under the reader on stop
+            logging.debug('Sampler stopped: %s', error)
+
+    @staticmethod
+    def _rates(previous: list, current: list) -> Sample:
+        elapsed = max(current[0] - previous[0], 1)
+        busy = current[1] - previous[1]
+        total = current[2] - previous[2]
+        mem_total, mem_available = current[3], current[4]
+        return Sample(
+            timestamp=current[0],
+            cpu_pct=round(100 * busy / total, 1) if total else 0.0,
+            mem_used_pct=round(100 * (mem_total - mem_available) / mem_total, 1)
+            if mem_total else 0.0,
+            disk_read_mibps=round((current[5] - previous[5]) * SECTOR_SIZE / MIB / elapsed, 2),
+            disk_write_mibps=round((current[6] - previous[6]) * SECTOR_SIZE / MIB / elapsed, 2),
+            net_rx_mibps=round((current[7] - previous[7]) / MIB / elapsed, 2),
+            net_tx_mibps=round((current[8] - previous[8]) / MIB / elapsed, 2),
+        )
+
+    def stop(self):
+        """
+        Stops sampling.
+        """
+        if self._channel is not None:
+            self._channel.close()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+
+    def save(self, path: str) -> str:
+        """
+        Writes collected samples as CSV time series.
+        """
+        with open(path, 'w') as csv_file:
+            csv_file.write(','.join(Sample._fields) + '\n')
+            for sample in self.samples:
+                csv_file.write(','.join(str(value) for value in sample) + '\n')
+        return path
+
+    def summary(self) -> dict:
+        """
+        Gets peak and mean utilization of every resource.
+
+        Returns
+        -------
+        dict
+            Resource name to dict with ``peak`` and ``mean`` values.
+        """
+        result = {}
+        if not self.samples:
+            return result
+        for field in Sample._fields[1:]:
+            values = [getattr(sample, field) for sample in self.samples]
+            result[field] = {
+                'peak': max(values),
+                'mean': round(sum(values) / len(values), 2),
+            }
+        return result
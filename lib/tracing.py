@@ -0,0 +1,225 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Nested timing spans for pipeline stages and commands.
+"""
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+
+__all__ = ['Span', 'Tracer', 'tracer', 'span', 'traced', 'describe_command']
+
+
+_SECRET_RE = re.compile(
+    r'((?:[A-Z_]*(?:SECRET|KEY|TOKEN|PASSWORD|PSW)[A-Z_]*)\s*=\s*)'
+    r'(["\']?)[^"\'\s&;]*\2'
+)
+_PREAMBLE_RE = re.compile(r'^(?:set -o pipefail|cd [^&;]+|export [^&;]+)$')
+
+
+def describe_command(cmd: str, limit: int = 80) -> str:
+    """
+    Makes a short, secret-free span name from a shell command.
+
+    Parameters
+    ----------
+    cmd : str
+        Command line as it is passed to a shell.
+    limit : int
+        Maximum length of the description.
+
+    Returns
+    -------
+    str
+        Command without ``cd``/``export`` preamble and credentials.
+    """
+    cmd = _SECRET_RE.sub(r'\1***', cmd)
+    cmd = re.sub(r'bash -c "(.*)"\s*$', r'\1', cmd)
+    parts = [part.strip() for part in re.split(r'&&|;', cmd)]
+    parts = [part for part in parts if part and not _PREAMBLE_RE.match(part)]
+    description = ' && '.join(parts) or cmd.strip()
+    if len(description) > limit:
+        description = description[:limit - 3] + '...'
+    return description
+
+
+class Span:
+
+    """
+    Single timed operation.
+    """
+
+    def __init__(self, name: str, category: str, parent=None, **attrs):
+        self.name = name
+        self.category = category
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.thread_id = threading.get_ident()
+        self.start = time.time()
+        self.end = None
+
+    @property
+    def duration(self) -> float:
+        """
+        Span duration in seconds, up to now if the span is still open.
+        """
+        return (self.end or time.time()) - self.start
+
+    def add_bytes(self, count: int):
+        """
+        Accounts transferred bytes to the span.
+        """
+        self.attrs['bytes'] = self.attrs.get('bytes', 0) + count
+
+    def set_status(self, status):
+        """
+        Records exit status of the wrapped operation.
+        """
+        self.attrs['exit_status'] = status
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'category': self.category,
+            'parent': self.parent.name if self.parent else None,
+            'start': self.start,
+            'duration': self.duration,
+            'thread_id': self.thread_id,
+            'attrs': self.attrs,
+        }
+
+
+class Tracer:
+
+    """
+    Collects spans of the current process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Context variable keeps nesting right for threads and asyncio tasks
+        self._stack = contextvars.ContextVar('span_stack', default=())
+        self.spans = []
+
+    @property
+    def current(self):
+        """
+        Innermost open span of the calling thread or task.
+        """
+        stack = self._stack.get()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = 'command', **attrs):
+        """
+        Opens a span nested into the current one of the calling thread or task.
+
+        Parameters
+        ----------
+        name : str
+            Span name.
+        category : str
+            Span category: stage, local, ssh, s3, sftp, etc.
+
+        Yields
+        ------
+        Span
+        """
+        new_span = Span(name, category, parent=self.current, **attrs)
+        token = self._stack.set(self._stack.get() + (new_span,))
+        try:
+            yield new_span
+        except BaseException as error:
+            new_span.attrs.setdefault('exit_status', 'error')
+            new_span.attrs['error'] = type(error).__name__
+            raise
+        else:
+            new_span.attrs.setdefault('exit_status', 0)
+        finally:
+            new_span.end = time.time()
+            self._stack.reset(token)
+            with self._lock:
+                self.spans.append(new_span)
+
+    def add_span(self, name: str, category: str, start: float, end: float,
+                 **attrs) -> Span:
+        """
+        Records an already finished operation, e.g. a step timed remotely,
+        as a child of the current span.
+        """
+        new_span = Span(name, category, parent=self.current, **attrs)
+        new_span.start, new_span.end = start, end
+        with self._lock:
+            self.spans.append(new_span)
+        return new_span
+
+    def by_category(self, category: str) -> list:
+        """
+        Gets finished spans of a category.
+        """
+        with self._lock:
+            return [item for item in self.spans if item.category == category]
+
+    def export_json(self, path: str) -> str:
+        """
+        Writes finished spans as a plain JSON list.
+        """
+        with self._lock:
+            data = [item.to_dict() for item in self.spans]
+        with open(path, 'w') as trace_file:
+            json.dump(data, trace_file, indent=2, default=str)
+        return path
+
+    def export_chrome_trace(self, path: str) -> str:
+        """
+        Writes finished spans in Chrome trace event format.
+
+        The file can be opened with chrome://tracing or Perfetto UI.
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = [{
+                'name': item.name,
+                'cat': item.category,
+                'ph': 'X',
+                'ts': int(item.start * 1e6),
+                'dur': int(item.duration * 1e6),
+                'pid': pid,
+                'tid': item.thread_id,
+                'args': item.attrs,
+            } for item in sorted(self.spans, key=lambda x: x.start)]
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'},
+                      trace_file, default=str)
+        logging.info('Trace with %d spans saved to %s', len(events), path)
+        return path
+
+
+tracer = Tracer()
+
+
+def span(name: str, category: str = 'command', **attrs):
+    """
+    Opens a span on the process-wide tracer.
+    """
+    return tracer.span(name, category, **attrs)
+
+
+def traced(func):
+    """
+    Wraps a stage method into a ``stage`` span.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with tracer.span(func.__qualname__, 'stage'):
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,178 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Pipelined SFTP transfers over shared sessions.
+"""
+
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+
+from lib.tracing import span
+
+
+__all__ = ['WINDOW_SIZE', 'TransferError', 'download', 'upload', 'upload_many']
+
+
+# Large channel window keeps many requests in flight on high-RTT links
+WINDOW_SIZE = 64 * 1024 * 1024
+BLOCK_SIZE = 1024 * 1024
+# Smaller uploads don't pay off the extra SFTP sessions of parallel workers
+PARALLEL_MIN_SIZE = 16 * 1024 * 1024
+
+
+class TransferError(Exception):
+    """
+    Transferred file is incomplete.
+    """
+    pass
+
+
+def _log_throughput(action: str, path: str, size: int, started: float):
+    elapsed = max(time.time() - started, 1e-6)
+    logging.info('%s %s: %.1f MiB in %.1fs, %.1f MiB/s', action, path,
+                 size / 2 ** 20, elapsed, size / 2 ** 20 / elapsed)
+
+
+def download(sftp, remote_path: str, local_path: str) -> int:
+    """
+    Downloads a file with read-ahead of the whole file.
+
+    Parameters
+    ----------
+    sftp : paramiko.SFTPClient
+        SFTP session, usually ssh.get_sftp().
+    remote_path : str
+        Remote file path.
+    local_path : str
+        Local file path.
+
+    Returns
+    -------
+    int
+        Number of transferred bytes.
+    """
+    started = time.time()
+    with span(f'sftp get {os.path.basename(remote_path)}', 'sftp') as sftp_span:
+        size = 0
+        with sftp.open(remote_path, 'rb') as remote_file, \
+                open(local_path, 'wb') as local_file:
+            # Local sessions of agent hosts return plain files
+            if hasattr(remote_file, 'prefetch'):
+                remote_file.prefetch(sftp.stat(remote_path).st_size)
+            for block in iter(lambda: remote_file.read(BLOCK_SIZE), b''):
+                local_file.write(block)
+                size += len(block)
+        sftp_span.add_bytes(size)
+    _log_throughput('Downloaded', remote_path, size, started)
+    return size
+
+
+def upload(sftp, local, remote_path: str) -> int:
+    """
+    Uploads a file with pipelined writes.
+
+    Parameters
+    ----------
+    sftp : paramiko.SFTPClient
+        SFTP session, usually ssh.get_sftp().
+    local : str or file object
+        Local file path or file object with text or binary content.
+    remote_path : str
+        Remote file path.
+
+    Returns
+    -------
+    int
+        Number of transferred bytes.
+
+    Raises
+    ------
+    TransferError
+        If the size of the remote file differs from the uploaded one.
+    """
+    started = time.time()
+    with span(f'sftp put {os.path.basename(remote_path)}', 'sftp') as sftp_span:
+        size = 0
+        local_file = open(local, 'rb') if isinstance(local, str) else local
+        try:
+            with sftp.open(remote_path, 'wb') as remote_file:
+                if hasattr(remote_file, 'set_pipelined'):
+                    remote_file.set_pipelined(True)
+                while True:
+                    block = local_file.read(BLOCK_SIZE)
+                    if not block:
+                        break
+                    if isinstance(block, str):
+                        block = block.encode()
+                    remote_file.write(block)
+                    size += len(block)
+        finally:
+            if isinstance(local, str):
+                local_file.close()
+        remote_size = sftp.stat(remote_path).st_size
+        if remote_size != size:
+            raise TransferError(f'{remote_path} has {remote_size} bytes, '
+                                f'{size} bytes were uploaded')
+        sftp_span.add_bytes(size)
+    _log_throughput('Uploaded', remote_path, size, started)
+    return size
+
+
+def _run_many(ssh, function, transfers: list, workers: int) -> list:
+    """
+    Runs transfers concurrently, every worker thread opens its own SFTP
+    channel on the same SSH transport.
+    """
+    if len(transfers) < 2 or workers < 2:
+        sftp = ssh.get_sftp()
+        return [function(sftp, *transfer) for transfer in transfers]
+    local = threading.local()
+    sessions = []
+    lock = threading.Lock()
+
+    def worker(transfer):
+        if not hasattr(local, 'sftp'):
+            local.sftp = ssh.open_transfer_session()
+            with lock:
+                sessions.append(local.sftp)
+        return function(local.sftp, *transfer)
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='sftp') as executor:
+            return list(executor.map(worker, transfers))
+    finally:
+        for sftp in sessions:
+            sftp.close()
+
+
+def _local_size(local) -> int:
+    if isinstance(local, str):
+        return os.path.getsize(local)
+    position = local.tell()
+    size = local.seek(0, os.SEEK_END) - position
+    local.seek(position)
+    return size
+
+
+def upload_many(ssh, transfers: list, workers: int = 4) -> list:
+    """
+    Uploads several files concurrently, or one by one through a single
+    SFTP session if they are small in total.
+
+    Parameters
+    ----------
+    ssh : builder.ParamikoWrapper
+        Connected SSH client.
+    transfers : list
+        Pairs of local path or file object and remote path.
+    workers : int
+        Maximum number of concurrent transfers.
+    """
+    if sum(_local_size(local) for local, _ in transfers) < PARALLEL_MIN_SIZE:
+        workers = 1
+    return _run_many(ssh, upload, transfers, workers)
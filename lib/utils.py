@@ -6,28 +6,40 @@
 Helping functions.
 """
 
+import codecs
 import collections
 import logging
 import json
 import os
 import re
-import requests
+import select
+from datetime import datetime
 from subprocess import PIPE, Popen, STDOUT
 
-from jinja2 import DictLoader, Environment
-
 from lib.config import settings
+from lib.retry import http_request
+from lib.tracing import describe_command, span
+from lib.transfer import download
+from lib.watchdog import (POLL_INTERVAL, Watchdog, kill_process_group,
+                          process_group_diagnostics, wait_process)
+
 
+CHUNK_SIZE = 64 * 1024
+command_logger = logging.getLogger('alcib.command')
 
 Package = collections.namedtuple(
     'rpm_package', ['name', 'version', 'release', 'arch', 'clean_release']
 )
 
 
-__all__ = ['save_ami_id', 'parse_package', 'execute_command',
+TIMESTAMP = str(datetime.date(datetime.today())).replace('-', '')
+DT_SUFFIX = str(datetime.today()).replace('-', '').replace('.', '').replace(':', '').replace(' ', '_')
+
+
+__all__ = ['TIMESTAMP', 'DT_SUFFIX', 'save_ami_id', 'parse_package', 'execute_command',
            'sftp_download', 'get_git_branches', 'generate_clouds', 
            'parse_for_filename', 'generate_latest_name', 
-           'file_to_string', 'shell_command']
+           'file_to_string', 'shell_command', 'parse_vagrant_output']
 
 
 def save_ami_id(stdout, arch: str) -> str:
@@ -44,7 +56,8 @@ def save_ami_id(stdout, arch: str) -> str:
 
 
 def parse_package(package):
-    package = package.rstrip('.rpm')
+    if package.endswith('.rpm'):
+        package = package[:-len('.rpm')]
     dot = package.rfind('.')
     package, arch = package[:dot], package[dot + 1:]
     dash = package.rfind('-')
@@ -55,7 +68,8 @@ def parse_package(package):
     return Package(name, version, release, arch, clean_release)
 
 
-def execute_command(cmd: str, cwd_path: str):
+def execute_command(cmd: str, cwd_path: str, timeout: float = None,
+                    idle_timeout: float = None):
     """
     Executes a local command.
 
@@ -65,31 +79,106 @@ def execute_command(cmd: str, cwd_path: str):
         A command to execute.
     cwd_path: str
         Directory path to execute commands.
+    timeout: float
+        Seconds the command may run.
+    idle_timeout: float
+        Seconds the command may run without any output.
 
     Raises
     ------
     Exception
         If a command fails during execution.
+    watchdog.CommandTimeout
+        If a limit expires.
     """
     logging.info('Executing %s', cmd)
-    proc = Popen(cmd.split(), cwd=cwd_path, stderr=STDOUT, stdout=PIPE)
-    for line in proc.stdout:
-        logging.info(line.decode())
-    proc.wait()
-    if proc.returncode != 0:
+    returncode = run_process(cmd.split(), cmd, cwd_path, timeout=timeout,
+                             idle_timeout=idle_timeout)
+    if returncode != 0:
         raise Exception('Command {0} execution failed {1}'.format(
-            cmd, proc.returncode
+            cmd, returncode
         ))
 
 
+def run_process(args, cmd: str, cwd_path: str, shell: bool = False,
+                timeout: float = None, idle_timeout: float = None) -> int:
+    """
+    Runs a local process and streams its output to the log.
+
+    Output is read in large chunks and decoded incrementally, complete
+    lines of a chunk go to the log as one record.
+
+    Parameters
+    ----------
+    args : list or str
+        Popen arguments.
+    cmd : str
+        Command description for tracing.
+    cwd_path : str
+        Directory path to execute commands.
+    shell : bool
+        Execute through the shell.
+    timeout : float
+        Seconds the process may run, see watchdog.Watchdog.
+    idle_timeout : float
+        Seconds the process may run without any output.
+
+    Returns
+    -------
+    int
+        Process return code.
+
+    Raises
+    ------
+    watchdog.CommandTimeout
+        If a limit expires, the process group is killed.
+    """
+    watchdog = Watchdog(timeout, idle_timeout)
+    with span(describe_command(cmd), 'local') as cmd_span:
+        # The process leads its own group, so it's killed with its children
+        proc = Popen(args, cwd=cwd_path, shell=shell, stderr=STDOUT,
+                     stdout=PIPE, bufsize=0, start_new_session=True)
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        tail = ''
+        try:
+            fd = proc.stdout.fileno()
+            while True:
+                expired = watchdog.expired()
+                if expired:
+                    break
+                if not select.select([fd], [], [], POLL_INTERVAL)[0]:
+                    continue
+                chunk = os.read(fd, CHUNK_SIZE)
+                if not chunk:
+                    break
+                watchdog.feed(chunk)
+                cmd_span.add_bytes(len(chunk))
+                text, newline, tail = (tail + decoder.decode(chunk)).rpartition('\n')
+                if newline:
+                    command_logger.info('%s', text)
+            tail += decoder.decode(b'', final=True)
+            if tail:
+                command_logger.info('%s', tail)
+        finally:
+            proc.stdout.close()
+        expired = expired or wait_process(proc, watchdog)
+        if expired:
+            diagnostics = process_group_diagnostics(proc.pid)
+            kill_process_group(proc)
+            cmd_span.set_status('timeout')
+            raise watchdog.timeout_error(cmd, *expired, diagnostics=diagnostics)
+        cmd_span.set_status(proc.returncode)
+    return proc.returncode
+
+
 def sftp_download(ssh, path, file, name):
-    sftp = ssh.open_sftp()
-    sftp.get(f'{path}/{file}', f'{name}-{file}')
+    download(ssh.get_sftp(), f'{path}/{file}', f'{name}-{file}')
 
 
 def get_git_branches(headers, repo):
     branch_regex = r'^al-\d\.\d\.\d-\d{8}$'
-    response = requests.get(f'{repo}/branches', headers=headers)
+    response = http_request('GET', f'{repo}/branches', operation='github',
+                            headers=headers)
     branches = []
     for item in json.loads(response.content.decode()):
         res = re.search(branch_regex, item['name'])
@@ -103,6 +192,7 @@ def generate_clouds(yaml_template) -> str:
     """
     Generates clouds.yaml
     """
+    from jinja2 import DictLoader, Environment
     env = Environment(loader=DictLoader({'clouds': yaml_template}))
     template = env.get_template('clouds')
     return template.render(config=settings)
@@ -129,7 +219,8 @@ def parse_for_filename(name: str) -> str:
     return name
 
 
-def shell_command(cmd: str, cwd_path: str):
+def shell_command(cmd: str, cwd_path: str, timeout: float = None,
+                  idle_timeout: float = None):
     """
     Executes shell commands.
 
@@ -139,20 +230,24 @@ def shell_command(cmd: str, cwd_path: str):
         A commands to execute.
     cwd_path: str
         Directory path to execute commands.
+    timeout: float
+        Seconds the commands may run.
+    idle_timeout: float
+        Seconds the commands may run without any output.
 
     Raises
     ------
     Exception
         If a command fails during execution.
+    watchdog.CommandTimeout
+        If a limit expires.
     """
     logging.info('Executing %s', cmd)
-    exec = Popen([cmd], cwd=cwd_path, shell=True, stderr=STDOUT, stdout=PIPE)
-    for line in exec.stdout:
-        logging.info(line.decode())
-    exec.wait()
-    if exec.returncode != 0:
+    returncode = run_process([cmd], cmd, cwd_path, shell=True, timeout=timeout,
+                             idle_timeout=idle_timeout)
+    if returncode != 0:
         raise Exception('Command {0} execution failed {1}'.format(
-            cmd, exec.returncode
+            cmd, returncode
         ))
 
 def file_to_string(file_path: str) -> str:
@@ -178,4 +273,38 @@ def file_to_string(file_path: str) -> str:
     
     raise Exception('Input file {0} not found'.format(
             file_path
-        ))
\ No newline at end of file
+        ))
+
+
+def parse_vagrant_output(output: str) -> tuple:
+    """
+    Parses vagrant --machine-readable output.
+
+    Parameters
+    ----------
+    output : str
+        Output of one or several vagrant commands.
+
+    Returns
+    -------
+    tuple
+        Human readable ui messages and seconds between the first and
+        the last event of every machine.
+    """
+    messages = []
+    first, last = {}, {}
+    for line in output.splitlines():
+        fields = line.split(',', 3)
+        if len(fields) < 4 or not fields[0].isdigit():
+            messages.append(line)
+            continue
+        timestamp, target, event, data = int(fields[0]), fields[1], fields[2], fields[3]
+        if target:
+            first.setdefault(target, timestamp)
+            last[target] = timestamp
+        if event == 'ui':
+            message = data.split(',', 1)[-1]
+            messages.append(message.replace('%!(VAGRANT_COMMA)', ',')
+                            .replace('\\n', '\n'))
+    timings = {target: last[target] - first[target] for target in first}
+    return '\n'.join(messages), timings
@@ -0,0 +1,327 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Vagrant Cloud API client for releasing boxes of several providers at once.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import time
+
+from lib.retry import RetryPolicy, is_retryable, retry_call
+from lib.tracing import span
+
+
+__all__ = ['API_URL', 'PROVIDERS', 'BoxSource', 'VagrantCloudError',
+           'VagrantCloud']
+
+
+API_URL = 'https://app.vagrantup.com/api/v1'
+# Vagrant provider names by hypervisor name
+PROVIDERS = {
+    'virtualbox': 'virtualbox',
+    'vmware_desktop': 'vmware_desktop',
+    'hyperv': 'hyperv',
+    'kvm': 'libvirt',
+}
+UPLOAD_BLOCK_SIZE = 8 * 1024 * 1024
+
+# open is a callable returning a new readable stream of the box
+BoxSource = collections.namedtuple(
+    'box_source', ['provider', 'size', 'checksum', 'open']
+)
+
+
+class VagrantCloudError(Exception):
+    """
+    Vagrant Cloud API request Exception.
+    """
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _is_retryable_upload(error: BaseException) -> bool:
+    """
+    Classifies upload errors, server errors and throttling of Vagrant
+    Cloud and its storage are transient.
+    """
+    if isinstance(error, VagrantCloudError):
+        status = error.status_code or 0
+        return status == 429 or status >= 500
+    return is_retryable(error)
+
+
+class _SizedStream:
+
+    """
+    Streams a box in blocks with a known length, so requests sends
+    Content-Length which storage upload URLs require instead of chunked
+    transfer encoding.
+    """
+
+    def __init__(self, stream, size: int):
+        self.stream = stream
+        self.size = size
+        self.sent = 0
+
+    def __len__(self):
+        return self.size - self.sent
+
+    def __iter__(self):
+        while True:
+            block = self.stream.read(UPLOAD_BLOCK_SIZE)
+            if not block:
+                break
+            self.sent += len(block)
+            yield block
+
+
+class VagrantCloud:
+
+    """
+    Registers versions and providers of a box and uploads provider boxes
+    through one pooled HTTP session.
+    """
+
+    def __init__(self, box: str, token: str, api_url: str = API_URL,
+                 workers: int = 4, attempts: int = 3, backoff: float = 10):
+        """
+        Parameters
+        ----------
+        box : str
+            Box tag, e.g. almalinux/9.
+        token : str
+            Vagrant Cloud access token.
+        api_url : str
+            API base URL, a fake server URL in development.
+        workers : int
+            Maximum number of concurrent uploads.
+        attempts : int
+            Upload attempts of every provider.
+        backoff : float
+            Maximum delay before the second attempt, doubled on every next
+            one and randomized with jitter.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        self.box_url = f'{api_url.rstrip("/")}/box/{box}'
+        self.workers = workers
+        self.attempts = attempts
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f'Bearer {token}'
+        # API calls are retried by the adapter, box uploads by upload_box
+        retry = Retry(total=5, backoff_factor=2, allowed_methods=['GET', 'HEAD'],
+                      status_forcelist=[429, 500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers,
+                              max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method: str, url: str, expected=(200,), **kwargs):
+        kwargs.setdefault('timeout', 60)
+        response = self.session.request(method, url, **kwargs)
+        if response.status_code not in expected:
+            raise VagrantCloudError(
+                f'{method} {url} failed with {response.status_code}: '
+                f'{response.text[:500]}', response.status_code
+            )
+        return response
+
+    def _version_url(self, version: str) -> str:
+        return f'{self.box_url}/version/{version}'
+
+    def _provider_url(self, version: str, provider: str) -> str:
+        return f'{self._version_url(version)}/provider/{provider}'
+
+    def ensure_version(self, version: str, description: str) -> dict:
+        """
+        Creates a box version unless it exists.
+
+        Returns
+        -------
+        dict
+            Version as returned by the API.
+        """
+        response = self._request('GET', self._version_url(version),
+                                 expected=(200, 404))
+        if response.status_code == 200:
+            return response.json()
+        logging.info('Creating version %s of %s', version, self.box_url)
+        data = {'version': {'version': version, 'description': description}}
+        return self._request('POST', f'{self.box_url}/versions', json=data).json()
+
+    def get_provider(self, version: str, provider: str):
+        """
+        Gets a provider of a box version.
+
+        Returns
+        -------
+        dict or None
+            Provider as returned by the API, None if it's not registered.
+        """
+        response = self._request('GET', self._provider_url(version, provider),
+                                 expected=(200, 404))
+        return response.json() if response.status_code == 200 else None
+
+    def ensure_provider(self, version: str, provider: str, checksum: str) -> dict:
+        """
+        Registers a provider of a box version or updates its checksum.
+
+        Returns
+        -------
+        dict
+            Provider as returned by the API.
+        """
+        data = {'provider': {'name': provider, 'checksum_type': 'sha256',
+                             'checksum': checksum}}
+        existing = self.get_provider(version, provider)
+        if existing is None:
+            return self._request('POST', f'{self._version_url(version)}/providers',
+                                 json=data).json()
+        if existing.get('checksum') == checksum:
+            return existing
+        return self._request('PUT', self._provider_url(version, provider),
+                             json=data).json()
+
+    def is_uploaded(self, provider_info: dict, checksum: str) -> bool:
+        """
+        Checks whether a box with the checksum is already hosted, so
+        a restarted release skips providers uploaded by the previous run.
+        """
+        if not provider_info or provider_info.get('checksum') != checksum:
+            return False
+        download_url = provider_info.get('download_url')
+        if not provider_info.get('hosted') or not download_url:
+            return False
+        response = self.session.head(download_url, allow_redirects=True, timeout=60)
+        return response.status_code == 200
+
+    def get_upload_url(self, version: str, provider: str) -> tuple:
+        """
+        Gets an upload URL, the direct to storage one if it's supported.
+
+        Returns
+        -------
+        tuple
+            Upload URL and callback URL, None for non-direct uploads.
+        """
+        upload_url = f'{self._provider_url(version, provider)}/upload'
+        response = self._request('GET', f'{upload_url}/direct',
+                                 expected=(200, 404))
+        if response.status_code == 404:
+            response = self._request('GET', upload_url)
+        upload = response.json()
+        return upload['upload_path'], upload.get('callback')
+
+    def complete_upload(self, callback: str):
+        """
+        Notifies Vagrant Cloud that a direct upload is finished.
+        """
+        self._request('PUT', callback)
+
+    def upload_box(self, version: str, source: BoxSource) -> int:
+        """
+        Uploads a box, every attempt gets a fresh upload URL and stream.
+
+        Vagrant Cloud upload URLs take the whole box in one PUT, they
+        support neither multipart nor ranged uploads, so a failed attempt
+        is retried from the first byte.
+
+        Returns
+        -------
+        int
+            Number of uploaded bytes, 0 if the box is already hosted.
+
+        Raises
+        ------
+        VagrantCloudError
+            If all upload attempts failed.
+        """
+        provider_info = self.ensure_provider(version, source.provider, source.checksum)
+        if self.is_uploaded(provider_info, source.checksum):
+            logging.info('%s box %s is already uploaded', source.provider, version)
+            return 0
+        policy = RetryPolicy(attempts=self.attempts, base_delay=self.backoff,
+                             max_delay=self.backoff * 8, deadline=24 * 3600)
+
+        def upload():
+            # Every attempt gets a fresh upload URL, a failed one may be used up
+            upload_path, callback = self.get_upload_url(version, source.provider)
+            with span(f'vagrant upload {source.provider}', 'step') as upload_span:
+                started = time.monotonic()
+                stream = source.open()
+                try:
+                    # Signed storage URLs reject other credentials
+                    self._request('PUT', upload_path,
+                                  data=_SizedStream(stream, source.size),
+                                  headers={'Authorization': None},
+                                  timeout=None)
+                finally:
+                    stream.close()
+                upload_span.add_bytes(source.size)
+            if callback:
+                self.complete_upload(callback)
+            elapsed = time.monotonic() - started
+            logging.info('%s box uploaded in %.1fs, %.1f MiB/s', source.provider,
+                         elapsed, source.size / 2 ** 20 / max(elapsed, 1e-6))
+            return source.size
+
+        try:
+            return retry_call(upload, operation=f'vagrant upload {source.provider}',
+                              policy=policy, classifier=_is_retryable_upload)
+        except Exception as error:
+            raise VagrantCloudError(
+                f'{source.provider} box upload failed: {error}'
+            ) from error
+
+    def release_boxes(self, version: str, description: str, sources: list) -> dict:
+        """
+        Registers all providers of a version and uploads their boxes
+        concurrently.
+
+        Parameters
+        ----------
+        version : str
+            Box version.
+        description : str
+            Version description, e.g. changelog.
+        sources : list
+            Boxes of the providers.
+
+        Returns
+        -------
+        dict
+            Uploaded bytes by provider.
+
+        Raises
+        ------
+        VagrantCloudError
+            If any box upload failed, after all other uploads finished.
+        """
+        self.ensure_version(version, description)
+        results, errors = {}, {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='vagrant') as executor:
+            futures = {executor.submit(self.upload_box, version, source): source
+                       for source in sources}
+            for future in concurrent.futures.as_completed(futures):
+                provider = futures[future].provider
+                try:
+                    results[provider] = future.result()
+                except Exception as error:
+                    logging.error('%s box release failed: %s', provider, error)
+                    errors[provider] = error
+        if errors:
+            raise VagrantCloudError(
+                f'Box release failed for {", ".join(sorted(errors))}'
+            )
+        return results
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,173 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Deadlines and idle output watchdogs of long running commands.
+"""
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+
+from lib.config import settings
+from lib.metrics import registry
+from lib.run_metadata import run_metadata
+
+
+__all__ = ['CommandTimeout', 'Watchdog', 'wait_process',
+           'process_group_diagnostics', 'kill_process_group']
+
+
+# Seconds between checks of a running command
+POLL_INTERVAL = 1
+TAIL_SIZE = 16 * 1024
+# Seconds a killed command has to exit after SIGTERM
+KILL_GRACE = 10
+
+
+class CommandTimeout(Exception):
+    """
+    Command was killed by its watchdog.
+    """
+
+    def __init__(self, cmd: str, reason: str, message: str, tail: str = '',
+                 diagnostics: str = ''):
+        super().__init__(f'Command \'{cmd}\' killed: {message}')
+        self.cmd = cmd
+        self.reason = reason
+        self.tail = tail
+        self.diagnostics = diagnostics
+
+
+class Watchdog:
+
+    """
+    Tracks a command against its deadline and idle output limit and keeps
+    the tail of its output for diagnostics.
+    """
+
+    def __init__(self, timeout: float = None, idle_timeout: float = None):
+        """
+        Parameters
+        ----------
+        timeout : float
+            Seconds the command may run, the command_timeout setting if it's
+            not set. Zero disables the deadline.
+        idle_timeout : float
+            Seconds the command may run without any output, the
+            command_idle_timeout setting if it's not set. Zero disables it.
+        """
+        self.timeout = settings.command_timeout if timeout is None else timeout
+        self.idle_timeout = (settings.command_idle_timeout
+                             if idle_timeout is None else idle_timeout)
+        self.started = self.last_output = time.monotonic()
+        self._tail = bytearray()
+        # stdout and stderr may be fed from different threads
+        self._lock = threading.Lock()
+
+    def feed(self, data: bytes):
+        """
+        Registers command output.
+        """
+        if not data:
+            return
+        with self._lock:
+            self.last_output = time.monotonic()
+            self._tail += data
+            del self._tail[:-TAIL_SIZE]
+
+    @property
+    def tail(self) -> str:
+        with self._lock:
+            return self._tail.decode(errors='replace')
+
+    def expired(self) -> tuple:
+        """
+        Checks the limits of the command.
+
+        Returns
+        -------
+        tuple
+            Reason (deadline or idle) and message of the expired limit, or
+            None while the command is within its limits.
+        """
+        now = time.monotonic()
+        if self.timeout and now - self.started > self.timeout:
+            return 'deadline', f'running longer than {self.timeout}s'
+        if self.idle_timeout and now - self.last_output > self.idle_timeout:
+            return 'idle', f'no output for {self.idle_timeout}s'
+        return None
+
+    def timeout_error(self, cmd: str, reason: str, message: str,
+                      diagnostics: str = '', error_class=CommandTimeout):
+        """
+        Makes a timeout error of the command, its output tail and diagnostics
+        are logged and recorded to the run metadata first.
+        """
+        elapsed = time.monotonic() - self.started
+        logging.error('%s after %.0fs: %s\nOutput tail:\n%s\nDiagnostics:\n%s',
+                      cmd, elapsed, message, self.tail, diagnostics)
+        registry.inc('alcib_command_timeouts_total', reason=reason)
+        run_metadata.record('command_timeouts', cmd, {
+            'reason': reason,
+            'elapsed': round(elapsed, 1),
+            'tail': self.tail[-2048:],
+            'diagnostics': diagnostics,
+        })
+        return error_class(cmd, reason, message, self.tail, diagnostics)
+
+
+def wait_process(proc, watchdog: Watchdog) -> tuple:
+    """
+    Waits for a local process within the watchdog limits.
+
+    Returns
+    -------
+    tuple
+        Reason and message of the expired limit, None if the process exited.
+    """
+    while True:
+        try:
+            proc.wait(POLL_INTERVAL)
+            return None
+        except subprocess.TimeoutExpired:
+            expired = watchdog.expired()
+            if expired:
+                return expired
+
+
+def process_group_diagnostics(pgid: int) -> str:
+    """
+    Lists processes of a local process group.
+    """
+    try:
+        result = subprocess.run(
+            ['ps', '-eo', 'pgid=,pid=,ppid=,stat=,etime=,args='],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=30
+        )
+    except (OSError, subprocess.TimeoutExpired) as error:
+        return f'ps failed: {error}'
+    lines = result.stdout.decode(errors='replace').splitlines()
+    return '\n'.join(line for line in lines
+                     if line.split(None, 1)[:1] == [str(pgid)])
+
+
+def kill_process_group(proc, grace: float = KILL_GRACE):
+    """
+    Terminates a local process started in its own session with all its
+    children, killing them if they don't exit in a grace period.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(grace)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        pass
+    # Children may outlive the group leader
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.wait()
@@ -8,18 +8,33 @@ Script for building Vagrant Boxes.
 
 import sys
 import argparse
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 import os
 import base64
 import json
-import requests
 
-from lib.builder import Builder, AgentBuilder
-from lib.hypervisors import get_hypervisor, TIMESTAMP
 from lib.config import settings
-from lib.utils import get_git_branches
+from lib.metrics import collect_from_tracer, export_metrics, registry
+from lib.perfdb import PerfHistory, build_record, perf_report, upload_record
+from lib.profiling import StageProfiler, aggregate_profiles
+from lib.retry import http_request
+from lib.run_metadata import run_metadata
+from lib.tracing import span, tracer
+from lib.utils import DT_SUFFIX, TIMESTAMP, get_git_branches
 
 
+WIKI_AMI_FILES = ['docs/cloud/AWS_AMIS.md',
+                  'docs/.vuepress/public/ci-data/aws_amis.csv']
+
+PERF_STAGES = ['init', 'build', 'test', 'release', 'destroy', 'sign']
+# Stages reading the performance history, their runs aren't recorded in it
+REPORT_STAGES = ['perf-report', 'profile-report']
+# Stages which never connect to builder hosts
+LOCAL_STAGES = ['pullrequest', 'release-all'] + REPORT_STAGES
+
 headers = {
         'Authorization': f'Bearer {settings.github_token}',
         'Accept': 'application/vnd.github.v3+json',
@@ -43,69 +58,86 @@ def init_args_parser() -> argparse.ArgumentParser:
                         help='Hypervisor name', required=False)
     parser.add_argument('--stage', type=str,
                         choices=['init', 'build', 'destroy',
-                                 'test', 'release', 'pullrequest','sign'],
+                                 'test', 'release', 'release-all',
+                                 'pullrequest', 'sign', 'perf-report',
+                                 'profile-report'],
                         help='Stage')
     parser.add_argument('--arch', type=str, choices=['x86_64', 'aarch64', 'ppc64le', 's390x'],
                         help='Architecture', required=False, default='x86_64')
     parser.add_argument('--isagent', type=str, choices=['true', 'false'],
                         help='Use Agent for processing', required=False, default='false')                    
+    parser.add_argument('--profile', action='store_true',
+                        help='Run the stage under cProfile')
+    parser.add_argument('--profile-top', type=int, default=30,
+                        help='Number of hotspots in profile summaries')
     return parser
 
 
 def almalinux_wiki_pr():
     """
-    Executes Github API calls for making commit and pull request.
+    Regenerates AMI pages of the wiki from the AMI catalog and makes
+    a pull request if any rows changed.
     """
+    from lib.ami_catalog import AmiCatalog, diff_rows, render_csv, render_md
+    from lib.aws import get_client
     repo = 'https://api.github.com/repos/almalinuxautobot/wiki'
-    response = requests.post(
-        f'{repo}/merge-upstream',
+    response = http_request(
+        'POST', f'{repo}/merge-upstream', operation='github',
         headers=headers, data='{"branch":"master"}'
     )
-    logging.info(response.status_code, response.content.decode())
-
-    aws_md = os.path.join(os.getcwd(), 'wiki/docs/cloud/AWS_AMIS.md')
-    lines = open(aws_md, 'r').readlines()
-    lines = lines[:1] + lines[3:]
-    open(aws_md, 'w').write(''.join(lines))
-    aws_csv = os.path.join(os.getcwd(), 'wiki/docs/.vuepress/public/ci-data/aws_amis.csv')
-    md_content = base64.b64encode(
-        open(aws_md, "r").read().encode('utf-8')
-    ).decode('utf-8')
-    csv_content = base64.b64encode(
-        open(aws_csv, "r").read().encode('utf-8')
-    ).decode('utf-8')
-    response = requests.get(
-        f'{repo}/contents/docs/cloud/AWS_AMIS.md',
-        headers=headers
-    )
-    sha_md = json.loads(response.content.decode()).get('sha')
-    response = requests.get(
-        f'{repo}/contents/docs/.vuepress/public/ci-data/aws_amis.csv',
-        headers=headers
-    )
-    sha_csv = json.loads(response.content.decode()).get('sha')
-    data = f'{{"message":"Updating AWS AMI version in MD file",' \
-           f'"content":"{md_content}","sha":"{sha_md}"}}'
-    response = requests.put(
-        f'{repo}/contents/docs/cloud/AWS_AMIS.md',
-        headers=headers, data=data
-    )
-    logging.info(response.status_code, response.content.decode())
+    logging.info('%s %s', response.status_code, response.content.decode())
 
-    data = f'{{"message":"Updating AWS AMI version in CSV file",' \
-           f'"content":"{csv_content}","sha":"{sha_csv}"}}'
-    response = requests.put(
-        f'{repo}/contents/docs/.vuepress/public/ci-data/aws_amis.csv',
-        headers=headers, data=data
-    )
-    logging.info(response.status_code, response.content.decode())
+    catalog = AmiCatalog(settings.ami_catalog_db)
+    try:
+        wiki_files = {}
+        for path in WIKI_AMI_FILES:
+            response = http_request('GET', f'{repo}/contents/{path}',
+                                    operation='github', headers=headers)
+            response.raise_for_status()
+            content = json.loads(response.content.decode())
+            wiki_files[path] = (
+                content['sha'], base64.b64decode(content['content']).decode('utf-8')
+            )
+        if not catalog.latest_releases():
+            # The first run imports AMIs already listed in the wiki
+            catalog.import_csv(wiki_files[WIKI_AMI_FILES[1]][1])
+        catalog.sync_from_s3(get_client('s3'), settings.bucket,
+                             settings.ami_catalog_prefix)
+        amis = catalog.current()
+    finally:
+        catalog.close()
+    generated = {WIKI_AMI_FILES[0]: render_md(amis),
+                 WIKI_AMI_FILES[1]: render_csv(amis)}
+    changed = False
+    for path, content in generated.items():
+        with open(os.path.basename(path), 'w') as generated_file:
+            generated_file.write(content)
+        sha, old_content = wiki_files[path]
+        added, removed = diff_rows(old_content, content)
+        if not added and not removed:
+            logging.info('%s is up to date', path)
+            continue
+        changed = True
+        logging.info('%s: %d rows added, %d rows removed', path,
+                     len(added), len(removed))
+        data = {
+            'message': f'Updating AWS AMI versions in {os.path.basename(path)}',
+            'content': base64.b64encode(content.encode('utf-8')).decode('utf-8'),
+            'sha': sha,
+        }
+        response = http_request('PUT', f'{repo}/contents/{path}',
+                                operation='github', headers=headers, json=data)
+        logging.info('%s %s', response.status_code, response.content.decode())
+    if not changed:
+        logging.info('AWS AMI versions are up to date')
+        return
 
     data = '{"head":"AlmaLinux:master","base":"master","title":"Updating AWS AMI versions"}'
-    response = requests.post(
-        'https://api.github.com/repos/almalinuxautobot/wiki/pulls',
-        headers=headers, data=data
+    response = http_request(
+        'POST', 'https://api.github.com/repos/almalinuxautobot/wiki/pulls',
+        operation='github', headers=headers, data=data
     )
-    logging.info(response.status_code, response.content.decode())
+    logging.info('%s %s', response.status_code, response.content.decode())
 
 
 def create_new_branch():
@@ -113,14 +145,16 @@ def create_new_branch():
     branches = get_git_branches(headers, repo)
     branch = branches[-1]
     if f'al-{settings.almalinux}-{TIMESTAMP}' not in branches:
-        response = requests.get(f'{repo}/git/refs/heads', headers=headers)
+        response = http_request('GET', f'{repo}/git/refs/heads',
+                                operation='github', headers=headers)
         refs = json.loads(response.content.decode())
         sha_sum = None
         for ref in refs:
             if branch in ref['ref']:
                 sha_sum = ref['object']['sha']
         data = {"ref": f"refs/heads/al-{settings.almalinux}-{TIMESTAMP}", "sha": sha_sum}
-        response = requests.post(f'{repo}/git/refs', headers=headers, json=data)
+        response = http_request('POST', f'{repo}/git/refs', operation='github',
+                                headers=headers, json=data)
         logging.info(response.content.decode())
 
 
@@ -134,26 +168,144 @@ def setup_logger():
     formatter = logging.Formatter(log_format, '%y.%m.%d %H:%M:%S')
     handler.setFormatter(formatter)
 
+    # Records are formatted and written by a listener thread, so chatty
+    # commands never wait for the console
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
     logger = logging.getLogger()
-    logger.addHandler(handler)
+    logger.addHandler(QueueHandler(log_queue))
     logger.setLevel(logging.INFO)
 
 
+def perf_report_stage(hypervisor) -> int:
+    """
+    Compares the latest runs of a hypervisor against the performance history.
+
+    Returns
+    -------
+    int
+        Exit code, 1 if significant slowdowns were found.
+    """
+    history = PerfHistory(settings.perf_db)
+    try:
+        history.sync_from_s3(hypervisor.s3_bucket, settings.bucket,
+                             settings.perf_history_prefix)
+        regressions = perf_report(
+            history, settings.image, hypervisor.name, hypervisor.arch,
+            PERF_STAGES, f'perf_report_{hypervisor.name}_{hypervisor.arch}_{DT_SUFFIX}.txt'
+        )
+    finally:
+        history.close()
+    return 1 if regressions else 0
+
+
+def profile_report_stage(hypervisor, top: int):
+    """
+    Aggregates profiles of all stages executed in the workspace.
+    """
+    for path in aggregate_profiles(top=top):
+        hypervisor.upload_artifact(path)
+
+
+def finalize_run(args, hypervisor, success: bool, profiler=None):
+    """
+    Saves trace, metrics, profile and performance record of the finished run.
+    """
+    artifacts = []
+    # Called while a failed stage unwinds, its error must not be replaced
+    if profiler is not None:
+        try:
+            profiler.stop()
+            artifacts.extend(profiler.save(args.profile_top))
+        except Exception as error:
+            logging.exception('Profile export failed: %s', error)
+    name = f'{args.stage}_{args.hypervisor}_{args.arch}_{DT_SUFFIX}'
+    try:
+        artifacts.append(tracer.export_chrome_trace(f'trace_{name}.json'))
+        if run_metadata.sections:
+            artifacts.append(run_metadata.export_json(f'run_metadata_{name}.json'))
+    except Exception as error:
+        logging.exception('Trace export failed: %s', error)
+    try:
+        collect_from_tracer(tracer)
+        export_metrics(args.stage, success)
+    except Exception as error:
+        logging.exception('Metrics export failed: %s', error)
+    if hypervisor is None:
+        return
+    for path in artifacts:
+        try:
+            hypervisor.upload_artifact(path)
+        except Exception as error:
+            logging.exception('%s upload failed: %s', path, error)
+    if args.stage in REPORT_STAGES:
+        return
+    try:
+        record = build_record(args.stage, hypervisor, tracer, registry,
+                              success, hypervisor.host_type)
+        upload_record(hypervisor.s3_bucket, settings.bucket,
+                      settings.perf_history_prefix, record)
+    except Exception as error:
+        logging.exception('Performance record upload failed: %s', error)
+
+
 def main(sys_args):
     """
     Executes stages to build, test and release Vagrant Box.
     """
     args_parser = init_args_parser()
     args = args_parser.parse_args(sys_args)
+    if args.stage != 'pullrequest' and not args.hypervisor:
+        args_parser.error(f'--hypervisor is required for the {args.stage} stage')
 
     setup_logger()
-    builder = Builder()
+    success = False
+    profiler = None
+    hypervisor = None
+    registry.base_labels = {
+        'hypervisor': str(args.hypervisor).lower(),
+        'arch': args.arch,
+        'image': settings.image,
+    }
+    try:
+        if args.profile:
+            profiler = StageProfiler(f'{args.stage}_{args.hypervisor}_{args.arch}_{DT_SUFFIX}')
+            profiler.start()
+        # Heavy dependencies are loaded only when a stage really needs them
+        builder = None
+        if args.stage not in LOCAL_STAGES:
+            from lib.builder import AgentBuilder, Builder
+            builder = AgentBuilder() if args.isagent == 'true' else Builder()
+        if args.stage != 'pullrequest':
+            from lib.hypervisors import get_hypervisor
+            hypervisor = get_hypervisor(args.hypervisor.lower(), args.arch, args.isagent)
+        with span(f'{args.stage} {args.hypervisor} {args.arch}', 'run'):
+            exit_code = run_stage(args, builder, hypervisor)
+        success = True
+        return exit_code
+    finally:
+        finalize_run(args, hypervisor, success, profiler)
 
+
+def run_stage(args, builder, hypervisor):
+    """
+    Executes the requested stage.
+
+    Returns
+    -------
+    int or None
+        Exit code of report stages.
+    """
+    if args.stage == 'perf-report':
+        return perf_report_stage(hypervisor)
+    if args.stage == 'profile-report':
+        return profile_report_stage(hypervisor, args.profile_top)
     if args.stage == 'pullrequest':
         almalinux_wiki_pr()
     else:
-        hypervisor = get_hypervisor(args.hypervisor.lower(), args.arch, args.isagent)
-
         if args.stage == 'init':
             hypervisor.init_stage(builder)
         elif args.stage == 'build':
@@ -166,8 +318,11 @@ def main(sys_args):
                 hypervisor.build_aws_stage(builder, args.arch)
             elif settings.image == 'Docker':
                 hypervisor.build_docker_stage(builder)
-                create_new_branch()
-                hypervisor.create_docker_branch(builder)
+                if hypervisor.changed_docker_confs:
+                    create_new_branch()
+                    hypervisor.create_docker_branch(builder)
+                else:
+                    logging.info('All Docker Images are up to date')
         elif args.stage == 'test':
             if settings.image == 'AWS AMI':
                 hypervisor.test_aws_stage(builder)
@@ -182,6 +337,8 @@ def main(sys_args):
                 hypervisor.publish_ami(builder)
             else:
                 hypervisor.release_stage(builder)
+        elif args.stage == 'release-all':
+            hypervisor.release_all_stage()
         elif args.stage == 'destroy':
             if settings.image in ['OpenNebula', 'GenericCloud'] and args.arch == 'aarch64':
                 hypervisor.teardown_equinix_stage(builder)
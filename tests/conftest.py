@@ -0,0 +1,15 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Common test configuration.
+"""
+
+import os
+import sys
+
+# Required settings must be set before lib.config is imported
+os.environ.setdefault('SSH_KEY_FILE', '')
+os.environ.setdefault('BUILD_NUMBER', '0')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
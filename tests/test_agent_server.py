@@ -0,0 +1,54 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import json
+import subprocess
+import sys
+
+import pytest
+
+from lib.remote_agent import AGENT_SOURCE
+
+
+@pytest.fixture
+def agent():
+    proc = subprocess.Popen([sys.executable, AGENT_SOURCE], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, universal_newlines=True)
+    yield proc
+    proc.stdin.write(json.dumps({'op': 'quit'}) + '\n')
+    proc.stdin.close()
+    proc.wait(10)
+
+
+def request(agent, **params):
+    agent.stdin.write(json.dumps(dict(params, id=1)) + '\n')
+    agent.stdin.flush()
+    output = {'stdout': '', 'stderr': ''}
+    for line in agent.stdout:
+        message = json.loads(line)
+        if message['event'] == 'output':
+            output[message['stream']] += message['data']
+        else:
+            return message, output
+
+
+def test_exec(agent):
+    result, output = request(agent, op='exec', cmd='cat; echo error >&2; exit 3',
+                             stdin='input\n')
+    assert result == {'id': 1, 'event': 'exit', 'status': 3}
+    assert output == {'stdout': 'input\n', 'stderr': 'error\n'}
+
+
+def test_exec_idle_timeout(agent):
+    result, output = request(agent, op='exec', cmd='echo started; sleep 30',
+                             idle_timeout=1)
+    assert result['status'] == -1
+    assert result['expired'][0] == 'idle'
+    assert output['stdout'] == 'started\n'
+
+
+def test_exec_background_child(agent):
+    # The child keeps stdout open after the command exits
+    result, output = request(agent, op='exec', cmd='sleep 30 & echo done')
+    assert result['status'] == 0
+    assert output['stdout'] == 'done\n'
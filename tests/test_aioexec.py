@@ -0,0 +1,33 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import time
+
+import pytest
+
+from lib.aioexec import Command, CommandFailed, CommandTimeout, run_parallel
+
+
+def test_run_parallel(tmp_path):
+    outputs = run_parallel([Command('echo one', str(tmp_path)),
+                            Command('echo two', str(tmp_path))])
+    assert [output.strip() for output in outputs] == ['one', 'two']
+
+
+def test_run_parallel_without_shell(tmp_path):
+    outputs = run_parallel([Command('printf "%s|" "one two"', str(tmp_path), shell=False)])
+    assert outputs == ['one two|']
+
+
+def test_run_parallel_failure(tmp_path):
+    with pytest.raises(CommandFailed):
+        run_parallel([Command('exit 3', str(tmp_path))])
+
+
+def test_timeout_after_output_is_closed(tmp_path):
+    # The command keeps running after closing its output
+    started = time.monotonic()
+    with pytest.raises(CommandTimeout):
+        run_parallel([Command('exec > /dev/null 2>&1; sleep 30',
+                              str(tmp_path), timeout=1)])
+    assert time.monotonic() - started < 10
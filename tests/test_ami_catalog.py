@@ -0,0 +1,74 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import pytest
+
+from lib.ami_catalog import (
+    AmiCatalog, diff_rows, render_csv, render_md, upload_release
+)
+from lib.ami_mirror import AmiCopy
+
+
+def release(version, arch, regions):
+    name = f'AlmaLinux OS {version} {arch}'
+    return [AmiCopy(region, f'ami-{version}-{arch}-{region}', name, version, arch)
+            for region in regions]
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = AmiCatalog(str(tmp_path / 'catalog.sqlite'))
+    yield catalog
+    catalog.close()
+
+
+def test_latest_releases(catalog):
+    catalog.add_release(release('9.3.20231113', 'x86_64', ['us-east-1']))
+    catalog.add_release(release('9.4.20240507', 'x86_64', ['us-east-1', 'eu-west-1']))
+    catalog.add_release(release('9.10.20250101', 'arm64', ['us-east-1']))
+    catalog.add_release(release('9.9.20240101', 'arm64', ['us-east-1']))
+    catalog.add_release(release('8.10.20240530', 'x86_64', ['us-east-1']))
+    assert catalog.latest_releases() == [
+        ('8', 'x86_64', '8.10.20240530'),
+        ('9', 'arm64', '9.10.20250101'),
+        ('9', 'x86_64', '9.4.20240507'),
+    ]
+    assert len(catalog.current()) == 4
+    assert [ami.version for ami in catalog.lookup(region='eu-west-1')] == \
+        ['9.4.20240507']
+
+
+def test_render_and_import(catalog):
+    amis = release('9.4.20240507', 'x86_64', ['us-east-1']) + \
+        release('8.10.20240530', 'arm64', ['us-east-1'])
+    content = render_csv(amis)
+    assert content.splitlines()[0] == \
+        '"AlmaLinux OS","9.4.20240507","us-east-1","ami-9.4.20240507-x86_64-us-east-1","x86_64"'
+    assert catalog.import_csv(content) == 2
+    assert sorted(catalog.current()) == sorted(amis)
+    assert 'launchAmi=ami-9.4.20240507-x86_64-us-east-1' in render_md(amis)
+
+
+def test_diff_rows():
+    added, removed = diff_rows('a\nb\n', 'b\nc\n')
+    assert added == ['c']
+    assert removed == ['a']
+
+
+def test_sync_from_s3(catalog, monkeypatch):
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        s3 = boto3.client('s3', region_name='us-east-1')
+        s3.create_bucket(Bucket='images')
+        upload_release(s3, 'images', 'catalog',
+                       release('9.4.20240507', 'x86_64', ['us-east-1']))
+        assert catalog.sync_from_s3(s3, 'images', 'catalog') == 1
+        assert catalog.sync_from_s3(s3, 'images', 'catalog') == 0
+        # A release mirrored again overwrites its record
+        upload_release(s3, 'images', 'catalog',
+                       release('9.4.20240507', 'x86_64', ['us-east-1', 'eu-west-1']))
+        assert catalog.sync_from_s3(s3, 'images', 'catalog') == 1
+    assert len(catalog.lookup(version='9.4.20240507')) == 2
@@ -0,0 +1,53 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import pytest
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+from lib.ami_mirror import AmiMirror
+
+
+REGIONS = ['eu-west-1', 'us-east-1', 'us-west-2']
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        yield lambda service, region: boto3.client(service, region_name=region)
+
+
+@pytest.fixture
+def source_image(ec2):
+    client = ec2('ec2', 'us-east-1')
+    instance_id = client.run_instances(
+        ImageId='ami-12c6146b', MinCount=1, MaxCount=1
+    )['Instances'][0]['InstanceId']
+    return client.create_image(
+        InstanceId=instance_id, Name='AlmaLinux OS 9.4.20240805 x86_64',
+        Description='AlmaLinux OS 9.4 x86_64'
+    )['ImageId']
+
+
+def test_mirror(ec2, source_image):
+    mirror = AmiMirror(poll_interval=0, timeout=60, client_factory=ec2)
+    copies = mirror.mirror(source_image, REGIONS)
+    assert [ami.region for ami in copies] == REGIONS
+    assert {ami.version for ami in copies} == {'9.4.20240805'}
+    for ami in copies:
+        image = ec2('ec2', ami.region).describe_images(ImageIds=[ami.image_id])
+        assert image['Images'][0]['Name'] == 'AlmaLinux OS 9.4.20240805 x86_64'
+        permissions = ec2('ec2', ami.region).describe_image_attribute(
+            ImageId=ami.image_id, Attribute='launchPermission'
+        )['LaunchPermissions']
+        assert {'Group': 'all'} in permissions
+
+
+def test_mirror_reuses_existing_copies(ec2, source_image):
+    mirror = AmiMirror(poll_interval=0, timeout=60, client_factory=ec2)
+    first = mirror.mirror(source_image, REGIONS)
+    second = mirror.mirror(source_image, REGIONS)
+    assert first == second
@@ -0,0 +1,85 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import io
+import socket
+import threading
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from lib.builder import AgentBuilder, ExecuteTimeout, LocalSFTP, ParamikoWrapper
+from lib.watchdog import Watchdog
+
+
+class FakeChannel:
+
+    """
+    Channel with queued stdout chunks, None in the queue means EOF.
+    """
+
+    def __init__(self, chunks, exited=True):
+        self.chunks = list(chunks)
+        self.status_event = threading.Event()
+        if exited:
+            self.status_event.set()
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv(self, size):
+        if not self.chunks:
+            raise socket.timeout()
+        chunk = self.chunks.pop(0)
+        return b'' if chunk is None else chunk
+
+    def recv_ready(self):
+        return bool(self.chunks) and self.chunks[0] is not None
+
+    def recv_stderr_ready(self):
+        return False
+
+
+def collect(channel, **limits):
+    output, errors = bytearray(), bytearray()
+    expired = ParamikoWrapper._collect(channel, Watchdog(**limits), output, errors)
+    return expired, bytes(output)
+
+
+def test_collect_until_eof():
+    assert collect(FakeChannel([b'one ', b'two', None])) == (None, b'one two')
+
+
+def test_collect_without_eof():
+    # A background child of the exited command holds stdout open
+    channel = FakeChannel([b'one ', b'two'])
+    assert collect(channel, timeout=5, idle_timeout=0) == (None, b'one two')
+
+
+def test_collect_deadline():
+    channel = FakeChannel([b'output'], exited=False)
+    expired, output = collect(channel, timeout=0.5, idle_timeout=0)
+    assert expired[0] == 'deadline'
+    assert output == b'output'
+
+
+def test_batch_deadline():
+    builder = AgentBuilder.__new__(AgentBuilder)
+    with pytest.raises(ExecuteTimeout):
+        builder.safe_execute_batch(['true', 'sleep 30'], timeout=0.5)
+
+
+def test_batch_results():
+    builder = AgentBuilder.__new__(AgentBuilder)
+    results = builder.safe_execute_batch(['echo one', 'echo two >&2'], timeout=10)
+    assert [result.output.strip() for result in results] == ['one', 'two']
+
+
+def test_local_sftp(tmp_path):
+    sftp = LocalSFTP()
+    assert sftp.putfo(io.StringIO('text'), str(tmp_path / 'text')).st_size == 4
+    assert sftp.putfo(io.BytesIO(b'bytes'), str(tmp_path / 'bytes')).st_size == 5
+    assert sftp.put(str(tmp_path / 'bytes'), str(tmp_path / 'copy')).st_size == 5
+    with sftp.file(str(tmp_path / 'copy'), 'rb') as copy:
+        assert copy.read() == b'bytes'
@@ -0,0 +1,69 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import json
+import os
+
+import pytest
+
+moto = pytest.importorskip('moto')
+boto3 = pytest.importorskip('boto3')
+
+from lib import delta
+
+
+CHUNK_SIZE = 4
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='images')
+        yield client
+
+
+def upload(s3, tmp_path, key, data):
+    path = tmp_path / os.path.basename(key)
+    path.write_bytes(data)
+    index = delta.build_index(str(path), CHUNK_SIZE)
+    for number, digest in enumerate(index['chunks']):
+        chunk = data[number * CHUNK_SIZE:(number + 1) * CHUNK_SIZE]
+        s3.put_object(Bucket='images', Key=f'delta/chunks/{digest}', Body=chunk)
+    s3.put_object(Bucket='images', Key=f'{key}.index.json',
+                  Body=json.dumps(index).encode())
+    return index
+
+
+def test_fetch(s3, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    upload(s3, tmp_path, 'build-1/image.qcow2', b'aaaabbbbcccc')
+    dest = tmp_path / 'first.qcow2'
+    summary = delta.fetch(s3, 'images', 'delta', 'build-1/image.qcow2',
+                          str(dest), str(cache_dir))
+    assert dest.read_bytes() == b'aaaabbbbcccc'
+    assert summary['bytes_downloaded'] == 12
+
+    upload(s3, tmp_path, 'build-2/image.qcow2', b'aaaabbbbdddd')
+    dest = tmp_path / 'second.qcow2'
+    summary = delta.fetch(s3, 'images', 'delta', 'build-2/image.qcow2',
+                          str(dest), str(cache_dir))
+    assert dest.read_bytes() == b'aaaabbbbdddd'
+    assert summary['bytes_downloaded'] == 4
+    # Chunks of the previous image are pruned, the lock file is kept
+    assert len(os.listdir(cache_dir)) == 4
+    assert delta.LOCK_NAME in os.listdir(cache_dir)
+
+
+def test_fetch_checksum_mismatch(s3, tmp_path):
+    index = upload(s3, tmp_path, 'build-1/image.qcow2', b'aaaabbbb')
+    index['sha256'] = '0' * 64
+    s3.put_object(Bucket='images', Key='build-1/image.qcow2.index.json',
+                  Body=json.dumps(index).encode())
+    dest = tmp_path / 'image.qcow2'
+    with pytest.raises(ValueError):
+        delta.fetch(s3, 'images', 'delta', 'build-1/image.qcow2',
+                    str(dest), str(tmp_path / 'cache'))
+    assert not dest.exists()
@@ -0,0 +1,39 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import xml.etree.ElementTree as ElementTree
+
+from lib.junit import merge_junit
+
+
+def write_report(path, tests, failures, time, wrapped=True):
+    suite = (f'<testsuite name="pytest" tests="{tests}" failures="{failures}" '
+             f'errors="0" skipped="0" time="{time}"><testcase name="a"/></testsuite>')
+    path.write_text(f'<testsuites>{suite}</testsuites>' if wrapped else suite)
+    return str(path)
+
+
+def test_merge_junit(tmp_path):
+    shards = {
+        'host-1': write_report(tmp_path / '1.xml', 5, 1, 12.5),
+        'host-2': write_report(tmp_path / '2.xml', 3, 0, 20, wrapped=False),
+    }
+    output = tmp_path / 'merged.xml'
+    summary = merge_junit(shards, str(output))
+    assert summary.tests == 8
+    assert summary.failures == 1
+    assert summary.errors == 0
+    assert summary.time == 20
+    root = ElementTree.parse(output).getroot()
+    assert root.get('tests') == '8'
+    assert [suite.get('name') for suite in root] == ['host-1', 'host-2']
+
+
+def test_merge_junit_missing_shard(tmp_path):
+    shards = {
+        'host-1': write_report(tmp_path / '1.xml', 2, 0, 1),
+        'host-2': str(tmp_path / 'missing.xml'),
+    }
+    summary = merge_junit(shards, str(tmp_path / 'merged.xml'))
+    assert summary.tests == 3
+    assert summary.errors == 1
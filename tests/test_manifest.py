@@ -0,0 +1,26 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import pytest
+
+from lib.manifest import rpmvercmp
+
+
+@pytest.mark.parametrize('one, two, expected', [
+    ('1.0', '1.0', 0),
+    ('1.0', '1.1', -1),
+    ('1.10', '1.9', 1),
+    ('1.0a', '1.0', 1),
+    ('1.0', '1.0.1', -1),
+    ('1.001', '1.1', 0),
+    ('2.0', '2_0', 0),
+    ('1.0~rc1', '1.0', -1),
+    ('1.0~rc1', '1.0~rc2', -1),
+    ('1.0^git1', '1.0', 1),
+    ('1.0^git1', '1.0.1', -1),
+    ('a', '1', -1),
+    ('9.4.20240805', '9.4.20240507', 1),
+])
+def test_rpmvercmp(one, two, expected):
+    assert rpmvercmp(one, two) == expected
+    assert rpmvercmp(two, one) == -expected
@@ -0,0 +1,95 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import pytest
+
+from lib import retry
+from lib.metrics import registry
+from lib.retry import RetryPolicy, backoff_delay, is_retryable, retry_call
+
+
+FAST = RetryPolicy(attempts=3, base_delay=0.01, max_delay=0.02, deadline=10)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    delays = []
+    monkeypatch.setattr(retry.time, 'sleep', delays.append)
+    return delays
+
+
+def counter(name, operation):
+    return sum(value for labels, value in registry.samples(name)
+               if labels.get('operation') == operation)
+
+
+def test_backoff_delay_is_capped():
+    policy = RetryPolicy(attempts=10, base_delay=2, max_delay=30, deadline=600)
+    for attempt in range(1, 10):
+        delay = backoff_delay(policy, attempt)
+        assert 0 <= delay <= min(30, 2 * 2 ** (attempt - 1))
+
+
+def test_retry_call_succeeds_after_transient_errors(no_sleep):
+    calls = []
+
+    def flaky(value):
+        calls.append(value)
+        if len(calls) < 3:
+            raise ConnectionError('reset')
+        return value * 2
+
+    assert retry_call(flaky, 21, operation='test flaky', policy=FAST) == 42
+    assert len(calls) == 3
+    assert len(no_sleep) == 2
+    assert counter('alcib_retries_total', 'test flaky') == 2
+
+
+def test_retry_call_gives_up():
+    def broken():
+        raise TimeoutError('timed out')
+
+    with pytest.raises(TimeoutError):
+        retry_call(broken, operation='test broken', policy=FAST)
+    assert counter('alcib_retry_exhausted_total', 'test broken') == 1
+
+
+def test_retry_call_raises_permanent_error_at_once():
+    calls = []
+
+    def invalid():
+        calls.append(1)
+        raise ValueError('bad input')
+
+    with pytest.raises(ValueError):
+        retry_call(invalid, operation='test invalid', policy=FAST)
+    assert calls == [1]
+
+
+def test_retry_call_respects_deadline(monkeypatch):
+    clock = iter(range(0, 1000, 100))
+    monkeypatch.setattr(retry.time, 'monotonic', lambda: next(clock))
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ConnectionError('refused')
+
+    policy = RetryPolicy(attempts=10, base_delay=1, max_delay=1, deadline=150)
+    with pytest.raises(ConnectionError):
+        retry_call(broken, operation='test deadline', policy=policy)
+    assert len(calls) == 2
+
+
+def test_is_retryable_http_errors():
+    requests = pytest.importorskip('requests')
+
+    def http_error(status):
+        response = requests.Response()
+        response.status_code = status
+        return requests.HTTPError(response=response)
+
+    assert is_retryable(http_error(503))
+    assert is_retryable(http_error(429))
+    assert not is_retryable(http_error(404))
+    assert is_retryable(requests.ConnectionError())
@@ -0,0 +1,58 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import io
+import os
+
+import pytest
+
+pytest.importorskip('paramiko')
+
+from lib import transfer
+from lib.builder import LocalSFTP
+
+
+class FakeSSH:
+
+    """
+    SSH client with local SFTP sessions which counts the extra ones.
+    """
+
+    def __init__(self):
+        self.sessions = 0
+
+    def get_sftp(self):
+        return LocalSFTP()
+
+    def open_transfer_session(self):
+        self.sessions += 1
+        return LocalSFTP()
+
+
+def transfers(tmp_path, count):
+    return [(io.BytesIO(b'x' * 1024), str(tmp_path / f'file-{number}'))
+            for number in range(count)]
+
+
+def test_upload_many_small_files(tmp_path):
+    ssh = FakeSSH()
+    assert transfer.upload_many(ssh, transfers(tmp_path, 4)) == [1024] * 4
+    assert ssh.sessions == 0
+    assert os.path.getsize(tmp_path / 'file-3') == 1024
+
+
+def test_upload_many_in_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, 'PARALLEL_MIN_SIZE', 0)
+    ssh = FakeSSH()
+    assert transfer.upload_many(ssh, transfers(tmp_path, 4), workers=2) == [1024] * 4
+    assert 1 <= ssh.sessions <= 2
+
+
+def test_upload_size_mismatch(tmp_path):
+    class TruncatingSFTP(LocalSFTP):
+        def stat(self, path):
+            return os.stat_result((0,) * 6 + (10,) + (0,) * 3)
+
+    with pytest.raises(transfer.TransferError):
+        transfer.upload(TruncatingSFTP(), io.BytesIO(b'x' * 1024),
+                        str(tmp_path / 'file'))
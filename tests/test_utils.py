@@ -0,0 +1,27 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+from lib.utils import parse_vagrant_output
+
+
+def test_parse_vagrant_output():
+    output = '\n'.join([
+        '1700000000,almalinux-test-1,metadata,provider,libvirt',
+        '1700000001,almalinux-test-1,ui,info,Bringing machine up%!(VAGRANT_COMMA) please wait',
+        '1700000002,almalinux-test-2,ui,info,Bringing machine up',
+        '1700000040,almalinux-test-1,ui,info,Machine booted',
+        '1700000095,almalinux-test-2,action,up,end',
+        'plain line',
+    ])
+    messages, timings = parse_vagrant_output(output)
+    assert timings == {'almalinux-test-1': 40, 'almalinux-test-2': 93}
+    assert messages.splitlines() == [
+        'Bringing machine up, please wait',
+        'Bringing machine up',
+        'Machine booted',
+        'plain line',
+    ]
+
+
+def test_parse_vagrant_output_empty():
+    assert parse_vagrant_output('') == ('', {})
@@ -0,0 +1,141 @@
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+import hashlib
+import io
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+pytest.importorskip('requests')
+
+from lib import retry
+from lib.vagrant_cloud import (
+    BoxSource, VagrantCloud, VagrantCloudError, _is_retryable_upload
+)
+from tools.fake_vagrant_cloud import FakeVagrantCloud, Handler
+
+
+BOX = b'vagrant box' * 1000
+CHECKSUM = hashlib.sha256(BOX).hexdigest()
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(retry.time, 'sleep', lambda delay: None)
+
+
+@pytest.fixture
+def fake_cloud():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.state = FakeVagrantCloud()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.state, f'http://127.0.0.1:{server.server_address[1]}/api/v1'
+    server.shutdown()
+    server.server_close()
+
+
+def sources(*providers):
+    return [BoxSource(provider=provider, size=len(BOX), checksum=CHECKSUM,
+                      open=lambda: io.BytesIO(BOX))
+            for provider in providers]
+
+
+def uploaded(state, provider):
+    return state.versions[('almalinux/9', '9.4')]['providers'][provider]['uploaded']
+
+
+def release(url, *providers, **kwargs):
+    client = VagrantCloud('almalinux/9', 'token', url, backoff=0, **kwargs)
+    try:
+        return client.release_boxes('9.4', 'AlmaLinux OS 9.4', sources(*providers))
+    finally:
+        client.close()
+
+
+def test_release_boxes(fake_cloud):
+    state, url = fake_cloud
+    result = release(url, 'libvirt', 'virtualbox')
+    assert result == {'libvirt': len(BOX), 'virtualbox': len(BOX)}
+    assert uploaded(state, 'libvirt') == CHECKSUM
+    assert uploaded(state, 'virtualbox') == CHECKSUM
+    assert all(upload['direct'] for upload in state.uploads.values())
+
+
+def test_release_boxes_without_direct_upload(fake_cloud):
+    state, url = fake_cloud
+    state.direct = False
+    assert release(url, 'libvirt') == {'libvirt': len(BOX)}
+    assert uploaded(state, 'libvirt') == CHECKSUM
+    assert not any(upload['direct'] for upload in state.uploads.values())
+
+
+def test_release_boxes_retries_failed_upload(fake_cloud):
+    state, url = fake_cloud
+    state.fail_uploads = 1
+    assert release(url, 'libvirt') == {'libvirt': len(BOX)}
+    assert uploaded(state, 'libvirt') == CHECKSUM
+    assert len(state.uploads) == 2
+
+
+def test_release_boxes_fails_after_all_attempts(fake_cloud):
+    state, url = fake_cloud
+    state.fail_uploads = 3
+    with pytest.raises(VagrantCloudError):
+        release(url, 'libvirt', attempts=3)
+    assert uploaded(state, 'libvirt') is None
+
+
+def test_upload_errors_classification():
+    assert _is_retryable_upload(VagrantCloudError('throttled', 429))
+    assert _is_retryable_upload(VagrantCloudError('unavailable', 503))
+    assert not _is_retryable_upload(VagrantCloudError('bad request', 400))
+    assert not _is_retryable_upload(ValueError('bug'))
+    assert _is_retryable_upload(ConnectionResetError())
+
+
+def test_release_boxes_skips_hosted_box(fake_cloud):
+    state, url = fake_cloud
+    release(url, 'libvirt')
+    uploads = len(state.uploads)
+    assert release(url, 'libvirt') == {'libvirt': 0}
+    assert len(state.uploads) == uploads
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    from lib import hypervisors
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('OS_MAJOR_VER', '9')
+    monkeypatch.setattr(hypervisors, 'IMAGE', 'Vagrant')
+    monkeypatch.setattr(hypervisors.settings, 'bucket', 'images')
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='images')
+        monkeypatch.setattr(hypervisors, 'get_client', lambda service: client)
+        yield client
+
+
+def put_box(s3, key, checksum=CHECKSUM):
+    metadata = {'sha256': checksum} if checksum else {}
+    s3.put_object(Bucket='images', Key=key, Body=BOX, Metadata=metadata)
+
+
+def test_find_release_boxes(s3):
+    from lib.hypervisors import get_hypervisor
+    put_box(s3, '10-Vagrant-kvm-x86_64-20261001/AlmaLinux-9-Vagrant-libvirt-9.4.x86_64.box')
+    # The latest libvirt build is of another OS major version
+    put_box(s3, '11-Vagrant-kvm-x86_64-20261002/AlmaLinux-8-Vagrant-libvirt-8.10.x86_64.box')
+    put_box(s3, '12-Vagrant-virtualbox-x86_64-20261002/AlmaLinux-9-Vagrant-virtualbox-9.4.x86_64.box',
+            checksum=None)
+    put_box(s3, '13-Vagrant-hyperv-aarch64-20261002/AlmaLinux-9-Vagrant-hyperv-9.4.aarch64.box')
+    boxes = get_hypervisor('kvm').find_release_boxes()
+    assert [(box.provider, box.size, box.checksum) for box in boxes] == [
+        ('libvirt', len(BOX), CHECKSUM)
+    ]
+    assert boxes[0].open().read() == BOX
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Benchmarks lib.manifest diff on generated package manifests.
+
+Usage: python3 tools/bench_manifest_diff.py [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.manifest import diff_manifests, load_manifest  # noqa: E402
+
+
+def generate(size: int, changed: float, seed: int = 0) -> tuple:
+    """
+    Generates old and new manifests where a share of packages changed.
+
+    Returns
+    -------
+    tuple
+        Old and new manifest texts.
+    """
+    rng = random.Random(seed)
+    old, new = [], []
+    for index in range(size):
+        name = f'package{index}-libs'
+        version = f'{rng.randint(0, 9)}.{rng.randint(0, 99)}.{rng.randint(0, 9)}'
+        release = f'{rng.randint(1, 30)}.el8_{rng.randint(0, 9)}'
+        arch = rng.choice(['x86_64', 'noarch'])
+        old.append(f'{name}-{version}-{release}.{arch}')
+        roll = rng.random()
+        if roll < changed / 3:
+            new.append(f'{name}-{version}-{release}.1.{arch}')
+        elif roll < changed * 2 / 3:
+            new.append(f'{name}-1:{version}-{release}.{arch}')
+        elif roll < changed:
+            continue
+        else:
+            new.append(old[-1])
+    new.extend(f'added{index}-1.0-1.el8.x86_64' for index in range(int(size * changed / 3)))
+    return '\n'.join(old), '\n'.join(new)
+
+
+def main(sys_args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Numbers of packages in a manifest')
+    parser.add_argument('--changed', type=float, default=0.1,
+                        help='Share of changed packages')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of measurements, the best one is used')
+    args = parser.parse_args(sys_args)
+
+    print(f'{"packages":>10} {"load ms":>10} {"diff ms":>10} {"us/pkg":>8}  changes')
+    for size in args.sizes:
+        old_text, new_text = generate(size, args.changed)
+        best_load = best_diff = None
+        for _ in range(args.runs):
+            started = time.perf_counter()
+            old, new = load_manifest(old_text), load_manifest(new_text)
+            loaded = time.perf_counter()
+            diff = diff_manifests(old, new)
+            finished = time.perf_counter()
+            best_load = min(best_load or loaded - started, loaded - started)
+            best_diff = min(best_diff or finished - loaded, finished - loaded)
+        per_package = (best_load + best_diff) / size * 1e6
+        print(f'{size:>10} {best_load * 1000:>10.1f} {best_diff * 1000:>10.1f} '
+              f'{per_package:>8.2f}  +{len(diff.added)} -{len(diff.removed)} '
+              f'^{len(diff.upgraded)} v{len(diff.downgraded)}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+Fails when main.py startup regresses beyond the import time budget.
+
+Usage: python3 tools/check_import_time.py [--budget-ms 400]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules which must be loaded only by the stages that need them
+LAZY_MODULES = ['boto3', 'botocore', 'ansible_runner', 'paramiko', 'jinja2',
+                'requests']
+
+PROBE = """
+import sys
+import main
+print('LOADED ' + ' '.join(
+    name for name in {lazy!r} if name in sys.modules
+))
+"""
+
+
+def measure(runs: int):
+    """
+    Imports main.py in fresh interpreters with -X importtime.
+
+    Returns
+    -------
+    tuple
+        Best total import time of main in microseconds, per-module
+        cumulative times of that run and eagerly loaded heavy modules.
+    """
+    env = dict(os.environ)
+    env.setdefault('SSH_KEY_FILE', '')
+    env.setdefault('BUILD_NUMBER', '0')
+    best = None
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             PROBE.format(lazy=LAZY_MODULES)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        modules = {}
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            fields = line[len('import time:'):].split('|')
+            modules[fields[2].strip()] = int(fields[1])
+        loaded = proc.stdout.split('LOADED', 1)[1].split()
+        total = modules['main']
+        if best is None or total < best[0]:
+            best = (total, modules, loaded)
+    return best
+
+
+def main(sys_args):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--budget-ms', type=float, default=400,
+                        help='Maximum import time of main.py in milliseconds')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of measurements, the best one is used')
+    args = parser.parse_args(sys_args)
+
+    total, modules, loaded = measure(args.runs)
+    top = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:15]
+    for name, cumulative in top:
+        print(f'{cumulative / 1000:10.1f} ms  {name}')
+    print(f'main.py import time: {total / 1000:.1f} ms, '
+          f'budget {args.budget_ms:.1f} ms')
+    failed = False
+    if loaded:
+        print(f'Modules must be imported lazily: {", ".join(loaded)}')
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print('Import time budget exceeded')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- mode:python; coding:utf-8; -*-
+# created: 2026-10-19
+
+"""
+In-memory fake of the Vagrant Cloud API for trying box releases locally.
+
+Usage: python3 tools/fake_vagrant_cloud.py [--port 8080] [--fail-uploads N]
+       [--no-direct]
+
+Then run a release with VAGRANT_CLOUD_URL=http://127.0.0.1:8080/api/v1.
+Uploaded boxes are hashed and dropped, their sha256 is shown by
+GET /api/v1/box/USER/NAME/version/VERSION/provider/PROVIDER.
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+API = r'/api/v1/box/(?P<box>[^/]+/[^/]+)'
+ROUTES = [
+    ('POST', API + r'/versions$', 'create_version'),
+    ('GET', API + r'/version/(?P<version>[^/]+)$', 'get_version'),
+    ('POST', API + r'/version/(?P<version>[^/]+)/providers$', 'create_provider'),
+    ('GET', API + r'/version/(?P<version>[^/]+)/provider/(?P<provider>[^/]+)$',
+     'get_provider'),
+    ('PUT', API + r'/version/(?P<version>[^/]+)/provider/(?P<provider>[^/]+)$',
+     'update_provider'),
+    ('GET', API + r'/version/(?P<version>[^/]+)/provider/(?P<provider>[^/]+)/upload$',
+     'upload_url'),
+    ('GET', API + r'/version/(?P<version>[^/]+)/provider/(?P<provider>[^/]+)/upload/direct$',
+     'direct_upload_url'),
+    ('PUT', r'/storage/(?P<token>\d+)$', 'store'),
+    ('PUT', r'/callback/(?P<token>\d+)$', 'callback'),
+    ('HEAD', r'/download/(?P<box>[^/]+/[^/]+)/(?P<version>[^/]+)/(?P<provider>[^/]+)$',
+     'download'),
+]
+
+
+class FakeVagrantCloud:
+
+    """
+    State of the fake API shared by request handlers.
+    """
+
+    def __init__(self, fail_uploads: int = 0, direct: bool = True):
+        self.versions = {}
+        self.uploads = {}
+        self.tokens = itertools.count(1)
+        self.fail_uploads = fail_uploads
+        self.direct = direct
+        self.lock = threading.Lock()
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def state(self) -> FakeVagrantCloud:
+        return self.server.state
+
+    def _reply(self, status: int, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _json(self) -> dict:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _base_url(self) -> str:
+        return f'http://{self.headers["Host"]}'
+
+    def _dispatch(self):
+        for method, pattern, handler in ROUTES:
+            match = re.match(pattern, self.path)
+            if method == self.command and match:
+                with self.state.lock:
+                    return getattr(self, handler)(**match.groupdict())
+        self._reply(404, {'errors': ['Resource not found']})
+
+    do_GET = do_POST = do_PUT = do_HEAD = _dispatch
+
+    def _authorized(self) -> bool:
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            self._reply(401, {'errors': ['Unauthorized']})
+            return False
+        return True
+
+    def _provider_json(self, box, version, provider) -> dict:
+        info = dict(self.state.versions[(box, version)]['providers'][provider])
+        info['download_url'] = (f'{self._base_url()}/download/{box}/'
+                                f'{version}/{provider}')
+        return info
+
+    def create_version(self, box):
+        if not self._authorized():
+            return
+        version = self._json()['version']
+        self.state.versions[(box, version['version'])] = dict(version, providers={})
+        self._reply(200, version)
+
+    def get_version(self, box, version):
+        if (box, version) not in self.state.versions:
+            return self._reply(404, {'errors': ['Resource not found']})
+        self._reply(200, {k: v for k, v in self.state.versions[(box, version)].items()
+                          if k != 'providers'})
+
+    def create_provider(self, box, version):
+        if not self._authorized():
+            return
+        provider = self._json()['provider']
+        providers = self.state.versions[(box, version)]['providers']
+        if provider['name'] in providers:
+            return self._reply(422, {'errors': ['Metadata provider must be unique']})
+        providers[provider['name']] = dict(provider, hosted=True, uploaded=None)
+        self._reply(200, self._provider_json(box, version, provider['name']))
+
+    def get_provider(self, box, version, provider):
+        providers = self.state.versions.get((box, version), {}).get('providers', {})
+        if provider not in providers:
+            return self._reply(404, {'errors': ['Resource not found']})
+        self._reply(200, self._provider_json(box, version, provider))
+
+    def update_provider(self, box, version, provider):
+        if not self._authorized():
+            return
+        info = self.state.versions[(box, version)]['providers'][provider]
+        info.update(self._json()['provider'], uploaded=None)
+        self._reply(200, self._provider_json(box, version, provider))
+
+    def _new_upload(self, box, version, provider) -> str:
+        token = str(next(self.state.tokens))
+        self.state.uploads[token] = {'target': (box, version, provider)}
+        return token
+
+    def upload_url(self, box, version, provider):
+        if not self._authorized():
+            return
+        token = self._new_upload(box, version, provider)
+        self.state.uploads[token]['direct'] = False
+        self._reply(200, {'upload_path': f'{self._base_url()}/storage/{token}'})
+
+    def direct_upload_url(self, box, version, provider):
+        if not self.state.direct:
+            return self._reply(404, {'errors': ['Resource not found']})
+        if not self._authorized():
+            return
+        token = self._new_upload(box, version, provider)
+        self.state.uploads[token]['direct'] = True
+        self._reply(200, {'upload_path': f'{self._base_url()}/storage/{token}',
+                          'callback': f'{self._base_url()}/callback/{token}'})
+
+    def store(self, token):
+        upload = self.state.uploads.get(token)
+        if upload is None:
+            return self._reply(404, {'errors': ['Unknown upload']})
+        if upload['direct'] and 'Authorization' in self.headers:
+            return self._reply(400, {'errors': ['Only one auth mechanism allowed']})
+        if 'Content-Length' not in self.headers:
+            return self._reply(411, {'errors': ['Content-Length required']})
+        length = int(self.headers['Content-Length'])
+        if self.state.fail_uploads > 0:
+            self.state.fail_uploads -= 1
+            self.rfile.read(length // 2)
+            self.close_connection = True
+            return self._reply(500, {'errors': ['Injected upload failure']})
+        checksum = hashlib.sha256()
+        remaining = length
+        while remaining:
+            block = self.rfile.read(min(remaining, 1024 * 1024))
+            if not block:
+                break
+            checksum.update(block)
+            remaining -= len(block)
+        upload['sha256'] = checksum.hexdigest()
+        if not upload['direct']:
+            self._finish(upload)
+        self._reply(200)
+
+    def callback(self, token):
+        if not self._authorized():
+            return
+        upload = self.state.uploads.get(token)
+        if upload is None or 'sha256' not in upload:
+            return self._reply(422, {'errors': ['Upload is not finished']})
+        self._finish(upload)
+        self._reply(200)
+
+    def _finish(self, upload: dict):
+        box, version, provider = upload['target']
+        info = self.state.versions[(box, version)]['providers'][provider]
+        info['uploaded'] = upload['sha256']
+
+    def download(self, box, version, provider):
+        info = self.state.versions.get((box, version), {}).get('providers', {}).get(provider)
+        if not info or not info.get('uploaded'):
+            return self._reply(404)
+        self._reply(200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Vagrant Cloud API')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--fail-uploads', type=int, default=0,
+                        help='Number of box uploads to fail')
+    parser.add_argument('--no-direct', action='store_true',
+                        help='Disable direct to storage uploads')
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    server.state = FakeVagrantCloud(args.fail_uploads, not args.no_direct)
+    print(f'Fake Vagrant Cloud API on http://127.0.0.1:{args.port}/api/v1')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()